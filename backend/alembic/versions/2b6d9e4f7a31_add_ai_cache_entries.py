@@ -0,0 +1,42 @@
+"""add_ai_cache_entries
+
+Revision ID: 2b6d9e4f7a31
+Revises: e5a8f1c3b902
+Create Date: 2026-10-17 18:41:27.550386
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2b6d9e4f7a31'
+down_revision: Union[str, None] = 'e5a8f1c3b902'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('ai_cache_entries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('cache_key', sa.String(length=64), nullable=False),
+    sa.Column('operation', sa.String(length=50), nullable=False),
+    sa.Column('result', sa.JSON(), nullable=False),
+    sa.Column('hit_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('last_used_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=True, comment='过期时间，为空表示不过期'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ai_cache_entries_cache_key'), 'ai_cache_entries', ['cache_key'], unique=True)
+    op.create_index(op.f('ix_ai_cache_entries_id'), 'ai_cache_entries', ['id'], unique=False)
+    op.create_index(op.f('ix_ai_cache_entries_last_used_at'), 'ai_cache_entries', ['last_used_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_ai_cache_entries_last_used_at'), table_name='ai_cache_entries')
+    op.drop_index(op.f('ix_ai_cache_entries_id'), table_name='ai_cache_entries')
+    op.drop_index(op.f('ix_ai_cache_entries_cache_key'), table_name='ai_cache_entries')
+    op.drop_table('ai_cache_entries')
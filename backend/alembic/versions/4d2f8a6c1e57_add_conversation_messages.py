@@ -0,0 +1,42 @@
+"""add_conversation_messages
+
+Revision ID: 4d2f8a6c1e57
+Revises: b7c41e2d9a10
+Create Date: 2026-10-17 14:36:52.420918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4d2f8a6c1e57'
+down_revision: Union[str, None] = 'b7c41e2d9a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('conversation_messages',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('session_id', sa.Integer(), nullable=False, comment='所属对话会话ID'),
+    sa.Column('seq', sa.Integer(), nullable=False, comment='会话内消息序号（从 1 开始递增）'),
+    sa.Column('step', sa.String(length=50), nullable=False),
+    sa.Column('role', sa.String(length=20), nullable=True),
+    sa.Column('archived', sa.Boolean(), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['session_id'], ['conversation_sessions.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('session_id', 'seq', name='uq_conversation_messages_session_seq')
+    )
+    op.create_index(op.f('ix_conversation_messages_id'), 'conversation_messages', ['id'], unique=False)
+    op.create_index('ix_conversation_messages_step', 'conversation_messages', ['session_id', 'step', 'archived', 'seq'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_conversation_messages_step', table_name='conversation_messages')
+    op.drop_index(op.f('ix_conversation_messages_id'), table_name='conversation_messages')
+    op.drop_table('conversation_messages')
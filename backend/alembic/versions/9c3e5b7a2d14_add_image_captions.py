@@ -0,0 +1,40 @@
+"""add_image_captions
+
+Revision ID: 9c3e5b7a2d14
+Revises: 4d2f8a6c1e57
+Create Date: 2026-10-17 16:05:11.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3e5b7a2d14'
+down_revision: Union[str, None] = '4d2f8a6c1e57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('image_captions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False, comment='图片内容 SHA-256'),
+    sa.Column('caption', sa.Text(), nullable=False, comment='简短描述（1-2 句）'),
+    sa.Column('palette', sa.JSON(), nullable=True, comment='主要颜色列表'),
+    sa.Column('style_tags', sa.JSON(), nullable=True, comment='风格标签列表'),
+    sa.Column('nail_count', sa.Integer(), nullable=True, comment='图中可见指甲数量'),
+    sa.Column('provider', sa.String(length=50), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_image_captions_content_hash'), 'image_captions', ['content_hash'], unique=True)
+    op.create_index(op.f('ix_image_captions_id'), 'image_captions', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_image_captions_id'), table_name='image_captions')
+    op.drop_index(op.f('ix_image_captions_content_hash'), table_name='image_captions')
+    op.drop_table('image_captions')
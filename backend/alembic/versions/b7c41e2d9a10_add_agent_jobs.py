@@ -0,0 +1,54 @@
+"""add_agent_jobs
+
+Revision ID: b7c41e2d9a10
+Revises: 3ae591818deb
+Create Date: 2026-10-17 10:12:04.118532
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7c41e2d9a10'
+down_revision: Union[str, None] = '3ae591818deb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('agent_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('session_id', sa.Integer(), nullable=True, comment='发起任务的对话会话ID'),
+    sa.Column('kind', sa.String(length=50), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=True),
+    sa.Column('result', sa.JSON(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('consumed_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['session_id'], ['conversation_sessions.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_agent_jobs_created_at'), 'agent_jobs', ['created_at'], unique=False)
+    op.create_index(op.f('ix_agent_jobs_id'), 'agent_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_agent_jobs_session_id'), 'agent_jobs', ['session_id'], unique=False)
+    op.create_index(op.f('ix_agent_jobs_status'), 'agent_jobs', ['status'], unique=False)
+    op.create_index(op.f('ix_agent_jobs_user_id'), 'agent_jobs', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_agent_jobs_user_id'), table_name='agent_jobs')
+    op.drop_index(op.f('ix_agent_jobs_status'), table_name='agent_jobs')
+    op.drop_index(op.f('ix_agent_jobs_session_id'), table_name='agent_jobs')
+    op.drop_index(op.f('ix_agent_jobs_id'), table_name='agent_jobs')
+    op.drop_index(op.f('ix_agent_jobs_created_at'), table_name='agent_jobs')
+    op.drop_table('agent_jobs')
@@ -0,0 +1,31 @@
+"""add_design_estimation_status
+
+Revision ID: e5a8f1c3b902
+Revises: 9c3e5b7a2d14
+Create Date: 2026-10-17 17:20:43.902117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a8f1c3b902'
+down_revision: Union[str, None] = '9c3e5b7a2d14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('design_plans', sa.Column('estimation_status', sa.String(length=20), nullable=True, comment='执行估算状态'))
+    op.add_column('design_plans', sa.Column('estimation_error', sa.Text(), nullable=True, comment='执行估算失败原因'))
+    op.add_column('design_plans', sa.Column('estimated_at', sa.DateTime(), nullable=True, comment='执行估算完成时间'))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('design_plans') as batch_op:
+        batch_op.drop_column('estimated_at')
+        batch_op.drop_column('estimation_error')
+        batch_op.drop_column('estimation_status')
@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.v1 import auth, users, health, system, services, uploads, customers, inspirations, designs, abilities, conversations
+from app.api.v1 import auth, users, health, system, services, uploads, customers, inspirations, designs, abilities, conversations, jobs
 
 api_router = APIRouter()
 
@@ -15,3 +15,4 @@ api_router.include_router(inspirations.router, prefix="/inspirations", tags=["In
 api_router.include_router(designs.router, prefix="/designs", tags=["Design Plans"])
 api_router.include_router(abilities.router, prefix="/abilities", tags=["Abilities"])
 api_router.include_router(conversations.router, prefix="/conversations", tags=["AI 对话助理"])
+api_router.include_router(jobs.router, prefix="/jobs", tags=["Background Jobs"])
@@ -2,21 +2,26 @@
 AI 对话助理 API
 """
 import logging
-from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, UploadFile, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import Any, AsyncIterator, Literal, Optional, Tuple
 
-from app.db.database import get_db
+from app.core.config import settings
+from app.core.sse import with_keepalive
+from app.db.database import get_db, open_session
 from app.core.dependencies import get_current_active_user
 from app.models.user import User
 from app.schemas.conversation import (
     ConversationMessageCreate,
+    ConversationMessagePage,
     ConversationSessionResponse,
     SendMessageResponse,
     SessionListResponse,
     StartSessionResponse,
 )
 from app.services.agent_service import AgentService
+from app.services.message_store import get_message_store
 from app.api.v1.uploads import save_upload_file, validate_file
 
 logger = logging.getLogger(__name__)
@@ -25,6 +30,7 @@ router = APIRouter()
 
 # 单例 AgentService（包含 OpenAI 客户端，复用）
 _agent_service = AgentService()
+_message_store = get_message_store()
 
 
 # ── 会话管理 ──────────────────────────────────────────────────────────────
@@ -98,7 +104,7 @@ async def abandon_session(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    ok = AgentService.abandon_session(db, session_id, current_user.id)
+    ok = _agent_service.abandon_session(db, session_id, current_user.id)
     if not ok:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -106,17 +112,59 @@ async def abandon_session(
         )
 
 
+@router.get(
+    "/{session_id}/messages",
+    response_model=ConversationMessagePage,
+    summary="分页获取会话消息",
+    description=(
+        "按游标（JSONL 存储为字节偏移，SQL 存储为消息序号）分页返回会话的 user / assistant 消息（含 ui_metadata，不含归档标记与工具消息）。"
+        "order=desc 时从最新消息向前翻页，order=asc 时从最早消息向后翻页；"
+        "将响应中的 next_cursor 作为下一次请求的 cursor"
+    )
+)
+async def list_messages(
+    session_id: int,
+    cursor: Optional[int] = Query(None, ge=0, description="上一页返回的 next_cursor"),
+    limit: int = Query(50, ge=1, le=200),
+    order: Literal["asc", "desc"] = Query("desc"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    session = AgentService.get_session(db, session_id, current_user.id)
+    if not session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"会话 {session_id} 不存在"
+        )
+    try:
+        messages, next_cursor, has_more = _message_store.read_page(
+            session_id, cursor=cursor, limit=limit, order=order, db=db
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    return ConversationMessagePage(
+        messages=messages, next_cursor=next_cursor, has_more=has_more
+    )
+
+
 # ── 消息交互 ──────────────────────────────────────────────────────────────
 
 @router.post(
     "/{session_id}/messages",
     response_model=SendMessageResponse,
     summary="发送消息",
-    description="向 AI 助理发送消息，返回助理回复（含 UI 元数据和步骤信息）"
+    description=(
+        "向 AI 助理发送消息，返回助理回复（含 UI 元数据和步骤信息）。"
+        "同一会话的消息串行处理；携带 Idempotency-Key 的重复提交直接返回首次的回复"
+    )
 )
 async def send_message(
     session_id: int,
     body: ConversationMessageCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=128),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -127,6 +175,7 @@ async def send_message(
             user_id=current_user.id,
             content=body.content,
             image_paths=body.image_paths or [],
+            idempotency_key=idempotency_key or body.idempotency_key,
         )
     except ValueError as e:
         raise HTTPException(
@@ -142,6 +191,73 @@ async def send_message(
     return SendMessageResponse(message=reply, session_id=session_id)
 
 
+@router.post(
+    "/{session_id}/messages/stream",
+    summary="发送消息（流式）",
+    description=(
+        "向 AI 助理发送消息，以 Server-Sent Events 推送推理进度：token（最终回复文本的增量）、"
+        "tool_start / tool_end（工具调用开始/完成）、message（最终回复，结构同 SendMessageResponse）、"
+        "error（处理失败）"
+    ),
+)
+async def send_message_stream(
+    session_id: int,
+    body: ConversationMessageCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=128),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    user_id = current_user.id
+
+    # 流开始后无法再返回错误状态码，先同步校验会话
+    session = AgentService.get_session(db, session_id, user_id)
+    if not session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"会话 {session_id} 不存在"
+        )
+    if session.status != "active":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Session {session_id} has ended (status: {session.status})"
+        )
+
+    async def agent_events() -> AsyncIterator[Tuple[str, Any]]:
+        # 请求依赖的数据库会话在流开始前即被关闭，回合使用独立会话
+        turn_db = open_session()
+        try:
+            async for event, data in _agent_service.process_message_stream(
+                db=turn_db,
+                session_id=session_id,
+                user_id=user_id,
+                content=body.content,
+                image_paths=body.image_paths or [],
+                idempotency_key=idempotency_key or body.idempotency_key,
+            ):
+                if event == "message":
+                    data = SendMessageResponse(
+                        message=data, session_id=session_id
+                    ).model_dump(mode="json")
+                yield event, data
+        except ValueError as e:
+            yield "error", {"detail": str(e)}
+        except Exception as e:
+            logger.error(f"Agent 流式处理消息失败: {e}", exc_info=True)
+            yield "error", {"detail": f"AI 助理处理失败: {str(e)}"}
+        finally:
+            turn_db.close()
+
+    return StreamingResponse(
+        with_keepalive(agent_events(), settings.SSE_KEEPALIVE_SECONDS),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # 关闭 nginx 响应缓冲，事件即时下发
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
 @router.post(
     "/{session_id}/images",
     response_model=SendMessageResponse,
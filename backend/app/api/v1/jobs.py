@@ -0,0 +1,138 @@
+"""
+后台任务 API（Agent 耗时工具的执行状态）
+"""
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import Any, AsyncIterator, Optional, Tuple
+
+from app.core.config import settings
+from app.core.sse import with_keepalive
+from app.db.database import get_db, open_session
+from app.core.dependencies import get_current_active_user
+from app.models.user import User
+from app.schemas.job import AgentJobListResponse, AgentJobResponse
+from app.services.job_service import JobService
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get(
+    "",
+    response_model=AgentJobListResponse,
+    summary="后台任务列表",
+    description="列出当前用户的后台任务，可按对话会话过滤"
+)
+async def list_jobs(
+    session_id: Optional[int] = Query(None, description="对话会话ID"),
+    skip: int = Query(0, ge=0, description="跳过记录数"),
+    limit: int = Query(20, ge=1, le=100, description="返回记录数"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    jobs, total = JobService.list_jobs(
+        db, current_user.id, session_id=session_id, skip=skip, limit=limit
+    )
+    return AgentJobListResponse(
+        jobs=[AgentJobResponse.model_validate(j) for j in jobs],
+        total=total,
+    )
+
+
+@router.get(
+    "/{job_id}",
+    response_model=AgentJobResponse,
+    summary="查询后台任务",
+    description="轮询后台任务状态：pending / running / succeeded / failed"
+)
+async def get_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    job = JobService.get_job(db, job_id, current_user.id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"任务 {job_id} 不存在"
+        )
+    return AgentJobResponse.model_validate(job)
+
+
+@router.post(
+    "/{job_id}/retry",
+    response_model=AgentJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="重试失败的后台任务",
+    description="重新执行失败的任务；支持断点的任务（如批量重新分析）从最后提交的进度继续"
+)
+async def retry_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    try:
+        job = JobService.retry(db, job_id, current_user.id)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"任务 {job_id} 不存在"
+        )
+    return AgentJobResponse.model_validate(job)
+
+
+@router.get(
+    "/{job_id}/events",
+    summary="订阅后台任务状态（流式）",
+    description=(
+        "以 Server-Sent Events 推送任务状态：每次状态变化推送一条 status 事件"
+        "（结构同查询接口），任务结束后关闭连接"
+    ),
+)
+async def stream_job_events(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    user_id = current_user.id
+    if not JobService.get_job(db, job_id, user_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"任务 {job_id} 不存在"
+        )
+
+    async def job_events() -> AsyncIterator[Tuple[str, Any]]:
+        # 请求依赖的数据库会话在流开始前即被关闭，轮询使用独立会话
+        poll_db = open_session()
+        try:
+            last_status = None
+            while True:
+                poll_db.expire_all()
+                job = JobService.get_job(poll_db, job_id, user_id)
+                if job is None:
+                    return
+                if job.status != last_status:
+                    last_status = job.status
+                    yield "status", AgentJobResponse.model_validate(job).model_dump(mode="json")
+                if job.is_finished:
+                    return
+                await JobService.wait_for_change(job_id, settings.AGENT_JOB_POLL_SECONDS)
+        finally:
+            poll_db.close()
+
+    return StreamingResponse(
+        with_keepalive(job_events(), settings.SSE_KEEPALIVE_SECONDS),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
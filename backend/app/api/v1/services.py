@@ -8,8 +8,10 @@ from app.schemas.service import (
     ServiceRecordUpdate,
     ServiceRecordComplete,
     ServiceRecordResponse,
+    ServiceReanalysisRequest,
     ComparisonResultResponse
 )
+from app.schemas.job import AgentJobResponse
 from app.services.service_record_service import ServiceRecordService
 from app.services.analysis_service import AnalysisService
 from app.core.dependencies import get_current_active_user
@@ -52,6 +54,35 @@ async def create_service_record(
         )
 
 
+@router.post("/reanalyze", response_model=AgentJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def reanalyze_service_records(
+    request: ServiceReanalysisRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    批量重新分析服务记录（后台任务）
+
+    按筛选条件选出当前用户已完成的服务记录，分批并发调用 AI 分析并写入能力记录。
+    返回任务句柄，通过 GET /jobs/{job_id}（或 /jobs/{job_id}/events）查看进度：
+    result.progress 包含 total / processed / succeeded / failed / skipped；
+    服务重启后任务从最后提交的批次之后继续；任务失败（如超时）后可通过
+    POST /jobs/{job_id}/retry 从断点继续。
+    """
+    if request.date_from and request.date_to and request.date_from > request.date_to:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="date_from 不能晚于 date_to"
+        )
+
+    job = AnalysisService.start_bulk_reanalysis(
+        db=db,
+        user_id=current_user.id,
+        filters=request.model_dump(mode="json", exclude_none=True)
+    )
+    return AgentJobResponse.model_validate(job)
+
+
 @router.get("/{service_id}", response_model=ServiceRecordResponse)
 async def get_service_record(
     service_id: int,
@@ -242,6 +273,7 @@ async def get_comparison_result(
 @router.post("/{service_id}/analyze", response_model=ComparisonResultResponse)
 async def trigger_analysis(
     service_id: int,
+    force: bool = Query(False, description="跳过分析缓存，强制重新调用 AI"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -251,6 +283,8 @@ async def trigger_analysis(
     用于：
     - 服务记录已完成但未分析的情况
     - 更新了复盘或反馈内容后重新分析
+
+    照片与复盘 / 反馈内容均未变化时直接复用上次的分析结果，force=true 时强制重新分析
     """
     # 验证服务记录存在且属于当前用户
     service = ServiceRecordService.get_service_by_id(
@@ -268,7 +302,8 @@ async def trigger_analysis(
     try:
         comparison = await AnalysisService.analyze_service(
             db=db,
-            service_record_id=service_id
+            service_record_id=service_id,
+            force=force
         )
         return comparison
     except ValueError as e:
@@ -10,6 +10,7 @@ import platform
 import sys
 
 from app.core.config import settings
+from app.core.metrics import metrics
 
 router = APIRouter()
 
@@ -79,3 +80,24 @@ async def get_version() -> Dict[str, str]:
         "name": settings.APP_NAME,
         "version": settings.APP_VERSION
     }
+
+
+@router.get(
+    "/metrics",
+    summary="运行指标",
+    description="获取当前进程的运行指标（计数器与观测值汇总）",
+    response_description="指标快照",
+    tags=["System"]
+)
+async def get_metrics() -> Dict[str, Any]:
+    """
+    获取当前进程的运行指标
+
+    Returns:
+        - counters: 计数器（名称{标签} -> 累计值）
+        - observations: 观测值汇总（count / sum / min / max / last / avg）
+    """
+    return {
+        **metrics.snapshot(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
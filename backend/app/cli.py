@@ -0,0 +1,162 @@
+"""
+运维命令行工具
+
+用法（在 backend 目录下执行）：
+    python -m app.cli rebuild-conversation-index            # 重建所有会话的 JSONL 侧车索引
+    python -m app.cli rebuild-conversation-index --session-id 12
+    python -m app.cli compact-conversations                 # 离线压实：将归档状态写回 JSONL 文件
+    python -m app.cli pack-conversations                    # 将已结束的会话打包进冷存储（gzip 分段）
+    python -m app.cli import-conversations                  # 将 JSONL 会话导入 conversation_messages 表
+    python -m app.cli bench-agent --repeat 3                # 回放已录制会话，统计 Agent 每轮自身开销
+"""
+import argparse
+import asyncio
+import json
+import sys
+from dataclasses import asdict
+from typing import List, Optional
+
+from app.services.conversation_file import ConversationFileManager
+
+
+def _rebuild_conversation_index(args: argparse.Namespace) -> int:
+    if args.session_id is not None:
+        index = ConversationFileManager.rebuild_index(args.session_id)
+        if index is None:
+            print(f"会话 {args.session_id} 没有对话文件")
+            return 1
+        print(f"会话 {args.session_id} 索引已重建（{index['size']} 字节）")
+        return 0
+    count = ConversationFileManager.rebuild_all_indexes()
+    print(f"已重建 {count} 个会话的索引")
+    return 0
+
+
+def _compact_conversations(args: argparse.Namespace) -> int:
+    if args.session_id is not None:
+        if not ConversationFileManager.compact(args.session_id):
+            print(f"会话 {args.session_id} 没有对话文件")
+            return 1
+        print(f"会话 {args.session_id} 已压实")
+        return 0
+    count = ConversationFileManager.compact_all()
+    print(f"已压实 {count} 个会话文件")
+    return 0
+
+
+def _pack_conversations(args: argparse.Namespace) -> int:
+    from app.db.database import SessionLocal
+    from app.services.conversation_archive import ConversationArchiveService
+
+    db = SessionLocal()
+    try:
+        count = ConversationArchiveService.pack_finished(
+            db, min_age_hours=args.min_age_hours, session_ids=args.session_id
+        )
+    finally:
+        db.close()
+    print(f"已打包 {count} 个会话")
+    return 0
+
+
+def _import_conversations(args: argparse.Namespace) -> int:
+    from app.db.database import SessionLocal
+    from app.services.message_store import import_jsonl_sessions
+
+    db = SessionLocal()
+    try:
+        imported, skipped = import_jsonl_sessions(db, args.session_id, replace=args.replace)
+    finally:
+        db.close()
+    print(f"已导入 {imported} 个会话，跳过 {skipped} 个")
+    return 0
+
+
+def _bench_agent(args: argparse.Namespace) -> int:
+    # 延迟导入：回放依赖 AgentService 全套模块，其他子命令无需加载
+    from app.services.agent_replay import AgentReplayBenchmark, summarize
+
+    sessions = AgentReplayBenchmark.load_sessions(args.session_id)
+    if not sessions:
+        print("没有可回放的会话")
+        return 1
+    timings = asyncio.run(AgentReplayBenchmark().run(sessions, repeat=args.repeat))
+    summary = summarize(timings)
+    if args.json:
+        print(json.dumps(
+            {"turns": [asdict(t) for t in timings], "summary": summary},
+            ensure_ascii=False, indent=2,
+        ))
+        return 0
+    print(f"回放 {len(sessions)} 个会话，共 {len(timings)} 轮（重复 {args.repeat} 次）")
+    print(f"{'指标':<18}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+    for name, stats in summary.items():
+        print(
+            f"{name:<18}{stats['mean']:>10.2f}{stats['p50']:>10.2f}"
+            f"{stats['p95']:>10.2f}{stats['max']:>10.2f}"
+        )
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Nail 后端运维命令")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = subparsers.add_parser(
+        "rebuild-conversation-index",
+        help="扫描 CONVERSATIONS_DIR 下的会话 JSONL 文件，重建步骤字节偏移索引",
+    )
+    rebuild.add_argument("--session-id", type=int, default=None, help="只重建指定会话")
+    rebuild.set_defaults(func=_rebuild_conversation_index)
+
+    compact = subparsers.add_parser(
+        "compact-conversations",
+        help="离线压实会话 JSONL 文件：根据归档标记写回 archived 字段（原子替换）",
+    )
+    compact.add_argument("--session-id", type=int, default=None, help="只压实指定会话")
+    compact.set_defaults(func=_compact_conversations)
+
+    pack = subparsers.add_parser(
+        "pack-conversations",
+        help="将已结束（completed / abandoned）的会话 JSONL 打包进按月分段的 gzip 冷存储并删除会话目录",
+    )
+    pack.add_argument(
+        "--session-id", type=int, action="append", default=None, help="只打包指定会话（可重复）"
+    )
+    pack.add_argument(
+        "--min-age-hours", type=float, default=None,
+        help="会话结束后至少经过的小时数（默认 CONVERSATION_PACK_AFTER_HOURS）",
+    )
+    pack.set_defaults(func=_pack_conversations)
+
+    importer = subparsers.add_parser(
+        "import-conversations",
+        help="将 JSONL 会话文件（含冷存储）批量导入 conversation_messages 表（切换 CONVERSATION_STORE=sql 前执行）",
+    )
+    importer.add_argument(
+        "--session-id", type=int, action="append", default=None, help="只导入指定会话（可重复）"
+    )
+    importer.add_argument("--replace", action="store_true", help="覆盖数据库中已有的会话消息")
+    importer.set_defaults(func=_import_conversations)
+
+    bench = subparsers.add_parser(
+        "bench-agent",
+        help="用录制的 LLM / 工具结果回放会话 JSONL，统计每轮扣除模型时间后的开销（毫秒）",
+    )
+    bench.add_argument(
+        "--session-id", type=int, action="append", default=None, help="只回放指定会话（可重复）"
+    )
+    bench.add_argument("--repeat", type=int, default=1, help="回放轮数")
+    bench.add_argument("--json", action="store_true", help="以 JSON 输出每轮明细与汇总")
+    bench.set_defaults(func=_bench_agent)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
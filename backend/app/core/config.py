@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from pydantic import field_validator
-from typing import List, Union
+from typing import Dict, List, Optional, Union
 import os
 
 _WEAK_SECRET_KEYS = {
@@ -13,6 +13,16 @@ _WEAK_SECRET_KEYS = {
 }
 
 
+def parse_mapping(value: str) -> Dict[str, str]:
+    """解析逗号分隔的 "键:值" 配置，如 "collect:fast,analysis:gpt-4o"（以最后一个冒号分隔）"""
+    result = {}
+    for item in value.split(","):
+        key, sep, val = item.strip().rpartition(":")
+        if sep and key.strip() and val.strip():
+            result[key.strip()] = val.strip()
+    return result
+
+
 class Settings(BaseSettings):
     # 应用配置
     APP_NAME: str = "Nail"
@@ -66,12 +76,148 @@ class Settings(BaseSettings):
 
     # 对话文件存储目录（JSONL 格式）
     CONVERSATIONS_DIR: str = "data/conversations"
+    # 会话消息存储：jsonl（本地文件，单实例）| sql（conversation_messages 表，多实例无需共享磁盘）
+    CONVERSATION_STORE: str = "jsonl"
+    # 冷存储：结束（completed / abandoned）超过指定小时数的会话打包为按月分段的 gzip 文件
+    CONVERSATION_PACK_AFTER_HOURS: float = 24.0
+    # 后台打包间隔（秒），0 表示禁用（仍可执行 python -m app.cli pack-conversations）
+    CONVERSATION_PACK_INTERVAL_SECONDS: float = 3600.0
+
+    # 会话内上传图片的描述：每张图片（按内容哈希）只调用一次视觉模型，描述文本代替原图进入提示词
+    IMAGE_CAPTIONS_ENABLED: bool = True
+    IMAGE_CAPTION_TIMEOUT_SECONDS: float = 20.0
+
+    # 视觉模型输入图片预处理：旋正、缩小到长边上限、去除 EXIF 后重新编码（JPEG | WEBP），
+    # 派生图按原图内容哈希缓存在 VISION_CACHE_DIR（留空则只在进程内缓存）
+    VISION_IMAGE_PREPROCESS: bool = True
+    VISION_IMAGE_MAX_SIDE: int = 1536
+    VISION_IMAGE_FORMAT: str = "JPEG"
+    VISION_IMAGE_QUALITY: int = 85
+    VISION_CACHE_DIR: str = "data/vision_cache"
+    # 派生图磁盘缓存上限（MB），超出后按最近使用时间淘汰；0 为不限制
+    VISION_CACHE_MAX_MB: int = 512
+
+    # 流式对话（SSE）心跳间隔（秒），防止反向代理在长时间工具调用期间断开连接
+    SSE_KEEPALIVE_SECONDS: float = 15.0
+
+    # Agent 会话状态缓存（当前步骤消息 + 系统提示词），条目数为 0 时禁用
+    AGENT_SESSION_CACHE_SIZE: int = 256
+    AGENT_SESSION_CACHE_TTL_SECONDS: float = 1800.0
+
+    # 消息幂等：相同 Idempotency-Key 的重复提交在有效期内直接返回首次的回复
+    AGENT_IDEMPOTENCY_CACHE_SIZE: int = 1024
+    AGENT_IDEMPOTENCY_TTL_SECONDS: float = 600.0
+
+    # Agent 后台任务：generate_design / refine_design / run_analysis 入队后台执行，工具立即返回任务句柄
+    # （结果在下一轮对话中交付，设计预览随之延后一轮出现，需前端轮询 / 订阅任务状态后再开启）
+    AGENT_BACKGROUND_TOOLS: bool = False
+    AGENT_JOB_TIMEOUT_SECONDS: float = 300.0
+    AGENT_JOB_MAX_ATTEMPTS: int = 3
+    # 单进程部署时，本进程之外的 running 任务必然已中断，启动即恢复；多 worker 部署需关闭，
+    # 改为等待任务超时仍未更新后再恢复。巡检间隔（秒）为 0 时只在启动时恢复
+    AGENT_JOB_SINGLE_WORKER: bool = True
+    AGENT_JOB_SWEEP_SECONDS: float = 60.0
+    # 任务状态 SSE 推送的轮询间隔（秒），任务由其他 worker 执行时依靠轮询发现状态变化
+    AGENT_JOB_POLL_SECONDS: float = 2.0
+
+    # Agent prompt token 预算 - 逗号分隔的 "模型:上限"，未列出的模型使用默认上限
+    AGENT_PROMPT_TOKEN_BUDGETS: str = "gpt-4o:24000,gemini-2.0-flash:24000"
+    AGENT_PROMPT_TOKEN_BUDGET_DEFAULT: int = 16000
+    # tool 结果中单个 JSON 字符串字段 / 列表的最大长度，超出部分在发送给 LLM 前截断
+    AGENT_TOOL_RESULT_MAX_FIELD_CHARS: int = 2000
+    AGENT_TOOL_RESULT_MAX_LIST_ITEMS: int = 20
+
+    def prompt_token_budget(self, model: str) -> int:
+        limit = parse_mapping(self.AGENT_PROMPT_TOKEN_BUDGETS).get(model, "")
+        return int(limit) if limit.isdigit() else self.AGENT_PROMPT_TOKEN_BUDGET_DEFAULT
+
+    # Agent 按步骤选择模型 - 逗号分隔的 "步骤:模型"，模型可写具体名称，或别名
+    # default（provider 主模型：gpt-4o / gemini-2.0-flash）、fast（低延迟模型：gpt-4o-mini / gemini-2.0-flash-lite）
+    AGENT_STEP_MODELS: str = "collect:fast,confirm:fast,analysis:default,review:default"
+    # 单次 LLM 调用的延迟预算（秒）- "步骤:秒"，超时后改用 AGENT_FALLBACK_MODEL 重试一次；
+    # 降级模型与步骤模型相同（如默认配置下的 collect / confirm）时不设预算，只受 AGENT_LLM_TIMEOUT_SECONDS 限制
+    AGENT_STEP_TIMEOUTS: str = "analysis:45,review:45"
+    AGENT_FALLBACK_MODEL: str = "fast"
+    # 未配置步骤的延迟预算，以及降级重试的超时（秒）
+    AGENT_LLM_TIMEOUT_SECONDS: float = 60.0
+
+    def agent_step_model(self, step: str) -> str:
+        return parse_mapping(self.AGENT_STEP_MODELS).get(step, "default")
+
+    def agent_step_timeout(self, step: str) -> float:
+        try:
+            return float(parse_mapping(self.AGENT_STEP_TIMEOUTS)[step])
+        except (KeyError, ValueError):
+            return self.AGENT_LLM_TIMEOUT_SECONDS
+
+    # 设计执行估算：inline（生成设计图后同步估算再返回）| background（设计图生成后立即保存并返回，
+    # 估算作为后台任务执行，完成后回填 DesignPlan，客户端轮询 estimation_status）
+    DESIGN_ESTIMATION_MODE: str = "inline"
+
+    # AI 结果缓存：相同输入的设计生成 / 优化、相同设计图的执行估算直接复用结果（持久化在 ai_cache_entries 表）
+    AI_CACHE_ENABLED: bool = False
+    AI_CACHE_TTL_SECONDS: float = 604800.0  # 7 天，0 表示不过期
+    AI_CACHE_MAX_ENTRIES: int = 5000  # 超出时按最久未使用淘汰，0 表示不限制
+    # AI Provider 容错（默认关闭）：启用后按 AI_PROVIDER → AI_FAILOVER_PROVIDERS 的顺序故障转移
+    AI_RESILIENCE_ENABLED: bool = False
+    AI_FAILOVER_PROVIDERS: str = ""  # 逗号分隔，如 "gemini"
+    # 各方法在同一 Provider 上的重试次数（"方法:次数"，未列出的方法使用 default）；
+    # 生成类调用成本高、耗时长，默认只重试一次
+    AI_RETRY_ATTEMPTS: str = "default:2,generate_design:1,refine_design:1"
+    AI_RETRY_BASE_DELAY_SECONDS: float = 0.5  # 指数退避基数，实际间隔在 [0, 基数 * 2^n] 内随机
+    AI_RETRY_MAX_DELAY_SECONDS: float = 8.0
+    # 熔断：连续失败次数达到阈值后打开，经过 AI_CIRCUIT_RESET_SECONDS 放行一次试探调用
+    AI_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    AI_CIRCUIT_RESET_SECONDS: float = 30.0
+    # 对冲请求：列出的方法耗时超过近期 p95 时再发一次请求（优先发往下一个 Provider），取先返回的结果；
+    # 会增加调用费用，留空禁用。样本数不足 AI_HEDGE_MIN_SAMPLES 时不对冲
+    AI_HEDGE_OPERATIONS: str = ""
+    AI_HEDGE_MIN_SAMPLES: int = 20
+
+    def ai_retry_attempts(self, operation: str) -> int:
+        mapping = parse_mapping(self.AI_RETRY_ATTEMPTS)
+        try:
+            return max(int(mapping.get(operation, mapping.get("default", 0))), 0)
+        except ValueError:
+            return 0
+
+    @property
+    def ai_failover_providers(self) -> List[str]:
+        return [name.strip().lower() for name in self.AI_FAILOVER_PROVIDERS.split(",") if name.strip()]
+
+    @property
+    def ai_hedge_operations(self) -> List[str]:
+        return [name.strip() for name in self.AI_HEDGE_OPERATIONS.split(",") if name.strip()]
+
+    # AI 分析缓存：服务记录的照片（按内容哈希）与复盘 / 反馈文本均未变化时，重新分析直接复用上次的结果
+    ANALYSIS_CACHE_ENABLED: bool = True
+
+    # 批量重新分析（POST /services/reanalyze）：同时进行的 AI 分析数、每批写入并记录断点的服务记录数、任务超时（秒）
+    BULK_ANALYSIS_CONCURRENCY: int = 4
+    BULK_ANALYSIS_BATCH_SIZE: int = 20
+    BULK_ANALYSIS_TIMEOUT_SECONDS: float = 21600.0
+
+    # 出站 HTTP 连接池（AI Provider 与图片下载共用）；HTTP/2 需要另行安装可选依赖 h2
+    HTTP_HTTP2: bool = False
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    HTTP_TIMEOUT_SECONDS: float = 120.0
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 10.0
 
     # AI Provider 配置
-    AI_PROVIDER: str = "openai"  # openai/gemini/baidu/alibaba
+    AI_PROVIDER: str = "openai"  # openai/gemini/fake/baidu/alibaba（fake 为离线压测用）
     OPENAI_API_KEY: str = ""  # 必须在 .env 中设置
     GEMINI_API_KEY: str = ""  # Google Gemini API Key
 
+    # 离线 Fake Provider（AI_PROVIDER=fake）：本地生成设计图与结构合法的估算 / 分析结果，Agent 使用合成对话后端
+    # 各方法的延迟中位数（秒，"方法:秒数"，chat 为对话后端），实际延迟按对数正态分布抖动（sigma=FAKE_AI_LATENCY_JITTER）
+    FAKE_AI_LATENCY_SECONDS: str = "default:0.5,generate_design:6,refine_design:6,compare_images:3,chat:1"
+    FAKE_AI_LATENCY_JITTER: float = 0.3
+    FAKE_AI_ERROR_RATE: str = "default:0"  # 各方法抛出模拟 503 错误的概率，如 "default:0.02,generate_design:0.05"
+    FAKE_AI_SEED: Optional[int] = None  # 固定后延迟与错误注入序列可复现
+    FAKE_CHAT_TURNS_PER_STEP: int = 3  # 合成对话每个步骤在第几条用户消息时完成
+
     # 邀请码配置（注册时必须填写，留空则任何人都可注册）
     INVITE_CODE: str = ""
 
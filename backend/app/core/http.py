@@ -0,0 +1,87 @@
+"""
+共享 HTTP 客户端
+
+进程内所有出站 HTTP 请求（AsyncOpenAI、Gemini、设计图下载）共用一个 httpx.AsyncClient，
+复用 keep-alive 连接，避免每次设计生成 / 分析都重新建立 TCP + TLS 连接。
+HTTP_HTTP2 开启且安装了 h2 时启用 HTTP/2（同一连接上多路复用并发请求），否则使用 HTTP/1.1 连接池。
+
+客户端在首次使用时创建，由应用 lifespan 在关闭时释放。
+SDK 客户端构造时持有的是 SharedHTTPClient，每次请求再取当前的共享客户端，
+因此共享客户端关闭并重建后（再次启动 lifespan、测试中多个 TestClient）仍然可用。
+"""
+import logging
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def http2_available() -> bool:
+    """是否可以启用 HTTP/2（需要可选依赖 h2）"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """按配置创建连接池客户端"""
+    http2 = settings.HTTP_HTTP2 and http2_available()
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+    logger.info(
+        f"HTTP client: http2={http2} max_connections={limits.max_connections} "
+        f"max_keepalive={limits.max_keepalive_connections}"
+    )
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=limits,
+        timeout=_timeout(),
+        # Gemini SDK 与 OpenAI SDK 默认客户端均跟随重定向
+        follow_redirects=True,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(settings.HTTP_TIMEOUT_SECONDS, connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取进程共享的 HTTP 客户端（不存在或已关闭时创建）"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+async def close_http_client() -> None:
+    """关闭共享客户端并释放连接（应用关闭时调用）"""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+class SharedHTTPClient(httpx.AsyncClient):
+    """
+    交给 SDK 客户端（AsyncOpenAI、Gemini）的 httpx.AsyncClient：请求在自身上构建（超时等默认值与共享客户端一致），
+    发送时转发给当前的共享客户端。自身不持有连接，关闭由 close_http_client 统一处理
+    """
+
+    def __init__(self):
+        super().__init__(timeout=_timeout(), follow_redirects=True)
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        return await get_http_client().send(request, **kwargs)
+
+    async def aclose(self) -> None:
+        """共享客户端由应用 lifespan 关闭，这里不做处理"""
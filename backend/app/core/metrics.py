@@ -0,0 +1,69 @@
+"""
+进程内运行指标
+
+轻量级计数器 / 观测值汇总（count、sum、min、max、last），
+通过 GET /api/v1/system/metrics 查看。多 worker 部署时每个进程各自统计。
+"""
+import threading
+from typing import Any, Dict
+
+
+def _key(name: str, labels: Dict[str, Any]) -> str:
+    if not labels:
+        return name
+    inner = ",".join(f"{k}={labels[k]}" for k in sorted(labels))
+    return f"{name}{{{inner}}}"
+
+
+class MetricsRegistry:
+    """线程安全的指标注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._observations: Dict[str, Dict[str, float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        """计数器累加"""
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """记录一次观测值（如每轮 prompt token 数、耗时）"""
+        key = _key(name, labels)
+        with self._lock:
+            obs = self._observations.get(key)
+            if obs is None:
+                self._observations[key] = {
+                    "count": 1, "sum": value, "min": value, "max": value, "last": value,
+                }
+                return
+            obs["count"] += 1
+            obs["sum"] += value
+            obs["min"] = min(obs["min"], value)
+            obs["max"] = max(obs["max"], value)
+            obs["last"] = value
+
+    def get_counter(self, name: str, **labels: Any) -> float:
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def get_observation(self, name: str, **labels: Any) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._observations.get(_key(name, labels), {}))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            observations: Dict[str, Dict[str, float]] = {}
+            for key, obs in self._observations.items():
+                observations[key] = {**obs, "avg": obs["sum"] / obs["count"]}
+            return {"counters": dict(self._counters), "observations": observations}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._observations.clear()
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,42 @@
+"""
+Server-Sent Events 工具
+"""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Tuple
+
+
+def format_sse(event: str, data: Any) -> str:
+    """格式化为一条 Server-Sent Event"""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+async def with_keepalive(
+    events: AsyncIterator[Tuple[str, Any]], interval: float
+) -> AsyncIterator[str]:
+    """
+    将 (event, data) 事件流转为 SSE 文本；长时间无事件（如 generate_design 执行中）时
+    每隔 interval 秒发送一条注释行心跳，避免代理 read timeout 断开连接
+    """
+    iterator = events.__aiter__()
+    pending = asyncio.ensure_future(iterator.__anext__())
+    try:
+        while True:
+            done, _ = await asyncio.wait({pending}, timeout=interval)
+            if not done:
+                yield ": keep-alive\n\n"
+                continue
+            try:
+                event, data = pending.result()
+            except StopAsyncIteration:
+                break
+            yield format_sse(event, data)
+            pending = asyncio.ensure_future(iterator.__anext__())
+    finally:
+        if not pending.done():
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, StopAsyncIteration):
+                pass
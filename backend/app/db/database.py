@@ -38,10 +38,35 @@ engine = create_engine(settings.DATABASE_URL, **get_engine_config())
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 请求之外（后台任务、SSE 回合、缓存写入等）打开独立会话使用的工厂，测试中替换为测试引擎
+session_factory: sessionmaker = SessionLocal
+
 # 创建基类
 Base = declarative_base()
 
 
+def open_session() -> Session:
+    """
+    用当前的会话工厂打开一个独立会话，调用方负责关闭
+
+    Returns:
+        Session: SQLAlchemy 数据库会话
+    """
+    return session_factory()
+
+
+def shares_connection() -> bool:
+    """
+    会话工厂的所有会话是否共用同一个数据库连接（SQLite StaticPool）。
+    共用连接时事务也是共享的：任一会话 close() 的回滚会撤销其他会话已 flush 未提交的写入，
+    且不能在多个线程中同时使用
+
+    Returns:
+        bool: 是否共用连接
+    """
+    return isinstance(session_factory.kw["bind"].pool, StaticPool)
+
+
 # 数据库依赖注入
 def get_db() -> Generator[Session, None, None]:
     """
@@ -8,11 +8,16 @@ from starlette.exceptions import HTTPException as StarletteHTTPException
 from app.core.config import settings
 from app.core.logging_config import setup_logging, get_logger
 from app.core.exceptions import NailAppException
+from app.core.http import close_http_client
 from app.core.limiter import limiter
 from app.middleware.logging_middleware import LoggingMiddleware
 from app.api.v1 import api_router
+from app.services.conversation_archive import ConversationArchiveService
+from app.services.job_service import JobService
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
+from contextlib import asynccontextmanager
+import asyncio
 import os
 import logging
 
@@ -52,10 +57,37 @@ tags_metadata = [
     },
 ]
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用生命周期：启动时恢复未完成的后台任务，并启动中断任务的定期巡检与会话定期打包；
+    关闭时取消本进程内的任务，并释放共享 HTTP 连接池
+    """
+    try:
+        JobService.resume_pending()
+    except Exception as e:
+        logger.error(f"恢复后台任务失败: {e}", exc_info=True)
+    background = []
+    if settings.AGENT_JOB_SWEEP_SECONDS > 0:
+        background.append(asyncio.create_task(
+            JobService.run_periodically(settings.AGENT_JOB_SWEEP_SECONDS)
+        ))
+    if settings.CONVERSATION_PACK_INTERVAL_SECONDS > 0:
+        background.append(asyncio.create_task(
+            ConversationArchiveService.run_periodically(settings.CONVERSATION_PACK_INTERVAL_SECONDS)
+        ))
+    yield
+    for task in background:
+        task.cancel()
+    await JobService.shutdown()
+    await close_http_client()
+
+
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
     redirect_slashes=False,
+    lifespan=lifespan,
     description="""
 ## 美甲师能力成长系统 API
 
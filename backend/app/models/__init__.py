@@ -12,6 +12,10 @@ from app.models.comparison_result import ComparisonResult
 from app.models.ability_dimension import AbilityDimension
 from app.models.ability_record import AbilityRecord
 from app.models.conversation_session import ConversationSession
+from app.models.agent_job import AgentJob
+from app.models.conversation_message import ConversationMessage
+from app.models.image_caption import ImageCaption
+from app.models.ai_cache_entry import AICacheEntry
 
 __all__ = [
     "Base",
@@ -25,4 +29,8 @@ __all__ = [
     "AbilityDimension",
     "AbilityRecord",
     "ConversationSession",
+    "AgentJob",
+    "ConversationMessage",
+    "ImageCaption",
+    "AICacheEntry",
 ]
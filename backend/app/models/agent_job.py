@@ -0,0 +1,57 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy.orm import relationship
+from app.db.database import Base
+import datetime
+
+
+class AgentJob(Base):
+    """后台任务模型 - 耗时的 Agent 工具（设计生成、AI 分析）在后台执行，状态持久化以便重启后恢复"""
+
+    __tablename__ = "agent_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    session_id = Column(
+        Integer,
+        ForeignKey("conversation_sessions.id", ondelete="CASCADE"),
+        nullable=True,
+        index=True,
+        comment="发起任务的对话会话ID"
+    )
+
+    # 任务类型（即工具名）：generate_design | refine_design | run_analysis
+    kind = Column(String(50), nullable=False)
+
+    # 任务状态：pending | running | succeeded | failed
+    status = Column(String(20), default="pending", nullable=False, index=True)
+
+    # 任务输入，结构示例: {"args": {...工具参数}, "context": {...发起时的会话上下文}}
+    payload = Column(JSON, default=dict)
+
+    # 任务结果，结构示例: {"content": "<工具结果 JSON 字符串>", "context": {...需写回会话的上下文}}
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+
+    # 结果被 Agent 读入对话的时间（为空表示尚未交付）
+    consumed_at = Column(DateTime, nullable=True)
+
+    # 时间戳
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    updated_at = Column(
+        DateTime,
+        default=datetime.datetime.utcnow,
+        onupdate=datetime.datetime.utcnow,
+    )
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    # 关系
+    user = relationship("User")
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def __repr__(self):
+        return f"<AgentJob(id={self.id}, kind={self.kind}, status={self.status})>"
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from app.db.database import Base
+import datetime
+
+
+class AICacheEntry(Base):
+    """AI 结果缓存 - 相同输入的设计生成 / 优化 / 执行估算直接复用上次的结果（AI_CACHE_ENABLED 时启用）"""
+
+    __tablename__ = "ai_cache_entries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # 规范化输入（估算为图片内容 SHA-256）的哈希
+    cache_key = Column(String(64), unique=True, nullable=False, index=True)
+    # 缓存的操作：generate_design | refine_design | estimate_execution
+    operation = Column(String(50), nullable=False)
+
+    # 缓存结果，结构: {"value": <AI Provider 方法的返回值>}
+    result = Column(JSON, nullable=False)
+    hit_count = Column(Integer, default=0, nullable=False)
+
+    # 时间戳（last_used_at 用于超出容量时按最久未使用淘汰）
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    expires_at = Column(DateTime, nullable=True, comment="过期时间，为空表示不过期")
+
+    def __repr__(self):
+        return f"<AICacheEntry(operation={self.operation}, key={self.cache_key[:12]})>"
@@ -0,0 +1,37 @@
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, JSON, Index, UniqueConstraint
+from app.db.database import Base
+import datetime
+
+
+class ConversationMessage(Base):
+    """对话消息模型 - CONVERSATION_STORE=sql 时代替本地 JSONL 文件存储会话消息"""
+
+    __tablename__ = "conversation_messages"
+    __table_args__ = (
+        # 同一会话内的消息序号唯一（按序号排序即为写入顺序）
+        UniqueConstraint("session_id", "seq", name="uq_conversation_messages_session_seq"),
+        # 读取当前步骤的未归档消息
+        Index("ix_conversation_messages_step", "session_id", "step", "archived", "seq"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(
+        Integer,
+        ForeignKey("conversation_sessions.id", ondelete="CASCADE"),
+        nullable=False,
+        comment="所属对话会话ID"
+    )
+    seq = Column(Integer, nullable=False, comment="会话内消息序号（从 1 开始递增）")
+
+    # 步骤名称与角色（归档标记行的 role 为空）
+    step = Column(String(50), nullable=False)
+    role = Column(String(20), nullable=True)
+    archived = Column(Boolean, default=False, nullable=False)
+
+    # 完整消息（与 JSONL 中的一行相同）
+    payload = Column(JSON, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ConversationMessage(session_id={self.session_id}, seq={self.seq}, role={self.role})>"
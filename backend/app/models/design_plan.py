@@ -43,6 +43,10 @@ class DesignPlan(Base):
         comment="预估材料清单（JSON数组）"
     )
     difficulty_level = Column(String(20), comment="难度等级（简单/中等/困难）")
+    # 估算状态：pending（后台估算中）| succeeded | failed；为空表示早期未记录状态的方案
+    estimation_status = Column(String(20), nullable=True, comment="执行估算状态")
+    estimation_error = Column(Text, nullable=True, comment="执行估算失败原因")
+    estimated_at = Column(DateTime, nullable=True, comment="执行估算完成时间")
 
     # 其他信息
     title = Column(String(200), comment="设计方案标题")
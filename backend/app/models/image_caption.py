@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON
+from app.db.database import Base
+import datetime
+
+
+class ImageCaption(Base):
+    """图片描述缓存 - 按图片内容哈希保存视觉模型生成的描述，同一张图只分析一次（跨回合、跨会话复用）"""
+
+    __tablename__ = "image_captions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), unique=True, nullable=False, index=True, comment="图片内容 SHA-256")
+
+    # 描述结果
+    caption = Column(Text, nullable=False, comment="简短描述（1-2 句）")
+    palette = Column(JSON, default=list, comment="主要颜色列表")
+    style_tags = Column(JSON, default=list, comment="风格标签列表")
+    nail_count = Column(Integer, nullable=True, comment="图中可见指甲数量")
+
+    # 生成描述的 AI Provider（openai / gemini）
+    provider = Column(String(50), nullable=True)
+
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ImageCaption(id={self.id}, hash={self.content_hash[:12]})>"
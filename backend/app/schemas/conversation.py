@@ -37,6 +37,8 @@ class ConversationMessageCreate(BaseModel):
     """用户发送消息请求体"""
     content: str = Field(..., min_length=1, max_length=5000)
     image_paths: List[str] = []
+    # 客户端为每条消息生成的唯一键（也可通过 Idempotency-Key 请求头传入），重试时保持不变
+    idempotency_key: Optional[str] = Field(None, max_length=128)
 
 
 # ── 响应 Schema ─────────────────────────────────────────────────────────────
@@ -84,3 +86,20 @@ class SessionListResponse(BaseModel):
     """会话列表响应"""
     total: int
     sessions: List[ConversationSessionResponse]
+
+
+class ConversationMessageItem(BaseModel):
+    """会话历史中的一条消息（分页接口返回）"""
+    role: str
+    content: str
+    step: Optional[str] = None
+    archived: bool = False
+    ui_metadata: Optional[UiMetadata] = None
+    ts: Optional[str] = None
+
+
+class ConversationMessagePage(BaseModel):
+    """会话历史分页响应：next_cursor 为下一页的字节偏移游标"""
+    messages: List[ConversationMessageItem]
+    next_cursor: Optional[int] = None
+    has_more: bool = False
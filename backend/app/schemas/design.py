@@ -21,6 +21,7 @@ class DesignGenerateRequest(BaseModel):
     style_keywords: Optional[List[str]] = Field(None, description="风格关键词列表")
     title: Optional[str] = Field(None, max_length=200, description="设计方案标题")
     notes: Optional[str] = Field(None, description="备注")
+    bypass_cache: bool = Field(False, description="跳过 AI 结果缓存，强制重新生成")
 
 
 class DesignRefineRequest(BaseModel):
@@ -31,6 +32,7 @@ class DesignRefineRequest(BaseModel):
         max_length=2000,
         description="优化指令（如：增加更多亮片、让渐变更加自然等）"
     )
+    bypass_cache: bool = Field(False, description="跳过 AI 结果缓存，强制重新生成")
 
 
 class DesignPlanUpdate(BaseModel):
@@ -63,6 +65,9 @@ class DesignPlanResponse(DesignPlanBase):
     estimated_duration: Optional[int]
     estimated_materials: Optional[List[str]]
     difficulty_level: Optional[str]
+    estimation_status: Optional[str] = None
+    estimation_error: Optional[str] = None
+    estimated_at: Optional[datetime] = None
 
     # 其他信息
     is_archived: int
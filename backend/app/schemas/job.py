@@ -0,0 +1,29 @@
+"""
+后台任务 — API 契约 Schema
+"""
+from pydantic import BaseModel
+from typing import Optional, Dict, Any, List
+from datetime import datetime
+
+
+class AgentJobResponse(BaseModel):
+    """后台任务状态"""
+    id: int
+    session_id: Optional[int] = None
+    kind: str
+    # pending | running | succeeded | failed
+    status: str
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    attempts: int
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    model_config = {"from_attributes": True}
+
+
+class AgentJobListResponse(BaseModel):
+    """后台任务列表"""
+    jobs: List[AgentJobResponse]
+    total: int
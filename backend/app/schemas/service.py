@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, field_validator
 from datetime import date, datetime
-from typing import Optional
+from typing import List, Optional
 
 
 class ServiceRecordBase(BaseModel):
@@ -69,6 +69,17 @@ class ServiceRecordComplete(BaseModel):
         return v
 
 
+class ServiceReanalysisRequest(BaseModel):
+    """批量重新分析（仅包含已完成且有实际图、设计方案的服务记录）"""
+    service_ids: Optional[List[int]] = Field(None, max_length=1000, description="指定服务记录ID")
+    customer_id: Optional[int] = None
+    date_from: Optional[date] = Field(None, description="服务日期起（含）")
+    date_to: Optional[date] = Field(None, description="服务日期止（含）")
+    only_unanalyzed: bool = Field(False, description="只分析尚无分析结果的记录")
+    force: bool = Field(True, description="跳过分析缓存，强制重新调用 AI")
+    concurrency: Optional[int] = Field(None, ge=1, le=16, description="同时进行的 AI 分析数")
+
+
 class ServiceRecordResponse(ServiceRecordBase):
     """服务记录响应"""
     id: int
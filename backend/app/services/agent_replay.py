@@ -0,0 +1,293 @@
+"""
+Agent 回放基准测试
+
+将 CONVERSATIONS_DIR 下真实的 messages.jsonl 会话逐轮回放到 AgentService.process_message：
+  - LLM 由 RecordedChatClient 代替，按顺序返回录制的 assistant / tool_calls 消息
+  - 工具由 ReplayToolExecutor 代替，按顺序返回录制的 tool 结果（不访问 AI Provider 与业务数据）
+  - 数据库使用临时 SQLite 文件，回放写出的 JSONL 写入临时目录，不影响原始记录
+
+统计每轮扣除模型时间后的自身开销，并拆分为文件 I/O、提示词构建、JSON 解析、DB 提交，
+用于离线发现 Agent 热路径的性能回退（无需 API Key）。
+"""
+import functools
+import json
+import logging
+import statistics
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+
+import app.models  # noqa: F401  注册所有表
+from app.core.config import settings
+from app.db.database import Base
+from app.models.conversation_session import ConversationSession
+from app.models.user import User
+from app.services.agent_service import AgentService
+from app.services.agent_tools import ToolExecutor
+from app.services.ai.fake_chat import RecordedChatClient
+from app.services.conversation_file import ConversationFileManager
+from app.services.message_store import JsonlMessageStore
+
+logger = logging.getLogger(__name__)
+
+# 开销拆分的类别
+BUCKETS = ("file_io", "prompt_build", "json_parse", "db_commit")
+
+
+@dataclass
+class ReplayTurn:
+    """一轮录制的对话：用户输入、该轮 LLM 依次返回的消息、工具依次返回的结果"""
+    step: str
+    content: str
+    llm_messages: List[dict] = field(default_factory=list)
+    tool_results: List[str] = field(default_factory=list)
+
+
+@dataclass
+class TurnTiming:
+    """单轮回放耗时（毫秒）"""
+    session_id: int
+    turn: int
+    step: str
+    total_ms: float
+    model_ms: float
+    overhead_ms: float
+    file_io_ms: float
+    prompt_build_ms: float
+    json_parse_ms: float
+    db_commit_ms: float
+    other_ms: float
+    commits: int
+    llm_calls: int
+
+
+def load_turns(messages: List[dict]) -> List[ReplayTurn]:
+    """
+    将会话完整历史切分为回放轮次。
+    最终 assistant 回复按录制内容重建 JSON；其后紧跟同步骤归档标记时视为 step_complete。
+    规则快速路径生成的回复（带 rule 字段）不需要 LLM，回放时同样由规则处理
+    """
+    turns: List[ReplayTurn] = []
+    for idx, msg in enumerate(messages):
+        if msg.get("_archive_marker"):
+            continue
+        role = msg.get("role")
+        if role == "user":
+            turns.append(ReplayTurn(step=msg.get("step", ""), content=msg.get("content") or ""))
+            continue
+        if not turns:
+            # 开场问候由 create_session 重新生成
+            continue
+        turn = turns[-1]
+        if role == "tool":
+            turn.tool_results.append(msg.get("content") or "")
+        elif role == "assistant" and msg.get("tool_calls"):
+            turn.llm_messages.append({"content": None, "tool_calls": msg["tool_calls"]})
+        elif role == "assistant" and "rule" not in msg:
+            following = messages[idx + 1] if idx + 1 < len(messages) else {}
+            step_complete = bool(
+                following.get("_archive_marker") and following.get("step") == msg.get("step")
+            )
+            turn.llm_messages.append({"content": json.dumps({
+                "message_text": msg.get("content") or "",
+                "step_summary": "",
+                "step_complete": step_complete,
+                **(msg.get("ui_metadata") or {}),
+            }, ensure_ascii=False)})
+    return turns
+
+
+class ReplayToolExecutor(ToolExecutor):
+    """按顺序返回录制的工具结果；调度逻辑（只读工具并发）沿用 ToolExecutor"""
+
+    def __init__(self):
+        self._results: List[str] = []
+        self.exhausted = 0
+        # 并行的只读工具在工作线程中取结果
+        self._lock = threading.Lock()
+
+    def load(self, results: Iterable[str]) -> None:
+        self._results = list(results)
+
+    async def execute(self, tool_name: str, tool_args: dict, db: Session,
+                      user_id: int, session: ConversationSession) -> str:
+        return self._next_result(tool_name)
+
+    def _execute_read(self, tool_name: str, tool_args: dict, user_id: int, step: str) -> str:
+        """并行的只读工具同样返回录制结果，不访问数据库"""
+        return self._next_result(tool_name)
+
+    def _next_result(self, tool_name: str) -> str:
+        with self._lock:
+            if self._results:
+                return self._results.pop(0)
+            self.exhausted += 1
+        return json.dumps({"result": f"{tool_name} replayed"}, ensure_ascii=False)
+
+
+class _Timings:
+    """按类别累计被包装方法的耗时"""
+
+    def __init__(self):
+        self.totals: Dict[str, float] = defaultdict(float)
+        self.commits = 0
+        self._commit_started: Optional[float] = None
+
+    def reset(self) -> None:
+        self.totals.clear()
+        self.commits = 0
+
+    def wrap(self, obj, name: str, bucket: str) -> None:
+        func = getattr(obj, name)
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.totals[bucket] += time.perf_counter() - started
+
+        setattr(obj, name, timed)
+
+    def _before_commit(self, _session) -> None:
+        self._commit_started = time.perf_counter()
+
+    def _after_commit(self, _session) -> None:
+        self.commits += 1
+        if self._commit_started is not None:
+            self.totals["db_commit"] += time.perf_counter() - self._commit_started
+            self._commit_started = None
+
+    def watch_commits(self, db: Session) -> None:
+        event.listen(db, "before_commit", self._before_commit)
+        event.listen(db, "after_commit", self._after_commit)
+
+    def unwatch_commits(self, db: Session) -> None:
+        event.remove(db, "before_commit", self._before_commit)
+        event.remove(db, "after_commit", self._after_commit)
+
+
+class AgentReplayBenchmark:
+    """回放会话并统计 Agent 每轮自身开销"""
+
+    def __init__(self, work_dir: Optional[str] = None):
+        self._work_dir = work_dir
+
+    @staticmethod
+    def load_sessions(session_ids: Optional[List[int]] = None) -> Dict[int, List[ReplayTurn]]:
+        """从 CONVERSATIONS_DIR 读取待回放的会话（无用户消息的会话跳过）"""
+        ids = session_ids or list(ConversationFileManager._iter_session_ids())
+        sessions = {}
+        for session_id in ids:
+            turns = load_turns(ConversationFileManager.read_full_history(session_id))
+            if turns:
+                sessions[session_id] = turns
+        return sessions
+
+    async def run(
+        self, sessions: Dict[int, List[ReplayTurn]], repeat: int = 1
+    ) -> List[TurnTiming]:
+        with tempfile.TemporaryDirectory(dir=self._work_dir) as tmp:
+            original_dir = settings.CONVERSATIONS_DIR
+            engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+            Base.metadata.create_all(bind=engine)
+            db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+            settings.CONVERSATIONS_DIR = str(Path(tmp) / "conversations")
+            try:
+                user = User(email="bench@example.com", username="bench",
+                            hashed_password="x", is_active=True)
+                db.add(user)
+                db.commit()
+                timings: List[TurnTiming] = []
+                for _ in range(repeat):
+                    for source_id, turns in sessions.items():
+                        timings += await self._replay_session(db, user.id, source_id, turns)
+                return timings
+            finally:
+                settings.CONVERSATIONS_DIR = original_dir
+                db.close()
+                engine.dispose()
+
+    async def _replay_session(
+        self, db: Session, user_id: int, source_id: int, turns: List[ReplayTurn]
+    ) -> List[TurnTiming]:
+        client = RecordedChatClient()
+        tools = ReplayToolExecutor()
+        agent = AgentService()
+        agent._llm = client
+        agent._tools = tools
+        # 回放固定写入临时目录下的 JSONL，不写入 CONVERSATION_STORE 配置的存储
+        agent._store = JsonlMessageStore()
+
+        timings = _Timings()
+        for name in ("append_message", "archive_step", "read_current_step_messages", "get_log_size"):
+            timings.wrap(agent._store, name, "file_io")
+        for name in ("_build_system_prompt", "_build_openai_messages", "_llm_kwargs"):
+            timings.wrap(agent, name, "prompt_build")
+        timings.wrap(agent, "_parse_llm_response", "json_parse")
+
+        session, _ = agent.create_session(db, user_id)
+        results = []
+        timings.watch_commits(db)
+        try:
+            for turn_idx, turn in enumerate(turns, start=1):
+                client.load(turn.llm_messages)
+                tools.load(turn.tool_results)
+                timings.reset()
+                client.elapsed = 0.0
+                calls_before = len(client.requests)
+                started = time.perf_counter()
+                try:
+                    await agent.process_message(db, session.id, user_id, turn.content)
+                except ValueError as e:
+                    # 会话已结束（如录制中途终止），后续轮次无法回放
+                    logger.warning(f"[bench] session {source_id} turn {turn_idx} stopped: {e}")
+                    break
+                total = time.perf_counter() - started
+                overhead = total - client.elapsed
+                buckets = {name: timings.totals.get(name, 0.0) for name in BUCKETS}
+                results.append(TurnTiming(
+                    session_id=source_id,
+                    turn=turn_idx,
+                    step=turn.step,
+                    total_ms=total * 1000,
+                    model_ms=client.elapsed * 1000,
+                    overhead_ms=overhead * 1000,
+                    other_ms=max(overhead - sum(buckets.values()), 0.0) * 1000,
+                    commits=timings.commits,
+                    llm_calls=len(client.requests) - calls_before,
+                    **{f"{name}_ms": value * 1000 for name, value in buckets.items()},
+                ))
+        finally:
+            timings.unwatch_commits(db)
+        if client.exhausted or tools.exhausted:
+            logger.warning(
+                f"[bench] session {source_id} diverged from recording: "
+                f"llm_fallbacks={client.exhausted} tool_fallbacks={tools.exhausted}"
+            )
+        return results
+
+
+def summarize(timings: List[TurnTiming]) -> Dict[str, Dict[str, float]]:
+    """汇总各耗时字段的 mean / p50 / p95 / max"""
+    if not timings:
+        return {}
+    summary = {}
+    fields = [name for name in asdict(timings[0]) if name.endswith("_ms") or name == "commits"]
+    for name in fields:
+        values = sorted(getattr(t, name) for t in timings)
+        summary[name] = {
+            "mean": statistics.fmean(values),
+            "p50": values[len(values) // 2],
+            "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+            "max": values[-1],
+        }
+    return summary
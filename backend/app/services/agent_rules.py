@@ -0,0 +1,108 @@
+"""
+Agent 确定性快速路径（规则引擎）
+
+在调用 LLM 之前匹配结果确定的消息：快捷回复按钮、终止指令、无需模型判断的步骤推进。
+命中时由 AgentService 直接在本地更新步骤摘要 / 当前步骤并写入 JSONL，不调用 LLM。
+规则只处理结果唯一的情况，任何需要理解自由文本或调用工具的消息都交给 LLM。
+"""
+import re
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from app.models.conversation_session import ConversationSession
+from app.schemas.conversation import LLMResponse
+
+# 终止会话指令（同时匹配 LLM 降级回复中的 "Abort" 快捷回复）
+ABORT_COMMANDS = frozenset({"终止", "abort", "quit"})
+
+# confirm 步骤快捷回复 "Edit Details"
+EDIT_DETAILS_COMMANDS = frozenset({"edit details", "修改"})
+
+# review 步骤中结束复盘的指令
+FINISH_REVIEW_COMMANDS = frozenset({"skip", "done", "finish", "no thanks", "跳过", "结束"})
+
+_TRAILING_PUNCTUATION = re.compile(r"[\s.!?。！？~]+$")
+
+
+@dataclass
+class RuleMatch:
+    """规则命中结果：abandon=True 表示终止会话，否则 response 为本地生成的助理回复"""
+    rule: str
+    response: Optional[LLMResponse] = None
+    abandon: bool = False
+
+
+def normalize(content: str) -> str:
+    """统一大小写与首尾空白、结尾标点，便于精确匹配快捷回复"""
+    return _TRAILING_PUNCTUATION.sub("", content.strip()).casefold()
+
+
+def _step_summary(session: ConversationSession) -> str:
+    for entry in session.step_summaries or []:
+        if entry.get("step") == session.current_step:
+            return entry.get("summary", "")
+    return ""
+
+
+def _abort(session: ConversationSession, text: str) -> Optional[RuleMatch]:
+    if text in ABORT_COMMANDS:
+        return RuleMatch(rule="abort", abandon=True)
+    return None
+
+
+def _edit_details(session: ConversationSession, text: str) -> Optional[RuleMatch]:
+    if session.current_step != "confirm" or text not in EDIT_DETAILS_COMMANDS:
+        return None
+    return RuleMatch(rule="edit_details", response=LLMResponse(
+        message_text="Sure — tell me what you'd like to change, and I'll update the draft.",
+        step_summary=_step_summary(session),
+    ))
+
+
+def _skip_analysis(session: ConversationSession, text: str) -> Optional[RuleMatch]:
+    # 与 analysis 步骤提示词一致：没有服务记录时直接跳过
+    if session.current_step != "analysis" or (session.context or {}).get("service_record_id"):
+        return None
+    return RuleMatch(rule="skip_analysis", response=LLMResponse(
+        message_text="There's no saved service record to analyze, so I'll skip the analysis.",
+        step_summary="Analysis skipped: no service record",
+        step_complete=True,
+    ))
+
+
+def _finish_review(session: ConversationSession, text: str) -> Optional[RuleMatch]:
+    if session.current_step != "review" or text not in FINISH_REVIEW_COMMANDS:
+        return None
+    return RuleMatch(rule="finish_review", response=LLMResponse(
+        message_text="All done! Today's service has been recorded. See you next time ✨",
+        step_summary="Review skipped by user",
+        step_complete=True,
+    ))
+
+
+_RULES: List[Callable[[ConversationSession, str], Optional[RuleMatch]]] = [
+    _abort,
+    _edit_details,
+    _skip_analysis,
+    _finish_review,
+]
+
+
+class AgentRules:
+    """按顺序匹配规则，返回第一个命中的结果"""
+
+    @staticmethod
+    def match(
+        session: ConversationSession,
+        content: str,
+        image_paths: Optional[List[str]] = None,
+    ) -> Optional[RuleMatch]:
+        # 带图片的消息需要 LLM 理解，不走快速路径
+        if image_paths:
+            return None
+        text = normalize(content)
+        for rule in _RULES:
+            matched = rule(session, text)
+            if matched is not None:
+                return matched
+        return None
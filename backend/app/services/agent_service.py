@@ -5,28 +5,49 @@ AI Agent conversation service (core)
 - Compress history after step completion (rolling summary)
 - Coordinate DB (metadata) and local file (raw messages) dual-write
 """
+import asyncio
+import copy
 import json
 import logging
 import re
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Any, AsyncIterator, List, Optional, Tuple
+from sqlalchemy import event as sa_event
 from sqlalchemy.orm import Session
 import datetime
 
 from openai import AsyncOpenAI
 
+from app.core.cache import LRUCache
 from app.core.config import settings
+from app.core.http import SharedHTTPClient
+from app.core.metrics import metrics
 from app.models.conversation_session import ConversationSession
 from app.schemas.conversation import (
     LLMResponse,
     UiMetadata,
     AssistantMessageResponse,
 )
-from app.services.conversation_file import ConversationFileManager
-from app.services.agent_tools import TOOLS_DEFINITION, ToolExecutor
+from app.services.image_caption_service import ImageCaptionService
+from app.services.message_store import get_message_store
+from app.services.job_service import JobService
+from app.services.agent_rules import AgentRules, RuleMatch
+from app.services.agent_tools import ToolExecutor, get_step_tools
+from app.services.prompt_budget import PromptBudget, estimate_tokens
 
 logger = logging.getLogger(__name__)
 
+
+@lru_cache(maxsize=None)
+def _schema_tokens(schema_json: str) -> int:
+    """工具定义 JSON 的 token 估算（每个步骤的 schema 固定，只计算一次）"""
+    return estimate_tokens(schema_json)
+
+
 # Step flow order (for auto-advancement)
 STEP_FLOW = ["collect", "confirm", "analysis", "review"]
 
@@ -38,6 +59,8 @@ _BASE_SYSTEM_PROMPT = """You are a professional nail artist AI assistant, helpin
 
 {step_instructions}
 
+[Background jobs] Tools that return a job_id keep running in the background. Tell the user the work is in progress and do not invent its result; it is delivered to you as a system message on a later turn.
+
 [Final response format] After all tool calls are complete, output only valid JSON (no other text):
 {{
   "message_text": "User-facing English message",
@@ -87,6 +110,7 @@ Read the structured data (JSON string) from the collect step in step_summaries.
     "analysis": """[analysis step — AI analysis]
 - If service_record_id exists in context: call run_analysis(service_id)
 - Show analysis highlights (up to 3 strengths + 3 areas to improve), set step_complete=true
+- If run_analysis returned a job_id, keep step_complete=false until the analysis result is delivered
 - If no service_record_id or analysis fails: set step_complete=true directly to skip""",
 
     "review": """[review step — growth review]
@@ -104,21 +128,122 @@ _OPENING_MESSAGE_TEXT = (
 )
 
 
+class _MessageTextStream:
+    """
+    从流式输出的最终回复 JSON 中增量解码 message_text 字段的值，
+    使 token 事件只包含面向用户的文本（不含 JSON 结构与其他字段）
+    """
+
+    _KEY = re.compile(r'"message_text"\s*:\s*"')
+    _ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos: Optional[int] = None
+        self._done = False
+
+    def feed(self, text: str) -> str:
+        """追加一段输出，返回新解码出的 message_text 文本（可能为空）"""
+        if self._done:
+            return ""
+        self._buffer += text
+        if self._pos is None:
+            match = self._KEY.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        buf, i, out = self._buffer, self._pos, []
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self._done = True
+                break
+            if ch != "\\":
+                out.append(ch)
+                i += 1
+                continue
+            # 转义序列不完整时等待后续增量
+            if i + 1 >= len(buf):
+                break
+            esc = buf[i + 1]
+            if esc != "u":
+                out.append(self._ESCAPES.get(esc, esc))
+                i += 2
+                continue
+            if i + 6 > len(buf):
+                break
+            try:
+                code = int(buf[i + 2:i + 6], 16)
+            except ValueError:
+                code = 0xFFFD
+            if 0xD800 <= code < 0xDC00:
+                # UTF-16 代理对：等待低位部分
+                if i + 12 > len(buf):
+                    break
+                try:
+                    low = int(buf[i + 8:i + 12], 16)
+                except ValueError:
+                    low = 0xDC00
+                out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                i += 12
+                continue
+            out.append(chr(code))
+            i += 6
+        self._pos = i
+        return "".join(out)
+
+
+@dataclass
+class _SessionState:
+    """
+    会话状态缓存条目：当前步骤已转换为 OpenAI 格式的历史消息、系统提示词及其输入。
+    log_size 为条目对应的消息存储版本号（JSONL 文件字节数 / SQL 消息序号），与存储当前版本不一致时（其他进程写入）视为过期。
+    """
+    current_step: str
+    log_size: int
+    history: List[dict]
+    system_prompt: str = ""
+    prompt_inputs: Optional[tuple] = None
+    context: dict = field(default_factory=dict)
+
+
 class AgentService:
     """AI Agent 对话服务"""
 
     def __init__(self):
         self._tools = ToolExecutor()
-        self._file_mgr = ConversationFileManager()
-        if settings.AI_PROVIDER == "gemini":
+        self._store = get_message_store()
+        # 写穿式会话状态缓存：连续发送消息的热会话跳过文件解析与提示词重建
+        self._session_cache: LRUCache[_SessionState] = LRUCache(
+            settings.AGENT_SESSION_CACHE_SIZE,
+            ttl=settings.AGENT_SESSION_CACHE_TTL_SECONDS or None,
+        )
+        if settings.AI_PROVIDER == "fake":
+            from app.services.ai.fake_chat import SyntheticChatClient
+            self._llm = SyntheticChatClient()
+            self._model = "fake"
+            self._fast_model = "fake-fast"
+        elif settings.AI_PROVIDER == "gemini":
             self._llm = AsyncOpenAI(
                 api_key=settings.GEMINI_API_KEY,
                 base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+                http_client=SharedHTTPClient(),
             )
             self._model = "gemini-2.0-flash"
+            self._fast_model = "gemini-2.0-flash-lite"
         else:
-            self._llm = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+            self._llm = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, http_client=SharedHTTPClient())
             self._model = "gpt-4o"
+            self._fast_model = "gpt-4o-mini"
+        # 会话回合锁 {session_id: [asyncio.Lock, 持有/等待者数]} 与幂等回复缓存 {(user_id, session_id, key): (content, 回复)}
+        self._turn_locks: dict = {}
+        self._idempotency_cache: LRUCache[tuple] = LRUCache(
+            settings.AGENT_IDEMPOTENCY_CACHE_SIZE,
+            ttl=settings.AGENT_IDEMPOTENCY_TTL_SECONDS or None,
+        )
+        # 每个模型的 prompt token 预算（按需创建）
+        self._budgets: dict = {}
 
     # ── 会话管理 ──────────────────────────────────────────────────────────
 
@@ -138,17 +263,16 @@ class AgentService:
         db.refresh(session)
 
         # 设置文件路径
-        file_path = str(self._file_mgr.get_file_path(session.id))
-        session.file_path = file_path
-        db.commit()
+        session.file_path = self._store.location(session.id)
 
-        # 写入开场问候到本地文件
-        self._file_mgr.append_message(session.id, {
+        # 写入开场问候
+        self._store.append_message(session.id, {
             "step": "collect",
             "archived": False,
             "role": "assistant",
             "content": _OPENING_MESSAGE_TEXT,
-        })
+        }, db=db)
+        db.commit()
 
         opening_msg = AssistantMessageResponse(
             content=_OPENING_MESSAGE_TEXT,
@@ -186,9 +310,8 @@ class AgentService:
         ).offset(skip).limit(limit).all()
         return sessions, total
 
-    @staticmethod
     def abandon_session(
-        db: Session, session_id: int, user_id: int
+        self, db: Session, session_id: int, user_id: int
     ) -> bool:
         session = db.query(ConversationSession).filter(
             ConversationSession.id == session_id,
@@ -199,6 +322,7 @@ class AgentService:
         session.status = "abandoned"
         session.updated_at = datetime.datetime.utcnow()
         db.commit()
+        self._session_cache.pop(session_id)
         return True
 
     # ── 核心：处理用户消息 ────────────────────────────────────────────────
@@ -210,6 +334,7 @@ class AgentService:
         user_id: int,
         content: str,
         image_paths: Optional[List[str]] = None,
+        idempotency_key: Optional[str] = None,
     ) -> AssistantMessageResponse:
         """
         Agent 推理循环：
@@ -220,7 +345,136 @@ class AgentService:
         5. 解析最终 JSON 响应
         6. 步骤完成时执行归档 + 摘要持久化
         7. 返回 AssistantMessageResponse
+
+        同一会话的回合串行执行；携带 idempotency_key 的重复提交返回首次的回复，不再调用 LLM
         """
+        reply = None
+        async for event, data in self._serialized_turn(
+            db, session_id, user_id, content, image_paths,
+            stream=False, idempotency_key=idempotency_key,
+        ):
+            if event == "message":
+                reply = data
+        return reply
+
+    async def process_message_stream(
+        self,
+        db: Session,
+        session_id: int,
+        user_id: int,
+        content: str,
+        image_paths: Optional[List[str]] = None,
+        idempotency_key: Optional[str] = None,
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        process_message 的流式版本，按推理进度逐个产出 (event, data)：
+          - ("token", {"text": ...})：最终回复 message_text 的增量（工具轮次与强制重试不产出）
+          - ("tool_start", {"id", "name", "arguments"})：开始执行工具
+          - ("tool_end", {"id", "name", "result"})：工具执行完成
+          - ("message", AssistantMessageResponse)：最终回复（最后一个事件）
+        重复提交（相同 idempotency_key）只产出缓存的 message 事件
+        """
+        async for event in self._serialized_turn(
+            db, session_id, user_id, content, image_paths,
+            stream=True, idempotency_key=idempotency_key,
+        ):
+            yield event
+
+    @asynccontextmanager
+    async def _turn_lock(self, session_id: int) -> AsyncIterator[None]:
+        """
+        会话级回合锁：同一会话的消息按到达顺序逐个处理，避免并发回合重复调用 LLM、交错写入 JSONL。
+        锁仅在本进程内有效，无等待者时即释放，不随会话数增长
+        """
+        entry = self._turn_locks.get(session_id)
+        if entry is None:
+            entry = self._turn_locks[session_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._turn_locks.pop(session_id, None)
+
+    @contextmanager
+    def _unit_of_work(self, db: Session, session_id: int):
+        """
+        回合级工作单元：工具只修改内存中的 session.context，由 _finish_turn 统一提交一次。
+        回合异常中断时仍提交已收集的修改（工具写入的客户 / 服务记录已由各自的服务提交），
+        避免 context 与已落库的记录脱节。统计并记录本回合的 commit 次数
+        """
+        commits = 0
+
+        def _count(_session):
+            nonlocal commits
+            commits += 1
+
+        sa_event.listen(db, "after_commit", _count)
+        try:
+            yield
+        except BaseException:
+            if db.new or db.dirty or db.deleted:
+                try:
+                    db.commit()
+                except Exception:
+                    logger.exception(f"[session={session_id}] Failed to flush turn context")
+                    db.rollback()
+            raise
+        finally:
+            sa_event.remove(db, "after_commit", _count)
+            logger.info(f"[session={session_id}] turn commits={commits}")
+            metrics.observe("agent_turn_commits", commits)
+
+    async def _serialized_turn(
+        self,
+        db: Session,
+        session_id: int,
+        user_id: int,
+        content: str,
+        image_paths: Optional[List[str]],
+        stream: bool,
+        idempotency_key: Optional[str] = None,
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        在会话回合锁内执行一轮对话；带 idempotency_key 的重复提交直接返回首次的回复。
+        在锁内检查缓存：与首次请求并发到达的重复提交会等待首次完成后拿到同一回复
+        """
+        async with self._turn_lock(session_id):
+            # 键包含 user_id：其他用户提交相同的会话 ID 与 key 不会命中缓存，而是由 _run_turn 做归属校验
+            cache_key = (user_id, session_id, idempotency_key) if idempotency_key else None
+            if cache_key is not None:
+                cached = self._idempotency_cache.get(cache_key)
+                if cached is not None:
+                    cached_content, reply = cached
+                    if cached_content != content:
+                        raise ValueError("Idempotency-Key has already been used for a different message")
+                    logger.info(f"[session={session_id}] Duplicate submission, returning cached reply")
+                    metrics.inc("agent_idempotent_replays")
+                    yield "message", reply
+                    return
+
+            # 等锁期间其他回合可能已修改会话，丢弃本请求会话中已加载的旧状态
+            db.expire_all()
+            with self._unit_of_work(db, session_id):
+                async for event, data in self._run_turn(
+                    db, session_id, user_id, content, image_paths, stream=stream
+                ):
+                    if event == "message" and cache_key is not None:
+                        self._idempotency_cache.set(cache_key, (content, data))
+                    yield event, data
+
+    async def _run_turn(
+        self,
+        db: Session,
+        session_id: int,
+        user_id: int,
+        content: str,
+        image_paths: Optional[List[str]],
+        stream: bool,
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """单轮对话的推理循环，process_message 与 process_message_stream 共用"""
         # 1. 加载会话
         session = self.get_session(db, session_id, user_id)
         if not session:
@@ -228,33 +482,27 @@ class AgentService:
         if session.status != "active":
             raise ValueError(f"Session {session_id} has ended (status: {session.status})")
 
-        # User manually terminates session
-        if content.strip() in ("终止", "abort", "quit"):
-            self.abandon_session(db, session_id, user_id)
-            return AssistantMessageResponse(
-                content="Session has been terminated. Start a new session to begin a new service.",
-                ui_metadata=UiMetadata(
-                    quick_replies=[],
-                    ui_hint="none",
-                    ui_data=None,
-                    needs_image_upload=False,
-                ),
-                step_complete=False,
-                current_step="done",
-                context={},
-            )
+        # 1a. 确定性快速路径：快捷回复 / 终止指令 / 无需模型判断的步骤推进，不调用 LLM
+        matched = AgentRules.match(session, content, image_paths)
+        if matched is None:
+            metrics.inc("agent_rule_misses")
+        else:
+            metrics.inc("agent_rule_hits", rule=matched.rule)
+            logger.info(f"[session={session_id}] Rule fast path: {matched.rule}")
+            yield "message", self._apply_rule(db, session, user_id, content, matched)
+            return
 
         current_step = session.current_step
+        # 记录推理前的设计 ID，用于事后检测是否新生成了设计（含本轮交付的后台任务结果）
+        _pre_design_id = (session.context or {}).get("design_plan_id")
 
-        # 2. 读取当前步骤历史消息（本地文件）
-        step_messages = self._file_mgr.read_current_step_messages(
-            session_id, current_step
-        )
+        # 1b. 交付已完成的后台任务：结果写回 context，并作为 system 消息追加到当前步骤
+        self._deliver_finished_jobs(db, session)
 
-        # 3. 构建 OpenAI messages
-        system_prompt = self._build_system_prompt(session)
-        openai_messages = [{"role": "system", "content": system_prompt}]
-        openai_messages += self._build_openai_messages(step_messages)
+        # 2-3. 读取当前步骤历史消息（缓存未命中时读取本地文件）并构建 OpenAI messages
+        state = self._load_session_state(db, session)
+        openai_messages = [{"role": "system", "content": state.system_prompt}]
+        openai_messages += state.history
 
         # 4. 追加用户消息
         user_msg_content = content
@@ -267,16 +515,22 @@ class AgentService:
             "role": "user",
             "content": user_msg_content,
         }
-        self._file_mgr.append_message(session_id, user_msg)
+        self._append_message(db, session_id, user_msg)
         openai_messages.append({"role": "user", "content": user_msg_content})
 
         # 5. LLM 推理循环（最多 8 轮，处理 tool_calls）
-        # 记录推理前的设计 ID，用于事后检测是否新生成了设计
-        _pre_design_id = (session.context or {}).get("design_plan_id")
-
         max_rounds = 8
+        response: dict = {"content": None}
+        turn_prompt_tokens = 0
+        llm_calls: List[dict] = []
         for round_idx in range(max_rounds):
-            response = await self._call_llm(openai_messages, with_tools=True)
+            async for event, data in self._complete(openai_messages, stream, current_step):
+                if event == "result":
+                    response = data
+                    turn_prompt_tokens += data.get("prompt_tokens", 0)
+                    llm_calls.append(data["llm"])
+                else:
+                    yield event, data
 
             # 检查是否有 tool_calls
             tool_calls = response.get("tool_calls")
@@ -288,6 +542,7 @@ class AgentService:
                 _needs_tool = (
                     round_idx == 0
                     and not (session.context or {}).get("design_plan_id")
+                    and not (session.context or {}).get("pending_job_ids")
                     and any(kw in content_text for kw in _intent_keywords)
                 )
                 if _needs_tool:
@@ -299,7 +554,14 @@ class AgentService:
                         "role": "user",
                         "content": "Please call the tool immediately. Do not output any text.",
                     })
-                    response = await self._call_llm(openai_messages, with_tools=True, force_tool=True)
+                    # 强制调用工具的轮次不是最终回复，不转发 token
+                    async for event, data in self._complete(
+                        openai_messages, stream, current_step, force_tool=True
+                    ):
+                        if event == "result":
+                            response = data
+                            turn_prompt_tokens += data.get("prompt_tokens", 0)
+                            llm_calls.append(data["llm"])
                     tool_calls = response.get("tool_calls")
                     if not tool_calls:
                         logger.error(f"[session={session_id}] Still no tool call after forced retry, giving up")
@@ -318,42 +580,62 @@ class AgentService:
                 "role": "assistant",
                 "tool_calls": tool_calls,
             }
-            self._file_mgr.append_message(session_id, assistant_with_tools)
+            self._append_message(db, session_id, assistant_with_tools)
             openai_messages.append({
                 "role": "assistant",
                 "content": response.get("content"),  # 必须原样传回，即使为 None
                 "tool_calls": tool_calls,
             })
 
-            # b. 执行每个 tool，追加 tool result
+            # b. 执行 tool（相邻只读工具并发），按原顺序追加 tool result
+            parsed_calls = []
             for tc in tool_calls:
-                tool_name = tc["function"]["name"]
                 try:
                     tool_args = json.loads(tc["function"]["arguments"] or "{}")
                 except (json.JSONDecodeError, TypeError):
                     tool_args = {}
+                parsed_calls.append((tc["function"]["name"], tool_args))
+
+            for batch in self._tools.schedule([name for name, _ in parsed_calls]):
+                for idx in batch:
+                    tool_name, tool_args = parsed_calls[idx]
+                    yield "tool_start", {
+                        "id": tool_calls[idx]["id"], "name": tool_name, "arguments": tool_args,
+                    }
+                    logger.info(f"Executing tool: {tool_name}, args: {tool_args}")
 
-                logger.info(f"Executing tool: {tool_name}, args: {tool_args}")
-                tool_result = await self._tools.execute(
-                    tool_name, tool_args, db, user_id, session
+                results = await self._tools.execute_batch(
+                    [parsed_calls[idx] for idx in batch], db, user_id, session
                 )
-                logger.info(f"Tool result: {tool_result[:200]}")
 
-                tool_result_msg = {
-                    "step": current_step,
-                    "archived": False,
-                    "role": "tool",
-                    "tool_call_id": tc["id"],
-                    "name": tool_name,
-                    "content": tool_result,
-                }
-                self._file_mgr.append_message(session_id, tool_result_msg)
-                openai_messages.append({
-                    "role": "tool",
-                    "tool_call_id": tc["id"],
-                    "name": tool_name,
-                    "content": tool_result,
-                })
+                for idx, tool_result in zip(batch, results):
+                    tc = tool_calls[idx]
+                    tool_name = parsed_calls[idx][0]
+                    logger.info(f"Tool result: {tool_result[:200]}")
+
+                    tool_result_msg = {
+                        "step": current_step,
+                        "archived": False,
+                        "role": "tool",
+                        "tool_call_id": tc["id"],
+                        "name": tool_name,
+                        "content": tool_result,
+                    }
+                    self._append_message(db, session_id, tool_result_msg)
+                    openai_messages.append({
+                        "role": "tool",
+                        "tool_call_id": tc["id"],
+                        "name": tool_name,
+                        "content": tool_result,
+                    })
+                    yield "tool_end", {
+                        "id": tc["id"], "name": tool_name, "result": tool_result,
+                    }
+
+        logger.info(
+            f"[session={session_id}] turn prompt tokens={turn_prompt_tokens} rounds={round_idx + 1}"
+        )
+        metrics.observe("agent_turn_prompt_tokens", turn_prompt_tokens, step=current_step)
 
         # 6. 解析最终文本回复
         final_content = response.get("content") or ""
@@ -394,6 +676,124 @@ class AgentService:
                 needs_image_upload=False,
             )
 
+        # 7-9. 写入最终消息（附带本轮 LLM 调用记录，用于延迟分析）并推进步骤
+        yield "message", self._finish_turn(
+            db, session, current_step, llm_resp,
+            extra={"llm": {"calls": llm_calls, "prompt_tokens": turn_prompt_tokens}},
+        )
+
+    async def handle_image_upload(
+        self,
+        db: Session,
+        session_id: int,
+        user_id: int,
+        saved_path: str,
+        purpose: str,
+    ) -> AssistantMessageResponse:
+        """
+        处理图片上传：
+        1. 生成图片描述（按内容哈希缓存，同一张图只调用一次视觉模型）
+        2. 更新 session.context（inspiration_paths 或 actual_image_path，以及 image_captions）
+        3. 写入 system 说明消息（含图片描述）到消息存储
+        4. 触发 process_message 获取 LLM 响应
+        """
+        # 描述不依赖会话状态，在会话锁外生成，避免阻塞同一会话的其他请求
+        caption = await ImageCaptionService.describe(saved_path)
+
+        # 上传说明与随后的 LLM 回合在同一把会话锁内完成，避免与并发消息交错
+        async with self._turn_lock(session_id):
+            db.expire_all()
+            session = self.get_session(db, session_id, user_id)
+            if not session:
+                raise ValueError(f"Session {session_id} not found")
+
+            ctx = dict(session.context or {})
+            if purpose == "inspiration":
+                paths = list(ctx.get("inspiration_paths", []))
+                paths.append(saved_path)
+                ctx["inspiration_paths"] = paths
+            elif purpose == "actual":
+                ctx["actual_image_path"] = saved_path
+            if caption:
+                captions = dict(ctx.get("image_captions") or {})
+                captions[saved_path] = caption
+                ctx["image_captions"] = captions
+
+            session.context = ctx
+
+            # Write system notice to tell LLM that image was uploaded
+            notice = f"[User uploaded a {purpose} image, path: {saved_path}]"
+            if caption:
+                notice += f"\nImage description: {caption}"
+            system_notice = {
+                "step": session.current_step,
+                "archived": False,
+                "role": "system",
+                "content": notice,
+            }
+            self._append_message(db, session_id, system_notice)
+
+            # Trigger LLM response
+            upload_msg = (
+                f"I uploaded a {'reference/inspiration image' if purpose == 'inspiration' else 'actual completed photo'}."
+            )
+            reply = None
+            with self._unit_of_work(db, session_id):
+                async for event, data in self._run_turn(
+                    db, session_id, user_id, upload_msg, [saved_path], stream=False
+                ):
+                    if event == "message":
+                        reply = data
+            return reply
+
+    # ── 私有：回合收尾 ────────────────────────────────────────────────────
+
+    def _apply_rule(
+        self,
+        db: Session,
+        session: ConversationSession,
+        user_id: int,
+        content: str,
+        matched: RuleMatch,
+    ) -> AssistantMessageResponse:
+        """执行命中的规则：终止会话，或写入用户消息与本地生成的回复"""
+        if matched.abandon:
+            self.abandon_session(db, session.id, user_id)
+            return AssistantMessageResponse(
+                content="Session has been terminated. Start a new session to begin a new service.",
+                ui_metadata=UiMetadata(
+                    quick_replies=[],
+                    ui_hint="none",
+                    ui_data=None,
+                    needs_image_upload=False,
+                ),
+                step_complete=False,
+                current_step="done",
+                context={},
+            )
+
+        current_step = session.current_step
+        self._append_message(db, session.id, {
+            "step": current_step,
+            "archived": False,
+            "role": "user",
+            "content": content,
+        })
+        return self._finish_turn(
+            db, session, current_step, matched.response, extra={"rule": matched.rule}
+        )
+
+    def _finish_turn(
+        self,
+        db: Session,
+        session: ConversationSession,
+        current_step: str,
+        llm_resp: LLMResponse,
+        extra: Optional[dict] = None,
+    ) -> AssistantMessageResponse:
+        """写入助理最终消息、更新步骤摘要、处理步骤推进并提交，LLM 路径与规则快速路径共用"""
+        session_id = session.id
+
         # 7. 将助理最终消息写入本地文件
         assistant_final = {
             "step": current_step,
@@ -406,8 +806,9 @@ class AgentService:
                 "ui_data": llm_resp.ui_data,
                 "needs_image_upload": llm_resp.needs_image_upload,
             },
+            **(extra or {}),
         }
-        self._file_mgr.append_message(session_id, assistant_final)
+        self._append_message(db, session_id, assistant_final)
 
         # 8. 更新 DB 中的步骤摘要（每次都更新最新摘要）
         summaries = list(session.step_summaries or [])
@@ -426,16 +827,17 @@ class AgentService:
 
         # 9. 步骤完成处理
         if llm_resp.step_complete:
-            # 归档当前步骤消息（本地文件）
-            self._file_mgr.archive_step(session_id, current_step)
-
             # 推进到下一步
             next_step = self._next_step(current_step)
+
+            # 归档当前步骤消息（本地文件）
+            self._archive_step(db, session_id, current_step, next_step)
             session.current_step = next_step
 
             if next_step == "done":
                 session.status = "completed"
                 session.completed_at = datetime.datetime.utcnow()
+                self._session_cache.pop(session_id)
 
         db.commit()
 
@@ -452,80 +854,242 @@ class AgentService:
             context=dict(session.context or {}),
         )
 
-    async def handle_image_upload(
-        self,
-        db: Session,
-        session_id: int,
-        user_id: int,
-        saved_path: str,
-        purpose: str,
-    ) -> AssistantMessageResponse:
-        """
-        处理图片上传：
-        1. 更新 session.context（inspiration_paths 或 actual_image_path）
-        2. 写入 system 说明消息到本地文件
-        3. 触发 process_message 获取 LLM 响应
-        """
-        session = self.get_session(db, session_id, user_id)
-        if not session:
-            raise ValueError(f"Session {session_id} not found")
+    # ── 私有：会话状态缓存 ────────────────────────────────────────────────
 
+    def _deliver_finished_jobs(self, db: Session, session: ConversationSession) -> None:
+        """读入本会话已完成但尚未交付的后台任务结果（随本轮 db.commit 一起标记为已交付）"""
+        jobs = JobService.take_finished(db, session.id)
+        if not jobs:
+            return
         ctx = dict(session.context or {})
-        if purpose == "inspiration":
-            paths = list(ctx.get("inspiration_paths", []))
-            paths.append(saved_path)
-            ctx["inspiration_paths"] = paths
-        elif purpose == "actual":
-            ctx["actual_image_path"] = saved_path
-
+        delivered = {job.id for job in jobs}
+        for job in jobs:
+            result = job.result or {}
+            ctx.update(result.get("context") or {})
+            self._append_message(db, session.id, {
+                "step": session.current_step,
+                "archived": False,
+                "role": "system",
+                "job_id": job.id,
+                "content": (
+                    f"[Background job {job.id} ({job.kind}) {job.status}] "
+                    f"{result.get('content', '')}"
+                ),
+            })
+            logger.info(f"[session={session.id}] Delivered background job {job.id} ({job.status})")
+        pending = [jid for jid in ctx.get("pending_job_ids", []) if jid not in delivered]
+        if pending:
+            ctx["pending_job_ids"] = pending
+        else:
+            ctx.pop("pending_job_ids", None)
         session.context = ctx
-        db.commit()
 
-        # Write system notice to tell LLM that image was uploaded
-        system_notice = {
-            "step": session.current_step,
-            "archived": False,
-            "role": "system",
-            "content": f"[User uploaded a {purpose} image, path: {saved_path}]",
-        }
-        self._file_mgr.append_message(session_id, system_notice)
+    def _load_session_state(self, db: Session, session: ConversationSession) -> _SessionState:
+        """
+        获取会话状态：缓存条目的步骤与存储版本均与当前一致时直接复用，否则从消息存储重建；
+        系统提示词仅在步骤/上下文/摘要变化时重建
+        """
+        state = self._session_cache.get(session.id)
+        log_size = self._store.get_log_size(session.id, db=db)
+        if (
+            state is None
+            or state.current_step != session.current_step
+            or state.log_size != log_size
+        ):
+            step_messages = self._store.read_current_step_messages(
+                session.id, session.current_step, db=db
+            )
+            state = _SessionState(
+                current_step=session.current_step,
+                log_size=log_size,
+                history=self._build_openai_messages(step_messages),
+            )
 
-        # Trigger LLM response
-        upload_msg = (
-            f"I uploaded a {'reference/inspiration image' if purpose == 'inspiration' else 'actual completed photo'}."
-        )
-        return await self.process_message(
-            db, session_id, user_id, upload_msg, image_paths=[saved_path]
+        prompt_inputs = (
+            session.current_step,
+            session.context or {},
+            session.step_summaries or [],
         )
+        if state.prompt_inputs != prompt_inputs:
+            state.system_prompt = self._build_system_prompt(session)
+            state.prompt_inputs = copy.deepcopy(prompt_inputs)
+            state.context = dict(session.context or {})
+
+        self._session_cache.set(session.id, state)
+        return state
+
+    def _append_message(self, db: Session, session_id: int, message: dict) -> None:
+        """写入消息存储，并同步追加到缓存的会话历史（写穿）"""
+        span = self._store.append_message(session_id, message, db=db)
+        state = self._session_cache.get(session_id)
+        if state is None:
+            return
+        if (
+            span is None
+            or span[0] != state.log_size
+            or message.get("step") != state.current_step
+        ):
+            # 写入失败或期间有其他写入者，缓存不再可信
+            self._session_cache.pop(session_id)
+            return
+        state.history.extend(self._build_openai_messages([message]))
+        state.log_size = span[1]
+
+    def _archive_step(self, db: Session, session_id: int, step_name: str, next_step: str) -> None:
+        """归档步骤，并将缓存切换到下一步骤的空历史"""
+        span = self._store.archive_step(session_id, step_name, db=db)
+        state = self._session_cache.get(session_id)
+        if state is None:
+            return
+        if span is None or span[0] != state.log_size:
+            self._session_cache.pop(session_id)
+            return
+        state.current_step = next_step
+        state.history = []
+        state.log_size = span[1]
+        state.prompt_inputs = None
 
     # ── 私有：LLM 调用 ────────────────────────────────────────────────────
 
-    async def _call_llm(
-        self, openai_messages: List[dict], with_tools: bool = True,
-        force_tool: bool = False
-    ) -> dict:
-        """调用 OpenAI Chat Completions API，返回 message 字典"""
+    async def _complete(
+        self, openai_messages: List[dict], stream: bool, step: Optional[str] = None,
+        with_tools: bool = True, force_tool: bool = False
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        统一的 LLM 调用入口：流式模式下先逐个产出 ("token", ...)，
+        两种模式最后都产出 ("result", message 字典)
+        """
+        if not stream:
+            yield "result", await self._call_llm(
+                openai_messages, step=step, with_tools=with_tools, force_tool=force_tool
+            )
+            return
+        async for event in self._call_llm_stream(
+            openai_messages, step=step, with_tools=with_tools, force_tool=force_tool
+        ):
+            yield event
+
+    def _resolve_model(self, name: str) -> str:
+        """将模型别名 default / fast 解析为当前 provider 的具体模型"""
+        return {"default": self._model, "fast": self._fast_model}.get(name, name)
+
+    def _budget_for(self, model: str) -> PromptBudget:
+        budget = self._budgets.get(model)
+        if budget is None:
+            budget = self._budgets[model] = PromptBudget(
+                settings.prompt_token_budget(model),
+                max_field_chars=settings.AGENT_TOOL_RESULT_MAX_FIELD_CHARS,
+                max_list_items=settings.AGENT_TOOL_RESULT_MAX_LIST_ITEMS,
+            )
+        return budget
+
+    async def _create(
+        self, openai_messages: List[dict], step: Optional[str],
+        with_tools: bool, force_tool: bool, stream: bool = False
+    ) -> Tuple[Any, int, dict]:
+        """
+        按步骤路由模型并在延迟预算内调用 Chat Completions；超时后改用降级模型重试一次。
+        降级模型与步骤模型相同时重发同一请求没有意义，不设延迟预算，直接等待到 AGENT_LLM_TIMEOUT_SECONDS。
+        返回 (响应, prompt token 数, 调用信息 {model, latency_ms, fallback})。
+        流式调用的预算覆盖到服务端开始返回（create 返回）为止
+        """
+        model = self._resolve_model(settings.agent_step_model(step))
+        fallback_model = self._resolve_model(settings.AGENT_FALLBACK_MODEL)
+        if fallback_model == model:
+            timeout = settings.AGENT_LLM_TIMEOUT_SECONDS
+        else:
+            timeout = settings.agent_step_timeout(step)
+        started = time.monotonic()
+        fallback = False
+        kwargs, prompt_tokens = self._llm_kwargs(
+            openai_messages, model, step, with_tools, force_tool
+        )
+        if stream:
+            kwargs["stream"] = True
+        try:
+            response = await asyncio.wait_for(
+                self._llm.chat.completions.create(**kwargs), timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            if fallback_model == model:
+                raise
+            logger.warning(
+                f"[LLM] step={step} model={model} exceeded {timeout:g}s budget, "
+                f"falling back to {fallback_model}"
+            )
+            metrics.inc("agent_llm_fallbacks", step=step, model=model)
+            model, fallback = fallback_model, True
+            kwargs, prompt_tokens = self._llm_kwargs(
+                openai_messages, model, step, with_tools, force_tool
+            )
+            if stream:
+                kwargs["stream"] = True
+            response = await asyncio.wait_for(
+                self._llm.chat.completions.create(**kwargs),
+                timeout=settings.AGENT_LLM_TIMEOUT_SECONDS,
+            )
+        latency_ms = int((time.monotonic() - started) * 1000)
+        metrics.observe("agent_llm_latency_ms", latency_ms, step=step, model=model)
+        return response, prompt_tokens, {
+            "model": model, "latency_ms": latency_ms, "fallback": fallback,
+        }
+
+    def _llm_kwargs(
+        self, openai_messages: List[dict], model: str, step: Optional[str],
+        with_tools: bool, force_tool: bool
+    ) -> Tuple[dict, int]:
+        """
+        构建 Chat Completions 请求参数，同时返回估算的 prompt token 数：
+        只携带当前步骤开放的工具；消息按 token 预算收缩（原列表不变）
+        """
+        step_tools = get_step_tools(step) if with_tools else None
+        tools_tokens = _schema_tokens(step_tools.schema_json) if step_tools else 0
+        messages, report = self._budget_for(model).fit(openai_messages, tools_tokens)
         kwargs = {
-            "model": self._model,
-            "messages": openai_messages,
+            "model": model,
+            "messages": messages,
             "temperature": 0.7,
         }
-        if with_tools:
-            kwargs["tools"] = TOOLS_DEFINITION
+        if step_tools and step_tools.definitions:
+            kwargs["tools"] = step_tools.definitions
             kwargs["tool_choice"] = "required" if force_tool else "auto"
 
+        metrics.observe("agent_prompt_tokens", report.tokens_after, model=model)
+        if report.tokens_after != report.tokens_before:
+            metrics.inc("agent_prompt_budget_applied", model=model)
+            logger.info(
+                "[LLM budget] tokens %d -> %d (budget=%d, trimmed=%d, compacted=%d, dropped=%d)",
+                report.tokens_before, report.tokens_after, report.budget,
+                report.trimmed_fields, report.compacted_tool_results, report.dropped_messages,
+            )
+        if report.over_budget:
+            logger.warning(
+                "[LLM budget] prompt still exceeds budget after trimming: %d > %d",
+                report.tokens_after, report.budget,
+            )
+
         logger.info(
-            "[LLM input] model=%s messages=%s",
+            "[LLM input] model=%s tokens=%d messages=%s",
             kwargs["model"],
-            json.dumps(openai_messages, ensure_ascii=False),
+            report.tokens_after,
+            json.dumps(messages, ensure_ascii=False),
+        )
+        return kwargs, report.tokens_after
+
+    async def _call_llm(
+        self, openai_messages: List[dict], step: Optional[str] = None,
+        with_tools: bool = True, force_tool: bool = False
+    ) -> dict:
+        """调用 OpenAI Chat Completions API，返回 message 字典"""
+        response, prompt_tokens, call = await self._create(
+            openai_messages, step, with_tools, force_tool
         )
-        response = await self._llm.chat.completions.create(**kwargs)
         if not response.choices:
             logger.warning("LLM returned empty choices, treating as empty response")
-            return {"content": None}
+            return {"content": None, "prompt_tokens": prompt_tokens, "llm": call}
         msg = response.choices[0].message
 
-        result = {"content": msg.content}
+        result = {"content": msg.content, "prompt_tokens": prompt_tokens, "llm": call}
         if msg.tool_calls:
             result["tool_calls"] = [
                 {
@@ -540,6 +1104,56 @@ class AgentService:
             ]
         return result
 
+    async def _call_llm_stream(
+        self, openai_messages: List[dict], step: Optional[str] = None,
+        with_tools: bool = True, force_tool: bool = False
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        以 stream=True 调用 Chat Completions API：
+        文本增量中 message_text 的值即时产出 ("token", {"text": ...})（出现 tool_calls 的轮次不再产出），
+        tool_calls 增量按 index 拼接，结束时产出与 _call_llm 相同结构的 ("result", message 字典)
+        """
+        response, prompt_tokens, call = await self._create(
+            openai_messages, step, with_tools, force_tool, stream=True
+        )
+
+        content_parts: List[str] = []
+        tool_calls: dict = {}
+        message_text = _MessageTextStream()
+        async for chunk in response:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+                text = message_text.feed(delta.content)
+                if text and not tool_calls:
+                    yield "token", {"text": text}
+            for tc_delta in delta.tool_calls or []:
+                tc = tool_calls.setdefault(tc_delta.index, {
+                    "id": "",
+                    "type": "function",
+                    "function": {"name": "", "arguments": ""},
+                })
+                if tc_delta.id:
+                    tc["id"] = tc_delta.id
+                if tc_delta.type:
+                    tc["type"] = tc_delta.type
+                if tc_delta.function:
+                    if tc_delta.function.name:
+                        tc["function"]["name"] += tc_delta.function.name
+                    if tc_delta.function.arguments:
+                        tc["function"]["arguments"] += tc_delta.function.arguments
+
+        result = {
+            "content": "".join(content_parts) or None,
+            "prompt_tokens": prompt_tokens,
+            "llm": call,
+        }
+        if tool_calls:
+            result["tool_calls"] = [tool_calls[idx] for idx in sorted(tool_calls)]
+        yield "result", result
+
     def _build_system_prompt(self, session: ConversationSession) -> str:
         """构建系统提示词：基础提示 + 历史步骤摘要"""
         summaries = session.step_summaries or []
@@ -566,8 +1180,20 @@ class AgentService:
             context_parts.append(f"Service Record ID: {ctx['service_record_id']}")
         if ctx.get("comparison_result_id"):
             context_parts.append(f"Analysis Result ID: {ctx['comparison_result_id']}")
+        captions = ctx.get("image_captions") or {}
+        for path in ctx.get("inspiration_paths", []):
+            if path in captions:
+                context_parts.append(f"Inspiration image {path}: {captions[path]}")
         if ctx.get("actual_image_path"):
-            context_parts.append(f"Actual photo: {ctx['actual_image_path']}")
+            path = ctx["actual_image_path"]
+            line = f"Actual photo: {path}"
+            if path in captions:
+                line += f" ({captions[path]})"
+            context_parts.append(line)
+        if ctx.get("pending_job_ids"):
+            context_parts.append(
+                f"Background jobs in progress: {', '.join(str(j) for j in ctx['pending_job_ids'])}"
+            )
 
         context_section = (
             "\n".join(context_parts) if context_parts else "(no business data yet)"
@@ -2,11 +2,17 @@
 AI Agent Tool Registry
 Wraps existing business Service methods as OpenAI Function Calling format tools.
 """
+import asyncio
+import inspect
 import json
 import logging
 from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
+from app.db.database import open_session, shares_connection
+from app.models.agent_job import AgentJob
 from app.models.conversation_session import ConversationSession
 from app.models.inspiration_image import InspirationImage
 from app.services.customer_service import CustomerService
@@ -14,6 +20,7 @@ from app.services.design_service import DesignService
 from app.services.service_record_service import ServiceRecordService
 from app.services.analysis_service import AnalysisService
 from app.services.ability_service import AbilityService
+from app.services.job_service import JobService
 from app.schemas.customer import CustomerCreate, CustomerUpdate
 from app.schemas.design import DesignGenerateRequest, DesignRefineRequest
 
@@ -247,6 +254,84 @@ TOOLS_DEFINITION = [
 ]
 
 
+# ── 按步骤开放的工具 ────────────────────────────────────────────────────────
+# 与 agent_service.STEP_FLOW 对齐：每次请求只携带当前步骤可用的工具定义，
+# 减少 schema token，也避免 LLM 在错误的步骤调用写入类工具
+
+STEP_TOOLS: Dict[str, Tuple[str, ...]] = {
+    "collect": (
+        "search_customer", "get_customer_detail", "list_inspirations",
+        "generate_design", "refine_design",
+    ),
+    "confirm": (
+        "search_customer", "create_customer", "get_customer_detail",
+        "create_service_record", "complete_service",
+    ),
+    "analysis": ("run_analysis",),
+    "review": ("get_ability_summary",),
+}
+
+
+class StepTools(NamedTuple):
+    """某一步骤的工具定义（预先筛选并序列化，供请求与 token 估算复用）"""
+    names: frozenset
+    definitions: List[dict]
+    schema_json: str
+
+
+def _build_step_tools(names) -> StepTools:
+    definitions = [t for t in TOOLS_DEFINITION if t["function"]["name"] in names]
+    return StepTools(
+        names=frozenset(t["function"]["name"] for t in definitions),
+        definitions=definitions,
+        schema_json=json.dumps(definitions, ensure_ascii=False) if definitions else "",
+    )
+
+
+_ALL_TOOLS = _build_step_tools({t["function"]["name"] for t in TOOLS_DEFINITION})
+_STEP_TOOLS_CACHE: Dict[str, StepTools] = {
+    step: _build_step_tools(names) for step, names in STEP_TOOLS.items()
+}
+
+
+def get_step_tools(step: str) -> StepTools:
+    """返回步骤可用的工具；未登记的步骤开放全部工具"""
+    return _STEP_TOOLS_CACHE.get(step, _ALL_TOOLS)
+
+
+# ── 工具副作用分类 ──────────────────────────────────────────────────────────
+# read:  只查询数据、不修改 session.context，实现为同步函数；同一轮内相邻的 read 工具
+#        各自在工作线程中使用独立的数据库会话并行执行（SQLite StaticPool 共用连接时仍顺序执行）
+# write: 创建/修改业务数据、修改 session.context 或依赖前序写入结果，按 LLM 给出的顺序串行执行
+#        （search_customer 唯一命中时会回填 customer_id，多次搜索以最后一次为准，因此按 write 处理）
+# 未登记的工具一律按 write 处理
+
+TOOL_SIDE_EFFECTS = {
+    "search_customer": "write",
+    "get_customer_detail": "read",
+    "get_ability_summary": "read",
+    "list_inspirations": "read",
+    "create_customer": "write",
+    "generate_design": "write",
+    "refine_design": "write",
+    "create_service_record": "write",
+    "complete_service": "write",
+    "run_analysis": "write",
+}
+
+
+# ── 后台执行的耗时工具 ──────────────────────────────────────────────────────
+# 开启 AGENT_BACKGROUND_TOOLS 时，这些工具入队为后台任务并立即返回任务句柄；
+# 任务完成后由 AgentService 在下一轮对话开始时读入结果并写回 session.context
+# 工具名 -> ToolExecutor 上的实现方法（签名: db, user_id, ctx, **args -> (结果 JSON, context 更新)）
+
+BACKGROUND_TOOLS = {
+    "generate_design": "_generate_design",
+    "refine_design": "_refine_design",
+    "run_analysis": "_run_analysis",
+}
+
+
 # ── 工具执行器 ──────────────────────────────────────────────────────────────
 
 class ToolExecutor:
@@ -255,32 +340,148 @@ class ToolExecutor:
     If new business IDs are produced after execution, updates session.context and persists to DB.
     """
 
-    async def execute(
+    @staticmethod
+    def is_read_only(tool_name: str) -> bool:
+        return TOOL_SIDE_EFFECTS.get(tool_name) == "read"
+
+    @staticmethod
+    def schedule(tool_names: List[str]) -> List[List[int]]:
+        """
+        将一轮内的工具调用划分为顺序执行的批次（返回下标分组）：
+        相邻的只读工具合并为一批并行执行，写工具单独成批，批次之间保持原有顺序
+        """
+        batches: List[List[int]] = []
+        for idx, name in enumerate(tool_names):
+            if (
+                ToolExecutor.is_read_only(name)
+                and batches
+                and ToolExecutor.is_read_only(tool_names[batches[-1][-1]])
+            ):
+                batches[-1].append(idx)
+            else:
+                batches.append([idx])
+        return batches
+
+    async def execute_batch(
         self,
-        tool_name: str,
-        tool_args: dict,
+        calls: List[Tuple[str, dict]],
         db: Session,
         user_id: int,
         session: ConversationSession
-    ) -> str:
-        """Execute tool, return LLM-friendly JSON string"""
+    ) -> List[str]:
+        """
+        执行一批工具调用 [(tool_name, tool_args), ...]，结果按输入顺序返回。
+        多个只读工具在工作线程中各用独立的数据库会话并行执行（同一 Session 不能并发使用）；
+        所有会话共用一个连接时（SQLite StaticPool）不能跨线程并发，仍通过 execute 顺序执行
+        """
+        if (
+            len(calls) == 1
+            or not all(self.is_read_only(name) for name, _ in calls)
+            or shares_connection()
+        ):
+            return [
+                await self.execute(tool_name, tool_args, db, user_id, session)
+                for tool_name, tool_args in calls
+            ]
+        step = session.current_step
+        return list(await asyncio.gather(*(
+            asyncio.to_thread(self._execute_read, tool_name, tool_args, user_id, step)
+            for tool_name, tool_args in calls
+        )))
+
+    def _execute_read(self, tool_name: str, tool_args: dict, user_id: int, step: str) -> str:
+        """在工作线程中用独立会话执行只读工具（只读工具不使用 session 参数）"""
+        handler, error = self._resolve(tool_name, step)
+        if error:
+            return error
+        db = open_session()
+        try:
+            return handler(db=db, user_id=user_id, session=None, **tool_args)
+        except Exception as e:
+            return self._error_result(tool_name, e)
+        finally:
+            db.close()
+
+    def _resolve(self, tool_name: str, step: str) -> Tuple[Optional[Callable], Optional[str]]:
+        """返回 (工具实现, None)，工具不存在或当前步骤不可用时返回 (None, 错误 JSON)"""
         handler = getattr(self, f"_tool_{tool_name}", None)
         if not handler:
-            return json.dumps(
+            return None, json.dumps(
                 {"error": f"Unknown tool: {tool_name}"},
                 ensure_ascii=False
             )
-        try:
-            return await handler(
-                db=db, user_id=user_id, session=session, **tool_args
-            )
-        except Exception as e:
-            logger.error(f"Tool execution failed {tool_name}: {e}", exc_info=True)
-            detail = getattr(e, "detail", None) or str(e)
-            return json.dumps(
-                {"error": f"Tool execution failed: {detail}"},
+        if tool_name not in get_step_tools(step).names:
+            return None, json.dumps(
+                {"error": f"Tool {tool_name} is not available in the {step} step"},
                 ensure_ascii=False
             )
+        return handler, None
+
+    @staticmethod
+    def _error_result(tool_name: str, e: Exception) -> str:
+        logger.error(f"Tool execution failed {tool_name}: {e}", exc_info=True)
+        detail = getattr(e, "detail", None) or str(e)
+        return json.dumps(
+            {"error": f"Tool execution failed: {detail}"},
+            ensure_ascii=False
+        )
+
+    async def execute(
+        self,
+        tool_name: str,
+        tool_args: dict,
+        db: Session,
+        user_id: int,
+        session: ConversationSession
+    ) -> str:
+        """Execute tool, return LLM-friendly JSON string"""
+        handler, error = self._resolve(tool_name, session.current_step)
+        if error:
+            return error
+        try:
+            if settings.AGENT_BACKGROUND_TOOLS and tool_name in BACKGROUND_TOOLS:
+                return self._enqueue_background(tool_name, tool_args, db, user_id, session)
+            result = handler(db=db, user_id=user_id, session=session, **tool_args)
+            # 只读工具为同步实现
+            return await result if inspect.isawaitable(result) else result
+        except Exception as e:
+            return self._error_result(tool_name, e)
+
+    def _enqueue_background(
+        self,
+        tool_name: str,
+        tool_args: dict,
+        db: Session,
+        user_id: int,
+        session: ConversationSession
+    ) -> str:
+        """将耗时工具入队为后台任务，返回任务句柄"""
+        ctx = dict(session.context or {})
+        # 参数不匹配时立即报错，而不是等到任务执行失败
+        inspect.signature(getattr(self, BACKGROUND_TOOLS[tool_name])).bind(
+            db, user_id, ctx, **tool_args
+        )
+        job = JobService.enqueue(
+            db, user_id, tool_name,
+            {"args": tool_args, "context": ctx},
+            session_id=session.id,
+        )
+        self._update_context(db, session, {
+            "pending_job_ids": list(ctx.get("pending_job_ids", [])) + [job.id],
+        })
+        return json.dumps({
+            "result": "Started in the background",
+            "job_id": job.id,
+            "status": job.status,
+            "note": "The result will be delivered on the next turn; tell the user it is in progress.",
+        }, ensure_ascii=False)
+
+    @staticmethod
+    def _update_context(db: Session, session: ConversationSession, updates: dict) -> None:
+        ctx = dict(session.context or {})
+        ctx.update(updates)
+        # 只修改内存中的 context，由 AgentService 在回合结束时统一提交
+        session.context = ctx
 
     async def _tool_search_customer(self, db, user_id, session, query):
         customers, total = CustomerService.list_customers(
@@ -305,7 +506,6 @@ class ToolExecutor:
             ctx["customer_id"] = customers[0].id
             ctx["customer_name"] = customers[0].name
             session.context = ctx
-            db.commit()
         return json.dumps(
             {"result": "Found the following customers", "total": total, "customers": data},
             ensure_ascii=False
@@ -325,7 +525,6 @@ class ToolExecutor:
         ctx["customer_id"] = customer.id
         ctx["customer_name"] = customer.name
         session.context = ctx
-        db.commit()
         return json.dumps({
             "result": "Customer created successfully",
             "customer_id": customer.id,
@@ -333,7 +532,7 @@ class ToolExecutor:
             "phone": customer.phone
         }, ensure_ascii=False)
 
-    async def _tool_get_customer_detail(self, db, user_id, session, customer_id):
+    def _tool_get_customer_detail(self, db, user_id, session, customer_id):
         customer = CustomerService.get_customer_by_id(db, customer_id, user_id)
         if not customer:
             return json.dumps(
@@ -360,10 +559,16 @@ class ToolExecutor:
             "profile": profile_data
         }, ensure_ascii=False)
 
-    async def _tool_generate_design(self, db, user_id, session, prompt,
-                                    customer_id=None, reference_images=None,
-                                    style_keywords=None, design_target="10nails"):
-        ctx = dict(session.context or {})
+    async def _tool_generate_design(self, db, user_id, session, **args):
+        content, updates = await self._generate_design(
+            db, user_id, dict(session.context or {}), **args
+        )
+        self._update_context(db, session, updates)
+        return content
+
+    async def _generate_design(self, db, user_id, ctx, prompt,
+                               customer_id=None, reference_images=None,
+                               style_keywords=None, design_target="10nails"):
         effective_customer_id = customer_id or ctx.get("customer_id")
         effective_refs = reference_images or ctx.get("inspiration_paths", [])
 
@@ -376,41 +581,45 @@ class ToolExecutor:
         )
         design = await DesignService.generate_design(db, req, user_id)
 
-        # 更新 session.context
-        ctx["design_plan_id"] = design.id
-        ctx["design_image_url"] = design.generated_image_path
-        session.context = ctx
-        db.commit()
-
-        return json.dumps({
+        content = json.dumps({
             "result": "Design generated successfully",
             "design_id": design.id,
             "image_url": design.generated_image_path,
             "estimated_duration": design.estimated_duration,
             "difficulty_level": design.difficulty_level,
-            "estimated_materials": design.estimated_materials
+            "estimated_materials": design.estimated_materials,
+            "estimation_status": design.estimation_status
         }, ensure_ascii=False)
+        return content, {
+            "design_plan_id": design.id,
+            "design_image_url": design.generated_image_path,
+        }
+
+    async def _tool_refine_design(self, db, user_id, session, **args):
+        content, updates = await self._refine_design(
+            db, user_id, dict(session.context or {}), **args
+        )
+        self._update_context(db, session, updates)
+        return content
 
-    async def _tool_refine_design(self, db, user_id, session, design_id, instruction):
+    async def _refine_design(self, db, user_id, ctx, design_id, instruction):
         from app.schemas.design import DesignRefineRequest
         req = DesignRefineRequest(refinement_instruction=instruction)
         new_design = await DesignService.refine_design(db, design_id, req, user_id)
 
-        # 更新 session.context
-        ctx = dict(session.context or {})
-        ctx["design_plan_id"] = new_design.id
-        ctx["design_image_url"] = new_design.generated_image_path
-        session.context = ctx
-        db.commit()
-
-        return json.dumps({
+        content = json.dumps({
             "result": "Design refined successfully",
             "design_id": new_design.id,
             "version": new_design.version,
             "image_url": new_design.generated_image_path,
             "estimated_duration": new_design.estimated_duration,
-            "difficulty_level": new_design.difficulty_level
+            "difficulty_level": new_design.difficulty_level,
+            "estimation_status": new_design.estimation_status
         }, ensure_ascii=False)
+        return content, {
+            "design_plan_id": new_design.id,
+            "design_image_url": new_design.generated_image_path,
+        }
 
     async def _tool_create_service_record(self, db, user_id, session,
                                           customer_id, design_plan_id=None,
@@ -437,7 +646,6 @@ class ToolExecutor:
         ctx["service_record_id"] = service.id
         ctx["customer_id"] = service.customer_id
         session.context = ctx
-        db.commit()
 
         return json.dumps({
             "result": "Service record created successfully",
@@ -474,7 +682,6 @@ class ToolExecutor:
         # 更新 session.context
         ctx["actual_image_path"] = actual_image_path
         session.context = ctx
-        db.commit()
 
         return json.dumps({
             "result": "Service record completed",
@@ -484,18 +691,19 @@ class ToolExecutor:
             "completed_at": service.completed_at.isoformat() if service.completed_at else None
         }, ensure_ascii=False)
 
-    async def _tool_run_analysis(self, db, user_id, session, service_id):
+    async def _tool_run_analysis(self, db, user_id, session, **args):
+        content, updates = await self._run_analysis(
+            db, user_id, dict(session.context or {}), **args
+        )
+        self._update_context(db, session, updates)
+        return content
+
+    async def _run_analysis(self, db, user_id, ctx, service_id):
         from app.models.service_record import ServiceRecord
-        ctx = dict(session.context or {})
         effective_service_id = service_id or ctx.get("service_record_id")
 
         comparison = await AnalysisService.analyze_service(db, effective_service_id)
 
-        # 更新 session.context
-        ctx["comparison_result_id"] = comparison.id
-        session.context = ctx
-        db.commit()
-
         # 从 service_record 的关联获取能力评分
         scores = {}
         service_record = db.query(ServiceRecord).filter(
@@ -506,7 +714,7 @@ class ToolExecutor:
                 if record.dimension:
                     scores[record.dimension.name] = record.score
 
-        return json.dumps({
+        content = json.dumps({
             "result": "AI analysis complete",
             "comparison_id": comparison.id,
             "similarity_score": comparison.similarity_score,
@@ -514,16 +722,17 @@ class ToolExecutor:
             "differences": comparison.differences,
             "suggestions": comparison.suggestions
         }, ensure_ascii=False)
+        return content, {"comparison_result_id": comparison.id}
 
-    async def _tool_get_ability_summary(self, db, user_id, session):
+    def _tool_get_ability_summary(self, db, user_id, session):
         summary = AbilityService.get_ability_summary(db, user_id)
         return json.dumps({
             "result": "Ability summary retrieved successfully",
             "summary": summary
         }, ensure_ascii=False)
 
-    async def _tool_list_inspirations(self, db, user_id, session,
-                                      search=None, category=None):
+    def _tool_list_inspirations(self, db, user_id, session,
+                                search=None, category=None):
         from sqlalchemy import or_
         query = db.query(InspirationImage).filter(
             InspirationImage.user_id == user_id
@@ -550,3 +759,19 @@ class ToolExecutor:
             "total": len(data),
             "inspirations": data
         }, ensure_ascii=False)
+
+
+# ── 后台任务处理函数 ────────────────────────────────────────────────────────
+
+async def _run_tool_job(db: Session, job: AgentJob) -> dict:
+    """执行入队的耗时工具，结果在下一轮对话交付给 Agent"""
+    payload = job.payload or {}
+    method = getattr(ToolExecutor(), BACKGROUND_TOOLS[job.kind])
+    content, updates = await method(
+        db, job.user_id, payload.get("context") or {}, **payload.get("args", {})
+    )
+    return {"content": content, "context": updates}
+
+
+for _kind in BACKGROUND_TOOLS:
+    JobService.register(_kind, _run_tool_job)
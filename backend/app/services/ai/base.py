@@ -118,3 +118,24 @@ class AIProvider(ABC):
             }
         """
         pass
+
+    @abstractmethod
+    async def describe_image(
+        self,
+        image_path: str
+    ) -> Dict:
+        """
+        生成图片的简短描述（供 Agent 在对话中引用，代替原图）
+
+        Args:
+            image_path: 图片路径（/uploads/... 或本地路径）
+
+        Returns:
+            {
+                "caption": "裸粉色短方甲，无名指金箔点缀",
+                "palette": ["裸粉", "金色"],
+                "style_tags": ["简约", "金箔"],
+                "nail_count": 5
+            }
+        """
+        pass
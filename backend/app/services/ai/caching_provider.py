@@ -0,0 +1,250 @@
+"""
+AI 结果缓存
+
+AIResultCache 将 AI 调用结果持久化在 ai_cache_entries 表（多 worker 共享），缓存键为规范化输入的 SHA-256；
+条目超过 AI_CACHE_TTL_SECONDS 过期，超过 AI_CACHE_MAX_ENTRIES 时按最久未使用淘汰。
+
+CachingAIProvider（AI_CACHE_ENABLED 时由 AIProviderFactory 包装实际的 Provider）：
+- generate_design / refine_design: 按规范化输入（提示词、设计目标、客户上下文、参考图内容哈希）缓存生成的图片路径
+- estimate_execution: 按设计图内容 SHA-256 缓存估算结果
+- compare_images / describe_image 直接转发（分析结果由 AnalysisService 按服务记录输入缓存；图片描述另有按哈希的缓存）
+单个请求可通过 without_cache_reads() 跳过缓存读取（新结果仍会覆盖缓存条目）。命中情况记录在 ai_cache 计数器中。
+"""
+import copy
+import datetime
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.database import open_session
+from app.models.ai_cache_entry import AICacheEntry
+from app.services.ai.base import AIProvider
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(value: Optional[str]) -> str:
+    """合并空白，避免仅空格 / 换行不同的输入产生不同的缓存键"""
+    return " ".join((value or "").split())
+
+
+class AIResultCache:
+    """ai_cache_entries 表的读写（读写失败时视为未命中，不影响 AI 调用）"""
+
+    @staticmethod
+    def image_key(image: str) -> str:
+        """本地图片使用内容哈希（同一张图换路径仍命中），无法读取或远程 URL 使用原字符串"""
+        if image.startswith("/uploads/"):
+            from app.services.image_caption_service import ImageCaptionService
+            try:
+                return "sha256:" + ImageCaptionService.content_hash(image)
+            except OSError:
+                pass
+        return image
+
+    @staticmethod
+    def make_key(namespace: str, operation: str, inputs: Dict[str, Any]) -> str:
+        raw = json.dumps(
+            {"provider": namespace, "operation": operation, "inputs": inputs},
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def get(cls, key: str, usable: Optional[Callable[[Any], bool]] = None) -> Optional[dict]:
+        """
+        读取缓存，命中时返回 {"value": 缓存值} 并刷新最近使用时间；
+        过期或 usable(value) 为 False 的条目删除后视为未命中
+        """
+        db = open_session()
+        try:
+            entry = db.query(AICacheEntry).filter(AICacheEntry.cache_key == key).first()
+            if entry is None:
+                return None
+            now = datetime.datetime.utcnow()
+            value = (entry.result or {}).get("value")
+            expired = entry.expires_at is not None and entry.expires_at <= now
+            if expired or (usable is not None and not usable(value)):
+                db.delete(entry)
+                db.commit()
+                return None
+            entry.hit_count += 1
+            entry.last_used_at = now
+            db.commit()
+            return {"value": value}
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"AI 缓存读取失败，直接调用 Provider: {e}")
+            return None
+        finally:
+            db.close()
+
+    @classmethod
+    def put(cls, key: str, operation: str, value: Any) -> None:
+        now = datetime.datetime.utcnow()
+        ttl = settings.AI_CACHE_TTL_SECONDS
+        expires_at = now + datetime.timedelta(seconds=ttl) if ttl > 0 else None
+        db = open_session()
+        try:
+            entry = db.query(AICacheEntry).filter(AICacheEntry.cache_key == key).first()
+            if entry is None:
+                entry = AICacheEntry(cache_key=key, operation=operation, hit_count=0)
+                db.add(entry)
+            entry.result = {"value": value}
+            entry.created_at = now
+            entry.last_used_at = now
+            entry.expires_at = expires_at
+            db.commit()
+            cls._evict(db)
+        except IntegrityError:
+            # 其他 worker 同时写入了同一条目
+            db.rollback()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"AI 缓存写入失败: {e}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _evict(db: Session) -> None:
+        """超出容量时删除最久未使用的条目"""
+        limit = settings.AI_CACHE_MAX_ENTRIES
+        if limit <= 0:
+            return
+        excess = db.query(AICacheEntry).count() - limit
+        if excess <= 0:
+            return
+        stale_ids = [
+            entry_id for (entry_id,) in db.query(AICacheEntry.id)
+            .order_by(AICacheEntry.last_used_at, AICacheEntry.id)
+            .limit(excess).all()
+        ]
+        db.query(AICacheEntry).filter(AICacheEntry.id.in_(stale_ids)).delete(synchronize_session=False)
+        db.commit()
+        metrics.inc("ai_cache_evictions", len(stale_ids))
+
+
+def _design_image_exists(value: Any) -> bool:
+    """缓存的本地设计图已被删除时视为未命中"""
+    if isinstance(value, str) and value.startswith("/uploads/"):
+        return os.path.exists(os.path.join(settings.UPLOAD_DIR, value[len("/uploads/"):]))
+    return True
+
+
+class CachingAIProvider(AIProvider):
+    """为 AI Provider 增加持久化结果缓存"""
+
+    def __init__(self, inner: AIProvider):
+        self.inner = inner
+        self.bypass_reads = False
+        self._namespace = type(inner).__name__
+
+    async def _cached(
+        self, operation: str, inputs: Dict[str, Any], call: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        key = AIResultCache.make_key(self._namespace, operation, inputs)
+        if self.bypass_reads:
+            metrics.inc("ai_cache", operation=operation, result="bypass")
+        else:
+            usable = _design_image_exists if operation in ("generate_design", "refine_design") else None
+            hit = AIResultCache.get(key, usable)
+            if hit is not None:
+                metrics.inc("ai_cache", operation=operation, result="hit")
+                logger.info(f"AI 缓存命中: {operation} {key[:12]}")
+                return hit["value"]
+            metrics.inc("ai_cache", operation=operation, result="miss")
+        value = await call()
+        AIResultCache.put(key, operation, value)
+        return value
+
+    # ── AIProvider 接口 ─────────────────────────────────────────────────────
+
+    async def generate_design(
+        self,
+        prompt: str,
+        reference_images: Optional[List[str]] = None,
+        design_target: str = "10nails",
+        customer_context: Optional[str] = None
+    ) -> str:
+        inputs = {
+            "prompt": normalize_text(prompt),
+            "reference_images": [AIResultCache.image_key(img) for img in reference_images or []],
+            "design_target": design_target,
+            "customer_context": normalize_text(customer_context),
+        }
+        return await self._cached("generate_design", inputs, lambda: self.inner.generate_design(
+            prompt=prompt,
+            reference_images=reference_images,
+            design_target=design_target,
+            customer_context=customer_context,
+        ))
+
+    async def refine_design(
+        self,
+        original_image: str,
+        refinement_instruction: str,
+        design_target: str = "10nails",
+        customer_context: Optional[str] = None,
+        original_prompt: Optional[str] = None
+    ) -> str:
+        inputs = {
+            "original_image": AIResultCache.image_key(original_image),
+            "refinement_instruction": normalize_text(refinement_instruction),
+            "design_target": design_target,
+            "customer_context": normalize_text(customer_context),
+            "original_prompt": normalize_text(original_prompt),
+        }
+        return await self._cached("refine_design", inputs, lambda: self.inner.refine_design(
+            original_image=original_image,
+            refinement_instruction=refinement_instruction,
+            design_target=design_target,
+            customer_context=customer_context,
+            original_prompt=original_prompt,
+        ))
+
+    async def estimate_execution(self, design_image: str) -> Dict:
+        inputs = {"design_image": AIResultCache.image_key(design_image)}
+        return await self._cached(
+            "estimate_execution", inputs,
+            lambda: self.inner.estimate_execution(design_image=design_image),
+        )
+
+    async def compare_images(
+        self,
+        design_image: str,
+        actual_image: str,
+        artist_review: Optional[str] = None,
+        customer_feedback: Optional[str] = None,
+        customer_satisfaction: Optional[int] = None
+    ) -> Dict:
+        return await self.inner.compare_images(
+            design_image=design_image,
+            actual_image=actual_image,
+            artist_review=artist_review,
+            customer_feedback=customer_feedback,
+            customer_satisfaction=customer_satisfaction,
+        )
+
+    async def describe_image(self, image_path: str) -> Dict:
+        return await self.inner.describe_image(image_path)
+
+
+def without_cache_reads(provider: AIProvider) -> AIProvider:
+    """返回跳过缓存读取的 Provider（结果仍写入缓存）；未启用缓存时原样返回"""
+    if not isinstance(provider, CachingAIProvider):
+        return provider
+    fresh = copy.copy(provider)
+    fresh.bypass_reads = True
+    return fresh
+
+
+def reads_bypassed(provider: AIProvider) -> bool:
+    return isinstance(provider, CachingAIProvider) and provider.bypass_reads
@@ -19,7 +19,7 @@ class AIProviderFactory:
         获取 AI Provider 实例（单例模式）
 
         Args:
-            provider_type: AI 提供商类型（openai/baidu/alibaba等），默认从配置读取
+            provider_type: AI 提供商类型（openai/gemini/fake/baidu/alibaba等），默认从配置读取
 
         Returns:
             AIProvider 实例
@@ -37,11 +37,39 @@ class AIProviderFactory:
 
         logger.info(f"初始化 AI Provider: {provider_type}")
 
-        # 根据类型创建实例
+        cls._instance = cls._create(provider_type)
+
+        if settings.AI_RESILIENCE_ENABLED:
+            from app.services.ai.resilient_provider import ResilientAIProvider
+            providers = [(provider_type, cls._instance)]
+            for name in settings.ai_failover_providers:
+                if name == provider_type:
+                    continue
+                try:
+                    providers.append((name, cls._create(name)))
+                except Exception as e:
+                    logger.warning(f"备用 AI Provider {name} 初始化失败，已跳过: {e}")
+            cls._instance = ResilientAIProvider(providers)
+            logger.info(f"AI Provider 容错已启用: {' → '.join(name for name, _ in providers)}")
+
+        if settings.AI_CACHE_ENABLED:
+            from app.services.ai.caching_provider import CachingAIProvider
+            cls._instance = CachingAIProvider(cls._instance)
+            logger.info("AI 结果缓存已启用")
+
+        logger.info(f"AI Provider 初始化成功: {provider_type}")
+        return cls._instance
+
+    @staticmethod
+    def _create(provider_type: str) -> AIProvider:
+        """根据类型创建 AI Provider 实例"""
         if provider_type == "openai":
-            cls._instance = OpenAIProvider()
+            return OpenAIProvider()
         elif provider_type == "gemini":
-            cls._instance = GeminiProvider()
+            return GeminiProvider()
+        elif provider_type == "fake":
+            from app.services.ai.fake_provider import FakeAIProvider
+            return FakeAIProvider()
         elif provider_type == "baidu":
             # TODO: 实现百度 AI Provider
             raise NotImplementedError("百度 AI Provider 尚未实现")
@@ -51,9 +79,6 @@ class AIProviderFactory:
         else:
             raise ValueError(f"不支持的 AI Provider 类型: {provider_type}")
 
-        logger.info(f"AI Provider 初始化成功: {provider_type}")
-        return cls._instance
-
     @classmethod
     def reset(cls):
         """重置单例实例（主要用于测试）"""
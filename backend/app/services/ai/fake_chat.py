@@ -0,0 +1,157 @@
+"""
+离线 Chat Completions 客户端
+
+接口与 AsyncOpenAI 的 chat.completions.create 一致，不访问网络、不需要 API Key：
+  - RecordedChatClient: 按顺序返回预先录制的 assistant 消息，用于回放基准测试与离线调试
+  - SyntheticChatClient: 按请求内容合成回复（AI_PROVIDER=fake 时 AgentService 使用），用于压测
+"""
+import json
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Iterable, List, Optional
+
+from app.core.config import settings
+from app.services.ai.fake_provider import FaultInjector
+
+
+def _completion(message: dict) -> SimpleNamespace:
+    """将录制的 assistant 消息转换为 ChatCompletion 形状的响应对象"""
+    tool_calls = None
+    if message.get("tool_calls"):
+        tool_calls = [
+            SimpleNamespace(
+                id=tc.get("id", ""),
+                type=tc.get("type", "function"),
+                function=SimpleNamespace(
+                    name=tc["function"]["name"],
+                    arguments=tc["function"].get("arguments") or "{}",
+                ),
+            )
+            for tc in message["tool_calls"]
+        ]
+    msg = SimpleNamespace(content=message.get("content"), tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(message=msg)])
+
+
+def _stream(message: dict):
+    """将录制的消息拆成单个 chunk 的异步流（stream=True 时使用）"""
+    tool_calls = None
+    if message.get("tool_calls"):
+        tool_calls = [
+            SimpleNamespace(
+                index=idx,
+                id=tc.get("id", ""),
+                type=tc.get("type", "function"),
+                function=SimpleNamespace(
+                    name=tc["function"]["name"],
+                    arguments=tc["function"].get("arguments") or "{}",
+                ),
+            )
+            for idx, tc in enumerate(message["tool_calls"])
+        ]
+    delta = SimpleNamespace(content=message.get("content"), tool_calls=tool_calls)
+
+    async def _iterate():
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+    return _iterate()
+
+
+class _Completions:
+    def __init__(self, client: "RecordedChatClient"):
+        self._client = client
+
+    async def create(self, **kwargs):
+        started = time.perf_counter()
+        message = self._client.next_message()
+        self._client.requests.append(kwargs)
+        response = _stream(message) if kwargs.get("stream") else _completion(message)
+        self._client.elapsed += time.perf_counter() - started
+        return response
+
+
+class RecordedChatClient:
+    """
+    回放录制消息的 Chat Completions 客户端。
+
+    消息格式与会话 JSONL 中的 assistant 行一致：{"content": ..., "tool_calls": [...]}。
+    队列耗尽时返回 fallback（默认为一条不推进步骤的最终回复），并计入 exhausted，
+    便于发现录制与回放分叉。elapsed 为客户端自身耗时（即回放中的“模型时间”）。
+    """
+
+    def __init__(self, messages: Optional[Iterable[dict]] = None, fallback: Optional[dict] = None):
+        self._queue = deque(messages or [])
+        self._fallback = fallback or {"content": json.dumps({
+            "message_text": "OK",
+            "step_summary": "",
+            "step_complete": False,
+        })}
+        self.requests: List[dict] = []
+        self.exhausted = 0
+        self.elapsed = 0.0
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def load(self, messages: Iterable[dict]) -> None:
+        """替换待回放的消息队列"""
+        self._queue = deque(messages)
+
+    def next_message(self) -> dict:
+        if self._queue:
+            return self._queue.popleft()
+        self.exhausted += 1
+        return self._fallback
+
+
+class _SyntheticCompletions:
+    def __init__(self, client: "SyntheticChatClient"):
+        self._client = client
+
+    async def create(self, **kwargs):
+        await self._client.faults.inject("chat")
+        self._client.requests += 1
+        message = self._client.reply(kwargs.get("messages") or [], kwargs.get("tools") or [],
+                                     kwargs.get("tool_choice"))
+        return _stream(message) if kwargs.get("stream") else _completion(message)
+
+
+class SyntheticChatClient:
+    """
+    合成回复的 Chat Completions 客户端，行为确定、可重复：
+      - 当前步骤的第一条用户消息且开放 search_customer 时，先发起一次 search_customer 工具调用
+        （tool_choice=required 时同样如此），模拟真实回合的工具往返
+      - 其余情况返回最终 JSON 回复；当前步骤累计 FAKE_CHAT_TURNS_PER_STEP 条用户消息后 step_complete=True
+    延迟与错误按 FAKE_AI_LATENCY_SECONDS / FAKE_AI_ERROR_RATE 中的 chat 配置注入
+    """
+
+    def __init__(self, seed: Optional[int] = None):
+        self.faults = FaultInjector(seed)
+        self.requests = 0
+        self.chat = SimpleNamespace(completions=_SyntheticCompletions(self))
+
+    @staticmethod
+    def reply(messages: List[dict], tools: List[dict], tool_choice: Optional[str] = None) -> dict:
+        user_turns = [m for m in messages if m.get("role") == "user"]
+        last = messages[-1] if messages else {}
+        tool_names = {t.get("function", {}).get("name") for t in tools}
+        text = last.get("content") if isinstance(last.get("content"), str) else ""
+
+        if last.get("role") == "user" and "search_customer" in tool_names and (
+            len(user_turns) == 1 or tool_choice == "required"
+        ):
+            return {"content": None, "tool_calls": [{
+                "id": f"call_fake_{len(messages)}",
+                "type": "function",
+                "function": {
+                    "name": "search_customer",
+                    "arguments": json.dumps({"query": (text.split() or ["customer"])[0]}, ensure_ascii=False),
+                },
+            }]}
+
+        step_complete = len(user_turns) >= settings.FAKE_CHAT_TURNS_PER_STEP
+        return {"content": json.dumps({
+            "message_text": f"Noted: {text[:80]}" if text else "Noted.",
+            "step_summary": f"{len(user_turns)} user messages in this step",
+            "step_complete": step_complete,
+            "quick_replies": [] if step_complete else ["That's all"],
+        }, ensure_ascii=False)}
@@ -0,0 +1,230 @@
+"""
+离线 Fake AI Provider（AI_PROVIDER=fake）
+
+不访问网络、不需要 API Key，用于压测与性能分析设计 / 分析 / Agent 流程：
+  - generate_design / refine_design 用 Pillow 在本地绘制设计图（相同输入生成相同文件）
+  - estimate_execution / compare_images / describe_image 返回结构与真实 Provider 一致的 JSON，
+    内容由输入哈希决定，可重复
+  - 每次调用按 FAKE_AI_LATENCY_SECONDS 注入延迟（对数正态分布，FAKE_AI_LATENCY_JITTER 为 sigma），
+    按 FAKE_AI_ERROR_RATE 的概率抛出 FakeProviderError（status_code=503，容错包装视为可重试错误）
+
+FaultInjector 同时供 Fake 对话后端（fake_chat.SyntheticChatClient）使用。
+"""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import random
+from typing import Dict, List, Optional
+
+from PIL import Image, ImageDraw
+
+from app.core.config import parse_mapping, settings
+from app.services.ai.base import AIProvider
+
+logger = logging.getLogger(__name__)
+
+_PALETTE = [
+    ("nude pink", (232, 190, 180)), ("cherry red", (190, 30, 45)), ("milky white", (245, 240, 232)),
+    ("navy", (30, 45, 90)), ("sage green", (160, 185, 150)), ("lilac", (200, 170, 220)),
+    ("gold", (212, 175, 55)), ("black", (25, 25, 25)),
+]
+_STYLES = ["minimalist", "french", "gradient", "floral", "glitter", "marble", "chrome", "cat-eye"]
+_TECHNIQUES = ["gradient", "hand painting", "french tip", "stamping", "foil", "3D decoration"]
+_MATERIALS = ["base gel", "color gel", "top coat", "glitter", "foil", "rhinestones", "chrome powder"]
+_NAIL_COUNTS = {"single": 1, "5nails": 5, "10nails": 10}
+
+
+class FakeProviderError(RuntimeError):
+    """注入的模拟错误（对应上游 503）"""
+    status_code = 503
+
+
+class FaultInjector:
+    """按方法配置注入延迟与错误；FAKE_AI_SEED 固定时延迟与错误序列可复现"""
+
+    def __init__(self, seed: Optional[int] = None):
+        self._random = random.Random(seed if seed is not None else settings.FAKE_AI_SEED)
+
+    @staticmethod
+    def _lookup(value: str, operation: str) -> float:
+        mapping = parse_mapping(value)
+        try:
+            return float(mapping.get(operation, mapping.get("default", 0)))
+        except ValueError:
+            return 0.0
+
+    def latency(self, operation: str) -> float:
+        median = self._lookup(settings.FAKE_AI_LATENCY_SECONDS, operation)
+        if median <= 0:
+            return 0.0
+        sigma = settings.FAKE_AI_LATENCY_JITTER
+        return median * math.exp(self._random.gauss(0, sigma)) if sigma > 0 else median
+
+    async def inject(self, operation: str) -> None:
+        """等待模拟延迟，按错误率抛出 FakeProviderError"""
+        delay = self.latency(operation)
+        if delay:
+            await asyncio.sleep(delay)
+        if self._random.random() < self._lookup(settings.FAKE_AI_ERROR_RATE, operation):
+            raise FakeProviderError(f"fake {operation} failure (injected)")
+
+
+def _seed(*parts) -> random.Random:
+    """由输入内容决定的随机数生成器（相同输入 → 相同输出）"""
+    digest = hashlib.sha256(json.dumps(parts, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+class FakeAIProvider(AIProvider):
+    """本地生成结果的 AI Provider"""
+
+    def __init__(self):
+        self._faults = FaultInjector()
+
+    # ── 设计图 ──────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _render(rng: random.Random, nail_count: int) -> bytes:
+        """绘制渐变底色 + 指甲轮廓 + 装饰点的 1024x1024 PNG"""
+        size = 1024
+        (_, top), (_, bottom) = rng.sample(_PALETTE, 2)
+        img = Image.new("RGB", (size, size))
+        draw = ImageDraw.Draw(img)
+        for y in range(0, size, 8):
+            t = y / size
+            color = tuple(int(a + (b - a) * t) for a, b in zip(top, bottom))
+            draw.rectangle([0, y, size, y + 8], fill=color)
+
+        columns = min(nail_count, 5)
+        rows = math.ceil(nail_count / columns)
+        cell_w, cell_h = size // columns, size // rows
+        _, nail_color = rng.choice(_PALETTE)
+        _, accent = rng.choice(_PALETTE)
+        for i in range(nail_count):
+            x0 = (i % columns) * cell_w + cell_w // 5
+            y0 = (i // columns) * cell_h + cell_h // 8
+            box = [x0, y0, x0 + cell_w * 3 // 5, y0 + cell_h * 3 // 4]
+            draw.rounded_rectangle(box, radius=cell_w // 4, fill=nail_color, outline=(60, 60, 60), width=4)
+            for _ in range(rng.randint(2, 6)):
+                cx = rng.randint(box[0] + 10, box[2] - 10)
+                cy = rng.randint(box[1] + 10, box[3] - 10)
+                r = rng.randint(4, 14)
+                draw.ellipse([cx - r, cy - r, cx + r, cy + r], fill=accent)
+
+        out = io.BytesIO()
+        img.save(out, format="PNG")
+        return out.getvalue()
+
+    @classmethod
+    def _save_design(cls, rng: random.Random, key: str, design_target: str) -> str:
+        filename = f"fake_{key[:16]}.png"
+        filepath = os.path.join(settings.UPLOAD_DIR, "designs", filename)
+        if not os.path.exists(filepath):
+            data = cls._render(rng, _NAIL_COUNTS.get(design_target, 10))
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            tmp_path = f"{filepath}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, filepath)
+        return f"/uploads/designs/{filename}"
+
+    async def _design(self, operation: str, design_target: str, *inputs) -> str:
+        await self._faults.inject(operation)
+        key = hashlib.sha256(json.dumps([operation, design_target, *inputs], default=str).encode()).hexdigest()
+        path = await asyncio.to_thread(self._save_design, _seed(key), key, design_target)
+        logger.info(f"Fake {operation} complete: {path}")
+        return path
+
+    async def generate_design(
+        self,
+        prompt: str,
+        reference_images: Optional[List[str]] = None,
+        design_target: str = "10nails",
+        customer_context: Optional[str] = None
+    ) -> str:
+        return await self._design("generate_design", design_target, prompt, reference_images, customer_context)
+
+    async def refine_design(
+        self,
+        original_image: str,
+        refinement_instruction: str,
+        design_target: str = "10nails",
+        customer_context: Optional[str] = None,
+        original_prompt: Optional[str] = None
+    ) -> str:
+        return await self._design(
+            "refine_design", design_target, original_image, refinement_instruction, customer_context, original_prompt
+        )
+
+    # ── 结构化结果 ──────────────────────────────────────────────────────────
+
+    async def estimate_execution(self, design_image: str) -> Dict:
+        await self._faults.inject("estimate_execution")
+        rng = _seed("estimate_execution", design_image)
+        duration = rng.randrange(30, 181, 5)
+        return {
+            "estimated_duration": duration,
+            "difficulty_level": "easy" if duration < 60 else "medium" if duration < 120 else "hard",
+            "materials": rng.sample(_MATERIALS, 3),
+            "techniques": rng.sample(_TECHNIQUES, 2),
+        }
+
+    async def compare_images(
+        self,
+        design_image: str,
+        actual_image: str,
+        artist_review: Optional[str] = None,
+        customer_feedback: Optional[str] = None,
+        customer_satisfaction: Optional[int] = None
+    ) -> Dict:
+        from app.services.ability_service import INITIAL_DIMENSIONS
+
+        await self._faults.inject("compare_images")
+        rng = _seed("compare_images", design_image, actual_image, artist_review,
+                    customer_feedback, customer_satisfaction)
+        scores = {dim["name"]: rng.randint(65, 95) for dim in INITIAL_DIMENSIONS}
+        colors = [name for name, _ in rng.sample(_PALETTE, 2)]
+        styles = rng.sample(_STYLES, 2)
+        return {
+            "similarity_score": round(sum(scores.values()) / len(scores)),
+            "overall_assessment": "Synthetic assessment: overall execution is consistent with the design.",
+            "differences": {
+                "color_accuracy": f"Color accuracy about {rng.randint(75, 98)}%",
+                "pattern_precision": f"Pattern precision about {rng.randint(75, 98)}%",
+                "detail_work": "Edges and decorations are mostly even",
+                "composition": "Layout matches the design reference",
+            },
+            "contextual_insights": {
+                "artist_perspective": "Artist review considered" if artist_review else "No artist review",
+                "customer_perspective": "Customer feedback considered" if customer_feedback else "No customer feedback",
+                "satisfaction_analysis": f"Satisfaction: {customer_satisfaction or 'not rated'}",
+            },
+            "suggestions": ["Smooth the gradient transition", "Even out the top coat near the cuticle"],
+            "ability_scores": {
+                name: {"score": score, "evidence": f"Synthetic evidence for {name}"}
+                for name, score in scores.items()
+            },
+            "customer_updates": {"colors": colors, "styles": styles, "notes": []},
+            "skill_updates": {
+                "strengths": [max(scores, key=scores.get)],
+                "improvements": [min(scores, key=scores.get)],
+                "insights": [],
+                "next_suggestions": [],
+            },
+        }
+
+    async def describe_image(self, image_path: str) -> Dict:
+        await self._faults.inject("describe_image")
+        rng = _seed("describe_image", image_path)
+        palette = [name for name, _ in rng.sample(_PALETTE, 2)]
+        styles = rng.sample(_STYLES, 2)
+        return {
+            "caption": f"Medium almond nails in {palette[0]} with {styles[0]} {palette[1]} accents",
+            "palette": palette,
+            "style_tags": styles,
+            "nail_count": rng.choice([5, 10]),
+        }
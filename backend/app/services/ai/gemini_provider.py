@@ -1,24 +1,36 @@
+import asyncio
 import base64
 import json
 import logging
 import os
-from pathlib import Path
 from typing import Dict, Optional, List
 from google import genai
 from google.genai import types
 from app.services.ai.base import AIProvider
+from app.core.cache import LRUCache
 from app.core.config import settings
+from app.core.http import SharedHTTPClient
+from app.services.ai.image_preprocess import prepare_image
 
 logger = logging.getLogger(__name__)
 
+# 图片描述只需要概览，一个 768px 图块足够
+_DESCRIBE_MAX_SIDE = 768
+
 
 class GeminiProvider(AIProvider):
     """Google Gemini API 实现（使用 Imagen 3 和 Gemini 2.0 Flash）"""
 
     def __init__(self):
         self.client = genai.Client(api_key=settings.GEMINI_API_KEY)
+        # google-genai 1.7 不支持注入 httpx 客户端，替换其内部的异步客户端以复用共享连接池
+        api_client = getattr(self.client, "_api_client", None)
+        if api_client is not None and hasattr(api_client, "_async_httpx_client"):
+            api_client._async_httpx_client = SharedHTTPClient()
         self.vision_model = "gemini-2.0-flash"
         self.image_gen_model = "gemini-2.0-flash-exp-image-generation"
+        # 最近生成的设计图字节（本地路径 -> bytes），随后的执行估算直接使用，不再重新读取
+        self._generated_images: LRUCache[bytes] = LRUCache(maxsize=8)
 
     @staticmethod
     def _extract_json(text: str) -> dict:
@@ -30,20 +42,21 @@ class GeminiProvider(AIProvider):
             text = match.group(1)
         return json.loads(text.strip())
 
-    def _load_image_part(self, image_path: str) -> types.Part:
-        """将本地图片路径转为 Gemini Part（读取字节）"""
-        # image_path 可能是 /uploads/designs/xxx.png 格式
-        if image_path.startswith("/uploads/"):
-            local_path = os.path.join(settings.UPLOAD_DIR, image_path[len("/uploads/"):])
-        else:
-            local_path = image_path
-
-        ext = Path(local_path).suffix.lower()
-        mime_map = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp"}
-        mime_type = mime_map.get(ext, "image/png")
-
-        with open(local_path, "rb") as f:
-            data = f.read()
+    def _load_image_part(self, image_path: str, max_side: Optional[int] = None) -> types.Part:
+        """
+        将本地图片路径转为 Gemini Part（读取字节并预处理：缩小、旋正、重新编码）。
+        刚生成的设计图直接使用内存中的字节。阻塞操作，异步方法中通过 asyncio.to_thread 调用
+        """
+        data = self._generated_images.get(image_path)
+        if data is None:
+            # image_path 可能是 /uploads/designs/xxx.png 格式
+            if image_path.startswith("/uploads/"):
+                local_path = os.path.join(settings.UPLOAD_DIR, image_path[len("/uploads/"):])
+            else:
+                local_path = image_path
+            with open(local_path, "rb") as f:
+                data = f.read()
+        data, mime_type = prepare_image(image_path, data, max_side=max_side)
         return types.Part.from_bytes(data=data, mime_type=mime_type)
 
     async def generate_design(
@@ -71,7 +84,7 @@ class GeminiProvider(AIProvider):
             if reference_images:
                 for img_path in reference_images:
                     try:
-                        contents.append(self._load_image_part(img_path))
+                        contents.append(await asyncio.to_thread(self._load_image_part, img_path))
                     except Exception as e:
                         logger.warning(f"加载参考图失败 {img_path}: {e}")
 
@@ -108,6 +121,7 @@ class GeminiProvider(AIProvider):
                         f.write(image_bytes)
 
                     image_url = f"/uploads/designs/{filename}"
+                    self._generated_images.set(image_url, image_bytes)
                     logger.info(f"设计生成成功: {image_url}")
                     return image_url
 
@@ -148,7 +162,7 @@ class GeminiProvider(AIProvider):
             # 1. 使用 Gemini Vision 分析原图并生成新提示词
             contents = [
                 types.Part.from_text(text=analysis_prompt),
-                self._load_image_part(original_image),
+                await asyncio.to_thread(self._load_image_part, original_image),
             ]
 
             response = await self.client.aio.models.generate_content(
@@ -192,7 +206,7 @@ class GeminiProvider(AIProvider):
         try:
             contents = [
                 types.Part.from_text(text=prompt),
-                self._load_image_part(design_image),
+                await asyncio.to_thread(self._load_image_part, design_image),
             ]
 
             response = await self.client.aio.models.generate_content(
@@ -236,8 +250,10 @@ class GeminiProvider(AIProvider):
         try:
             contents = [
                 types.Part.from_text(text=user_prompt),
-                self._load_image_part(design_image),
-                self._load_image_part(actual_image),
+                *await asyncio.gather(
+                    asyncio.to_thread(self._load_image_part, design_image),
+                    asyncio.to_thread(self._load_image_part, actual_image),
+                ),
             ]
 
             response = await self.client.aio.models.generate_content(
@@ -258,6 +274,43 @@ class GeminiProvider(AIProvider):
             logger.error(f"AI 对比分析失败: {e}")
             raise
 
+    async def describe_image(self, image_path: str) -> Dict:
+        """使用 Gemini Vision 生成图片简短描述"""
+
+        prompt = """
+        请为看不到图片的美甲助理描述这张美甲图片，只返回 JSON：
+        {
+            "caption": "一到两句话：甲型与长度、底色、主要图案与装饰",
+            "palette": ["裸粉", "金色"],
+            "style_tags": ["简约", "金箔"],
+            "nail_count": 5
+        }
+        nail_count 为图中可见的指甲数量（没有指甲时为 null）。
+        """
+
+        try:
+            contents = [
+                types.Part.from_text(text=prompt),
+                await asyncio.to_thread(self._load_image_part, image_path, max_side=_DESCRIBE_MAX_SIDE),
+            ]
+
+            response = await self.client.aio.models.generate_content(
+                model=self.vision_model,
+                contents=contents,
+                config=types.GenerateContentConfig(
+                    max_output_tokens=300,
+                    temperature=0.2,
+                )
+            )
+
+            result = self._extract_json(response.text)
+            logger.info(f"图片描述完成: {result.get('caption', '')[:60]}")
+            return result
+
+        except Exception as e:
+            logger.error(f"图片描述失败: {e}")
+            raise
+
     def _build_generation_prompt(self, base_prompt: str, design_target: str, customer_context: Optional[str] = None) -> str:
         """构建 Imagen 3 生成提示词（结构化格式）"""
 
@@ -0,0 +1,151 @@
+"""
+视觉模型输入图片预处理
+
+手机拍摄的服务照片可达 10MB，原样 base64 发送既拖慢上传也浪费视觉 token。
+发送前统一处理：按 EXIF 方向旋正 → 等比缩小到 VISION_IMAGE_MAX_SIDE → 去除 EXIF 等元数据 →
+重新编码为 JPEG / WebP。
+
+处理结果（派生图）按「原图内容哈希 + 处理参数」缓存：进程内 LRU 与磁盘目录 VISION_CACHE_DIR，
+同一张图在 estimate_execution / compare_images / refine_design 之间只处理一次。磁盘缓存超过
+VISION_CACHE_MAX_MB 时按最近使用时间淘汰。
+无法解码的数据（或关闭预处理时）原样返回，MIME 类型按扩展名推断。
+
+哈希、解码与重新编码均为阻塞操作，Provider 的异步方法通过 asyncio.to_thread 调用。
+"""
+import hashlib
+import io
+import logging
+import os
+from typing import Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MIME_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp"}
+
+_FORMATS = {"JPEG": ("image/jpeg", ".jpg"), "WEBP": ("image/webp", ".webp")}
+
+# 派生图进程内缓存：{缓存键: (字节, MIME)}
+_derivatives: LRUCache[Tuple[bytes, str]] = LRUCache(maxsize=32)
+
+
+def guess_mime_type(image: str) -> str:
+    return MIME_TYPES.get(os.path.splitext(image)[1].lower(), "image/png")
+
+
+def prepare_image(image: str, data: bytes, max_side: Optional[int] = None) -> Tuple[bytes, str]:
+    """
+    返回发送给视觉模型的 (图片字节, MIME 类型)。
+
+    Args:
+        image: 图片路径（仅用于推断原始 MIME 类型）
+        data: 原图字节
+        max_side: 长边上限，缺省为 VISION_IMAGE_MAX_SIDE（低精度描述可传更小的值）
+    """
+    mime_type = guess_mime_type(image)
+    if not settings.VISION_IMAGE_PREPROCESS:
+        return data, mime_type
+
+    max_side = max_side or settings.VISION_IMAGE_MAX_SIDE
+    fmt = settings.VISION_IMAGE_FORMAT.upper()
+    if fmt not in _FORMATS:
+        fmt = "JPEG"
+    quality = settings.VISION_IMAGE_QUALITY
+    key = f"{hashlib.sha256(data).hexdigest()}-{max_side}-{quality}{_FORMATS[fmt][1]}"
+
+    cached = _derivatives.get(key)
+    if cached is not None:
+        return cached
+
+    derived = _read_disk(key)
+    if derived is None:
+        derived = _encode(data, max_side, fmt, quality)
+        if derived is None:
+            return data, mime_type
+        _write_disk(key, derived)
+
+    result = (derived, _FORMATS[fmt][0])
+    _derivatives.set(key, result)
+    return result
+
+
+def _encode(data: bytes, max_side: int, fmt: str, quality: int) -> Optional[bytes]:
+    """旋正、缩小、去除元数据并重新编码；无法解码时返回 None"""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode in ("RGBA", "LA", "P"):
+                # 透明区域铺白底（JPEG 不支持透明通道）
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel("A"))
+                img = background
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+            out = io.BytesIO()
+            # 不传 exif / icc_profile，输出不带元数据
+            img.save(out, format=fmt, quality=quality, optimize=True)
+            return out.getvalue()
+    except Exception as e:
+        logger.debug(f"Image preprocessing skipped: {e}")
+        return None
+
+
+def _read_disk(key: str) -> Optional[bytes]:
+    if not settings.VISION_CACHE_DIR:
+        return None
+    path = os.path.join(settings.VISION_CACHE_DIR, key)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        # 刷新修改时间，淘汰时按最近使用排序
+        os.utime(path)
+        return data
+    except OSError:
+        return None
+
+
+def _write_disk(key: str, derived: bytes) -> None:
+    if not settings.VISION_CACHE_DIR:
+        return
+    path = os.path.join(settings.VISION_CACHE_DIR, key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(settings.VISION_CACHE_DIR, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(derived)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Failed to write vision image cache: {e}")
+        return
+    _prune_disk()
+
+
+def _prune_disk() -> None:
+    """磁盘缓存超过 VISION_CACHE_MAX_MB 时删除最久未使用的派生图"""
+    limit = settings.VISION_CACHE_MAX_MB * 1024 * 1024
+    if limit <= 0:
+        return
+    entries = []
+    try:
+        with os.scandir(settings.VISION_CACHE_DIR) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
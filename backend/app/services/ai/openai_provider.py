@@ -1,23 +1,32 @@
+import asyncio
+import base64
 import json
 import logging
 import os
 import uuid
-import httpx
 from typing import Dict, Optional, List
 from openai import AsyncOpenAI
 from app.services.ai.base import AIProvider
+from app.core.cache import LRUCache
 from app.core.config import settings
+from app.core.http import SharedHTTPClient, get_http_client
+from app.services.ai.image_preprocess import prepare_image
 
 logger = logging.getLogger(__name__)
 
+# detail="low" 时模型只看 512px 缩略图，预处理直接缩到该尺寸
+_LOW_DETAIL_MAX_SIDE = 512
+
 
 class OpenAIProvider(AIProvider):
     """OpenAI API 实现（使用 DALL-E 3 和 GPT-4 Vision）"""
 
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, http_client=SharedHTTPClient())
         self.dalle_model = "dall-e-3"
         self.vision_model = "gpt-4o"
+        # 最近生成的设计图字节（本地路径 -> bytes），随后的执行估算直接使用，不再重新读取
+        self._generated_images: LRUCache[bytes] = LRUCache(maxsize=8)
 
     async def generate_design(
         self,
@@ -51,10 +60,9 @@ class OpenAIProvider(AIProvider):
             cdn_url = response.data[0].url
             logger.info(f"DALL-E 3 generation successful, downloading image: {cdn_url[:80]}...")
 
-            # 下载图片并保存到本地，避免临时 CDN URL 过期
-            async with httpx.AsyncClient(timeout=60) as http:
-                img_resp = await http.get(cdn_url)
-                img_resp.raise_for_status()
+            # 下载图片并保存到本地，避免临时 CDN URL 过期（复用共享连接池）
+            img_resp = await get_http_client().get(cdn_url, timeout=60)
+            img_resp.raise_for_status()
 
             filename = f"design_{uuid.uuid4().hex[:12]}.png"
             filepath = os.path.join(settings.UPLOAD_DIR, "designs", filename)
@@ -63,6 +71,7 @@ class OpenAIProvider(AIProvider):
                 f.write(img_resp.content)
 
             local_path = f"/uploads/designs/{filename}"
+            self._generated_images.set(local_path, img_resp.content)
             logger.info(f"Image saved locally: {local_path}")
             return local_path
 
@@ -99,15 +108,7 @@ Please return a detailed design description (in English) to be used by DALL-E 3
 Note: Maintain the nail shape and length consistent with the original image, only adjust design style and details according to the refinement instruction."""
 
         try:
-            # 构建图片内容：本地路径转 base64，HTTP URL 直接使用
-            if original_image.startswith("/uploads/"):
-                import base64
-                local_path = os.path.join(settings.UPLOAD_DIR, original_image[len("/uploads/"):])
-                with open(local_path, "rb") as f:
-                    b64_data = base64.b64encode(f.read()).decode("utf-8")
-                image_content = {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{b64_data}"}}
-            else:
-                image_content = {"type": "image_url", "image_url": {"url": original_image}}
+            image_content = await asyncio.to_thread(self._image_content, original_image)
 
             response = await self.client.chat.completions.create(
                 model=self.vision_model,
@@ -154,6 +155,7 @@ Note: Maintain the nail shape and length consistent with the original image, onl
         """
 
         try:
+            image_content = await asyncio.to_thread(self._image_content, design_image)
             response = await self.client.chat.completions.create(
                 model=self.vision_model,
                 messages=[
@@ -161,7 +163,7 @@ Note: Maintain the nail shape and length consistent with the original image, onl
                         "role": "user",
                         "content": [
                             {"type": "text", "text": prompt},
-                            {"type": "image_url", "image_url": {"url": design_image}}
+                            image_content
                         ]
                     }
                 ],
@@ -200,6 +202,10 @@ Note: Maintain the nail shape and length consistent with the original image, onl
         logger.info(f"Context included: artist_review={bool(artist_review)}, customer_feedback={bool(customer_feedback)}, satisfaction={customer_satisfaction}")
 
         try:
+            design_content, actual_content = await asyncio.gather(
+                asyncio.to_thread(self._image_content, design_image, detail="high"),
+                asyncio.to_thread(self._image_content, actual_image, detail="high"),
+            )
             response = await self.client.chat.completions.create(
                 model=self.vision_model,
                 messages=[
@@ -208,8 +214,8 @@ Note: Maintain the nail shape and length consistent with the original image, onl
                         "role": "user",
                         "content": [
                             {"type": "text", "text": user_prompt},
-                            {"type": "image_url", "image_url": {"url": design_image, "detail": "high"}},
-                            {"type": "image_url", "image_url": {"url": actual_image, "detail": "high"}}
+                            design_content,
+                            actual_content
                         ]
                     }
                 ],
@@ -227,6 +233,69 @@ Note: Maintain the nail shape and length consistent with the original image, onl
             logger.error(f"AI comparison analysis failed: {e}")
             raise
 
+    async def describe_image(self, image_path: str) -> Dict:
+        """使用 GPT-4 Vision 生成图片简短描述"""
+
+        prompt = """Describe this nail photo for a nail artist's assistant who cannot see it.
+Return only JSON:
+{
+    "caption": "One or two sentences: nail shape and length, base color, main pattern and decorations",
+    "palette": ["nude pink", "gold"],
+    "style_tags": ["minimalist", "foil"],
+    "nail_count": 5
+}
+nail_count is the number of visible nails (null if the image shows no nails)."""
+
+        try:
+            image_content = await asyncio.to_thread(self._image_content, image_path, detail="low")
+            response = await self.client.chat.completions.create(
+                model=self.vision_model,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": prompt},
+                            image_content,
+                        ]
+                    }
+                ],
+                max_tokens=300,
+                temperature=0.2,
+                response_format={"type": "json_object"},
+            )
+
+            result = json.loads(response.choices[0].message.content)
+            logger.info(f"Image description complete: {result.get('caption', '')[:60]}")
+            return result
+
+        except Exception as e:
+            logger.error(f"Image description failed: {e}")
+            raise
+
+    def _image_content(self, image: str, detail: Optional[str] = None) -> dict:
+        """
+        构建图片消息内容：本地路径（/uploads/...）经预处理（缩小、重新编码）后转 base64 data URL，
+        HTTP URL 直接使用。刚生成的设计图直接使用内存中的字节。
+        读取文件与预处理为阻塞操作，异步方法中通过 asyncio.to_thread 调用
+        """
+        if image.startswith("/uploads/"):
+            local_path = os.path.join(settings.UPLOAD_DIR, image[len("/uploads/"):])
+            data = self._generated_images.get(image)
+            if data is None:
+                with open(local_path, "rb") as f:
+                    data = f.read()
+            data, mime_type = prepare_image(
+                local_path, data, max_side=_LOW_DETAIL_MAX_SIDE if detail == "low" else None
+            )
+            b64_data = base64.b64encode(data).decode("utf-8")
+            url = f"data:{mime_type};base64,{b64_data}"
+        else:
+            url = image
+        image_url = {"url": url}
+        if detail:
+            image_url["detail"] = detail
+        return {"type": "image_url", "image_url": image_url}
+
     def _build_generation_prompt(self, base_prompt: str, design_target: str, customer_context: Optional[str] = None) -> str:
         """构建 DALL-E 3 生成提示词（结构化格式）"""
 
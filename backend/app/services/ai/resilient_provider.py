@@ -0,0 +1,276 @@
+"""
+AI Provider 容错包装
+
+ResilientAIProvider 按顺序持有多个 Provider（AI_PROVIDER 在前，AI_FAILOVER_PROVIDERS 依次在后），
+每次调用：
+  - 重试：同一 Provider 按方法配置的次数重试（AI_RETRY_ATTEMPTS），间隔为带全抖动的指数退避
+  - 熔断：每个 Provider 一个熔断器，连续失败 AI_CIRCUIT_FAILURE_THRESHOLD 次后打开，
+    AI_CIRCUIT_RESET_SECONDS 后放行一次试探调用（半开），成功则关闭
+  - 故障转移：当前 Provider 重试耗尽或熔断打开时转到下一个 Provider
+  - 对冲：AI_HEDGE_OPERATIONS 中的方法在耗时超过该 Provider 近期 p95 时，向下一个可用 Provider
+    （没有则同一 Provider）再发一次请求，取先成功的结果
+
+本地输入错误（如图片文件不存在）直接抛出；4xx（408 / 429 除外）不重试、不计入熔断，但仍转到下一个 Provider。
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.ai.base import AIProvider
+
+logger = logging.getLogger(__name__)
+
+# 计算 p95 的最近耗时样本数
+_LATENCY_WINDOW = 100
+
+
+class ProviderUnavailableError(RuntimeError):
+    """所有 Provider 的熔断器均处于打开状态"""
+
+
+class CircuitBreaker:
+    """连续失败计数熔断器：closed → open（拒绝调用）→ half_open（放行一次试探）→ closed / open"""
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        reset_after: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._probing or self._clock() - self.opened_at >= self.reset_after:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """是否放行调用；半开状态只放行一个试探调用"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self.opened_at = self._clock()
+        self._probing = False
+
+    def release(self) -> None:
+        """试探调用未产生结论（被取消或输入错误）时归还试探名额"""
+        self._probing = False
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    """OpenAI（status_code）与 google-genai（code）异常的 HTTP 状态码"""
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def _is_input_error(exc: BaseException) -> bool:
+    """本地输入问题（如图片不存在），换 Provider 也无法成功"""
+    return isinstance(exc, (FileNotFoundError, IsADirectoryError, NotADirectoryError, PermissionError))
+
+
+def _is_client_error(exc: BaseException) -> bool:
+    """请求本身被拒绝（内容审核、参数错误、鉴权失败），同一 Provider 重试无意义"""
+    status = _status_code(exc)
+    return status is not None and 400 <= status < 500 and status not in (408, 429)
+
+
+class _Member:
+    """一个被包装的 Provider 及其熔断器、各方法的最近耗时"""
+
+    def __init__(self, name: str, provider: AIProvider):
+        self.name = name
+        self.provider = provider
+        self.breaker = CircuitBreaker(
+            settings.AI_CIRCUIT_FAILURE_THRESHOLD, settings.AI_CIRCUIT_RESET_SECONDS
+        )
+        self.latencies: Dict[str, Deque[float]] = {}
+
+    def p95(self, operation: str) -> Optional[float]:
+        samples = self.latencies.get(operation)
+        if not samples or len(samples) < settings.AI_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class ResilientAIProvider(AIProvider):
+    """为多个 AI Provider 增加重试、熔断、故障转移与对冲请求"""
+
+    def __init__(self, providers: List[Tuple[str, AIProvider]]):
+        if not providers:
+            raise ValueError("ResilientAIProvider 至少需要一个 Provider")
+        self._members = [_Member(name, provider) for name, provider in providers]
+
+    @property
+    def providers(self) -> List[AIProvider]:
+        return [member.provider for member in self._members]
+
+    async def _call(self, operation: str, invoke: Callable[[AIProvider], Awaitable[Any]]) -> Any:
+        last_error: Optional[BaseException] = None
+        for index, member in enumerate(self._members):
+            if not member.breaker.allow():
+                metrics.inc("ai_provider_calls", provider=member.name, operation=operation, result="rejected")
+                continue
+            try:
+                return await self._with_retries(member, operation, invoke, self._members[index + 1:])
+            except Exception as e:
+                if _is_input_error(e):
+                    raise
+                last_error = e
+                if index + 1 < len(self._members):
+                    metrics.inc("ai_failover", provider=member.name, operation=operation)
+                    logger.warning(f"AI Provider {member.name} {operation} 失败，转到下一个 Provider: {e}")
+        if last_error is not None:
+            raise last_error
+        raise ProviderUnavailableError(f"所有 AI Provider 均已熔断，暂时无法执行 {operation}")
+
+    async def _with_retries(
+        self, member: _Member, operation: str,
+        invoke: Callable[[AIProvider], Awaitable[Any]], alternates: List[_Member],
+    ) -> Any:
+        retries = settings.ai_retry_attempts(operation)
+        attempt = 0
+        while True:
+            try:
+                return await self._hedged(member, operation, invoke, alternates)
+            except Exception as e:
+                if (attempt >= retries or _is_input_error(e) or _is_client_error(e)
+                        or member.breaker.state == "open"):
+                    raise
+                delay = random.uniform(0, min(
+                    settings.AI_RETRY_MAX_DELAY_SECONDS,
+                    settings.AI_RETRY_BASE_DELAY_SECONDS * (2 ** attempt),
+                ))
+                attempt += 1
+                metrics.inc("ai_retry", provider=member.name, operation=operation)
+                logger.info(f"AI Provider {member.name} {operation} 第 {attempt} 次重试（{delay:.2f}s 后）: {e}")
+                await asyncio.sleep(delay)
+                # 退避期间熔断器可能已被其他请求打开
+                if not member.breaker.allow():
+                    raise
+
+    async def _hedged(
+        self, member: _Member, operation: str,
+        invoke: Callable[[AIProvider], Awaitable[Any]], alternates: List[_Member],
+    ) -> Any:
+        hedge_after = member.p95(operation) if operation in settings.ai_hedge_operations else None
+        if hedge_after is None:
+            return await self._timed(member, operation, invoke)
+
+        primary = asyncio.ensure_future(self._timed(member, operation, invoke))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        backup = next((m for m in alternates if m.breaker.allow()), member)
+        metrics.inc("ai_hedge", provider=backup.name, operation=operation, result="sent")
+        hedge = asyncio.ensure_future(self._timed(backup, operation, invoke))
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            metrics.inc("ai_hedge", provider=backup.name, operation=operation, result="won")
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _timed(self, member: _Member, operation: str, invoke: Callable[[AIProvider], Awaitable[Any]]) -> Any:
+        started = time.monotonic()
+        try:
+            result = await invoke(member.provider)
+        except asyncio.CancelledError:
+            member.breaker.release()
+            raise
+        except Exception as e:
+            if _is_input_error(e) or _is_client_error(e):
+                member.breaker.release()
+            else:
+                member.breaker.record_failure()
+                if member.breaker.state == "open":
+                    metrics.inc("ai_circuit_open", provider=member.name)
+            metrics.inc("ai_provider_calls", provider=member.name, operation=operation, result="error")
+            raise
+        elapsed = time.monotonic() - started
+        member.breaker.record_success()
+        member.latencies.setdefault(operation, deque(maxlen=_LATENCY_WINDOW)).append(elapsed)
+        metrics.inc("ai_provider_calls", provider=member.name, operation=operation, result="ok")
+        return result
+
+    # ── AIProvider 接口 ─────────────────────────────────────────────────────
+
+    async def generate_design(
+        self,
+        prompt: str,
+        reference_images: Optional[List[str]] = None,
+        design_target: str = "10nails",
+        customer_context: Optional[str] = None
+    ) -> str:
+        return await self._call("generate_design", lambda p: p.generate_design(
+            prompt, reference_images, design_target, customer_context
+        ))
+
+    async def refine_design(
+        self,
+        original_image: str,
+        refinement_instruction: str,
+        design_target: str = "10nails",
+        customer_context: Optional[str] = None,
+        original_prompt: Optional[str] = None
+    ) -> str:
+        return await self._call("refine_design", lambda p: p.refine_design(
+            original_image, refinement_instruction, design_target, customer_context, original_prompt
+        ))
+
+    async def estimate_execution(self, design_image: str) -> Dict:
+        return await self._call("estimate_execution", lambda p: p.estimate_execution(design_image))
+
+    async def compare_images(
+        self,
+        design_image: str,
+        actual_image: str,
+        artist_review: Optional[str] = None,
+        customer_feedback: Optional[str] = None,
+        customer_satisfaction: Optional[int] = None
+    ) -> Dict:
+        return await self._call("compare_images", lambda p: p.compare_images(
+            design_image, actual_image, artist_review, customer_feedback, customer_satisfaction
+        ))
+
+    async def describe_image(self, image_path: str) -> Dict:
+        return await self._call("describe_image", lambda p: p.describe_image(image_path))
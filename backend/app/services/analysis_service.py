@@ -1,26 +1,43 @@
+import asyncio
+import datetime
+import json
 import logging
-from typing import Dict, List
-from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, joinedload
+from app.models.agent_job import AgentJob
 from app.models.service_record import ServiceRecord
 from app.models.comparison_result import ComparisonResult
 from app.models.ability_record import AbilityRecord
 from app.models.ability_dimension import AbilityDimension
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.ai.caching_provider import AIResultCache, normalize_text
 from app.services.ai.factory import AIProviderFactory
+from app.services.job_service import JobService
 
 logger = logging.getLogger(__name__)
 
+REANALYZE_JOB_KIND = "reanalyze_services"
+# Failed / skipped records kept in the job result (the counters cover all of them)
+_MAX_REPORTED_FAILURES = 50
+
 
 class AnalysisService:
     """AI Analysis Service"""
 
     @staticmethod
-    async def analyze_service(db: Session, service_record_id: int) -> ComparisonResult:
+    async def analyze_service(db: Session, service_record_id: int, force: bool = False) -> ComparisonResult:
         """
         Run comprehensive AI analysis on a service record (image + text)
 
+        Re-analysing with unchanged photos (by content hash) and unchanged review text replays
+        the cached analysis JSON instead of calling the AI Provider (ANALYSIS_CACHE_ENABLED).
+
         Args:
             db: Database session
             service_record_id: Service record ID
+            force: Skip the cache and always call the AI Provider (the fresh result replaces the cache entry)
 
         Returns:
             ComparisonResult: Comparison analysis result
@@ -29,29 +46,174 @@ class AnalysisService:
             ValueError: Service record not found, missing required info, etc.
         """
 
-        # 1. Get service record
+        # 1. Get service record and the two images to compare
         service = db.query(ServiceRecord).filter(ServiceRecord.id == service_record_id).first()
         if not service:
             raise ValueError(f"Service record {service_record_id} not found")
+        design_image_url, actual_image_url = AnalysisService._analysis_images(service)
+
+        # 2. Replay a cached analysis for unchanged inputs, otherwise call AI Provider
+        analysis_result = await AnalysisService._fetch_analysis(
+            service, design_image_url, actual_image_url, force=force
+        )
+
+        # 3. Save comparison result, ability records and customer profile in one transaction
+        comparison = AnalysisService._apply_analysis(db, service, analysis_result)
+        db.commit()
+        db.refresh(comparison)
+
+        logger.info(f"AI comprehensive analysis complete, similarity: {analysis_result['similarity_score']}")
+
+        return comparison
+
+    @staticmethod
+    def start_bulk_reanalysis(db: Session, user_id: int, filters: dict) -> AgentJob:
+        """
+        Enqueue a background job that re-analyses the user's completed service records matching filters
+        (see ReanalysisRequest); progress is reported in AgentJob.result["progress"]
+        """
+        return JobService.enqueue(db, user_id, REANALYZE_JOB_KIND, filters)
+
+    @staticmethod
+    def _reanalysis_query(db: Session, user_id: int, filters: dict):
+        """Completed service records of the user that can be analysed, narrowed by filters"""
+        query = db.query(ServiceRecord).filter(
+            ServiceRecord.user_id == user_id,
+            ServiceRecord.status == "completed",
+            ServiceRecord.actual_image_path.isnot(None),
+            ServiceRecord.design_plan_id.isnot(None),
+        )
+        if filters.get("service_ids"):
+            query = query.filter(ServiceRecord.id.in_(filters["service_ids"]))
+        if filters.get("customer_id"):
+            query = query.filter(ServiceRecord.customer_id == filters["customer_id"])
+        if filters.get("date_from"):
+            query = query.filter(ServiceRecord.service_date >= datetime.date.fromisoformat(filters["date_from"]))
+        if filters.get("date_to"):
+            query = query.filter(ServiceRecord.service_date <= datetime.date.fromisoformat(filters["date_to"]))
+        if filters.get("only_unanalyzed"):
+            query = query.filter(~ServiceRecord.comparison_result.has())
+        return query
+
+    @staticmethod
+    async def run_reanalysis_job(db: Session, job: AgentJob) -> dict:
+        """
+        Background job: re-analyse service records in id order, BULK_ANALYSIS_BATCH_SIZE at a time.
 
+        AI calls within a batch run concurrently (at most `concurrency`, default BULK_ANALYSIS_CONCURRENCY);
+        the batch's writes — comparison results, one bulk DELETE + INSERT of ability records — and the
+        checkpoint (last processed id) are committed together, so a resumed or retried job
+        (JobService keeps the checkpoint when the job fails or times out) continues after the
+        last committed batch without re-scoring it. Failed records are counted and do not stop the job.
+        """
+        filters = job.payload or {}
+        previous = job.result or {}
+        progress = dict(previous.get("progress") or {})
+        failures = list(previous.get("failures") or [])
+        query = AnalysisService._reanalysis_query(db, job.user_id, filters)
+        if "total" not in progress:
+            progress = {
+                "total": query.count(), "processed": 0, "succeeded": 0,
+                "failed": 0, "skipped": 0, "last_id": 0,
+            }
+        elif progress["processed"]:
+            logger.info(f"Resuming re-analysis job {job.id} after service record {progress['last_id']}")
+
+        force = filters.get("force", True)
+        semaphore = asyncio.Semaphore(max(filters.get("concurrency") or settings.BULK_ANALYSIS_CONCURRENCY, 1))
+
+        async def fetch(service: ServiceRecord) -> Tuple[ServiceRecord, Optional[Dict], Optional[Tuple[str, str]]]:
+            try:
+                design_image_url, actual_image_url = AnalysisService._analysis_images(service)
+            except ValueError as e:
+                return service, None, ("skipped", str(e))
+            async with semaphore:
+                try:
+                    analysis_result = await AnalysisService._fetch_analysis(
+                        service, design_image_url, actual_image_url, force=force
+                    )
+                except Exception as e:
+                    return service, None, ("failed", str(e))
+            return service, analysis_result, None
+
+        while True:
+            batch = query.options(joinedload(ServiceRecord.design_plan)).filter(
+                ServiceRecord.id > progress["last_id"]
+            ).order_by(ServiceRecord.id).limit(settings.BULK_ANALYSIS_BATCH_SIZE).all()
+            if not batch:
+                break
+
+            scores_by_service = {}
+            for service, analysis_result, error in await asyncio.gather(*(fetch(s) for s in batch)):
+                if error is not None:
+                    outcome, detail = error
+                    progress[outcome] += 1
+                    if len(failures) < _MAX_REPORTED_FAILURES:
+                        failures.append({"service_record_id": service.id, "status": outcome, "error": detail[:300]})
+                    continue
+                AnalysisService._apply_analysis(db, service, analysis_result, write_abilities=False)
+                if "ability_scores" in analysis_result:
+                    scores_by_service[service.id] = (service.user_id, analysis_result["ability_scores"])
+                progress["succeeded"] += 1
+            AnalysisService._update_ability_records(db, scores_by_service)
+
+            progress["processed"] += len(batch)
+            progress["last_id"] = batch[-1].id
+            job.result = {"progress": dict(progress), "failures": list(failures)}
+            db.commit()
+            metrics.inc("bulk_analysis_records", len(batch))
+            logger.info(f"Re-analysis job {job.id}: {progress['processed']}/{progress['total']} processed")
+
+        summary = {key: progress[key] for key in ("total", "processed", "succeeded", "failed", "skipped")}
+        return {
+            "content": json.dumps(summary, ensure_ascii=False),
+            "progress": progress,
+            "failures": failures,
+        }
+
+    @staticmethod
+    def _analysis_images(service: ServiceRecord) -> Tuple[str, str]:
+        """Validate the service record and return (design image, actual image)"""
         if not service.actual_image_path:
             raise ValueError("Service record is missing the actual completed photo")
 
         if not service.design_plan_id:
             raise ValueError("Service record is not linked to a design plan")
 
-        # 2. Get design plan image
         design_plan = service.design_plan
         if not design_plan or not design_plan.generated_image_path:
             raise ValueError("Design plan is missing its generated image")
 
-        design_image_url = design_plan.generated_image_path
-        actual_image_url = service.actual_image_path
+        return design_plan.generated_image_path, service.actual_image_path
+
+    @staticmethod
+    def _is_valid_result(analysis_result) -> bool:
+        return isinstance(analysis_result, dict) and isinstance(analysis_result.get("similarity_score"), (int, float))
+
+    @staticmethod
+    async def _fetch_analysis(
+        service: ServiceRecord, design_image_url: str, actual_image_url: str, force: bool = False
+    ) -> Dict:
+        """
+        Get the analysis JSON from the cache or the AI Provider.
+        Only reads already-loaded attributes of service (no database writes), so several
+        records can be fetched concurrently during bulk re-analysis
+        """
+        cache_key = AnalysisService._cache_key(service, design_image_url, actual_image_url)
+        if settings.ANALYSIS_CACHE_ENABLED and not force:
+            hit = AIResultCache.get(cache_key)
+            if hit is not None and not AnalysisService._is_valid_result(hit["value"]):
+                hit = None
+            metrics.inc("ai_cache", operation="compare_images", result="hit" if hit else "miss")
+            if hit is not None:
+                logger.info(f"Replaying cached AI analysis, service record ID: {service.id}")
+                return hit["value"]
+        elif settings.ANALYSIS_CACHE_ENABLED:
+            metrics.inc("ai_cache", operation="compare_images", result="bypass")
 
-        # 3. Call AI Provider for comprehensive analysis
         ai_provider = AIProviderFactory.get_provider()
 
-        logger.info(f"Starting AI comprehensive analysis, service record ID: {service_record_id}")
+        logger.info(f"Starting AI comprehensive analysis, service record ID: {service.id}")
         logger.info(f"Text context included: artist_review={bool(service.artist_review)}, "
                    f"customer_feedback={bool(service.customer_feedback)}, "
                    f"satisfaction={service.customer_satisfaction}")
@@ -68,9 +230,25 @@ class AnalysisService:
             logger.error(f"AI analysis failed: {e}")
             raise ValueError(f"AI analysis failed: {str(e)}")
 
-        # 4. Save or update comparison result
+        # 只缓存结构完整的结果，否则每次重新分析都会回放同一个错误结果
+        if not AnalysisService._is_valid_result(analysis_result):
+            logger.error(f"AI analysis result is malformed: {str(analysis_result)[:200]}")
+            raise ValueError("AI analysis failed: result is missing similarity_score")
+
+        if settings.ANALYSIS_CACHE_ENABLED:
+            AIResultCache.put(cache_key, "compare_images", analysis_result)
+        return analysis_result
+
+    @staticmethod
+    def _apply_analysis(
+        db: Session, service: ServiceRecord, analysis_result: Dict, write_abilities: bool = True
+    ) -> ComparisonResult:
+        """
+        Write the analysis into ComparisonResult / AbilityRecord / CustomerProfile (caller commits).
+        write_abilities=False leaves ability records to the caller (bulk re-analysis inserts them per batch)
+        """
         comparison = db.query(ComparisonResult).filter(
-            ComparisonResult.service_record_id == service_record_id
+            ComparisonResult.service_record_id == service.id
         ).first()
 
         if comparison:
@@ -82,7 +260,7 @@ class AnalysisService:
         else:
             # Create new record
             comparison = ComparisonResult(
-                service_record_id=service_record_id,
+                service_record_id=service.id,
                 similarity_score=analysis_result["similarity_score"],
                 differences=analysis_result.get("differences", {}),
                 suggestions=analysis_result.get("suggestions", []),
@@ -90,90 +268,98 @@ class AnalysisService:
             )
             db.add(comparison)
 
-        db.commit()
-        db.refresh(comparison)
-
-        # 5. Update ability records
-        if "ability_scores" in analysis_result:
-            await AnalysisService._update_ability_records(
-                db=db,
-                service_record_id=service_record_id,
-                user_id=service.user_id,
-                ability_scores=analysis_result["ability_scores"]
+        if write_abilities and "ability_scores" in analysis_result:
+            AnalysisService._update_ability_records(
+                db, {service.id: (service.user_id, analysis_result["ability_scores"])}
             )
 
-        # 6. Update customer preference profile
         if service.customer_id:
-            await AnalysisService._update_customer_profile(
+            AnalysisService._update_customer_profile(
                 db=db,
                 customer_id=service.customer_id,
                 analysis_result=analysis_result
             )
-
-        logger.info(f"AI comprehensive analysis complete, similarity: {analysis_result['similarity_score']}")
-
         return comparison
 
     @staticmethod
-    async def _update_ability_records(
+    def _cache_key(service: ServiceRecord, design_image_url: str, actual_image_url: str) -> str:
+        """Cache key: design / actual image content hashes plus the review text that goes into the prompt"""
+        return AIResultCache.make_key(settings.AI_PROVIDER.lower(), "compare_images", {
+            "design_image": AIResultCache.image_key(design_image_url),
+            "actual_image": AIResultCache.image_key(actual_image_url),
+            "artist_review": normalize_text(service.artist_review),
+            "customer_feedback": normalize_text(service.customer_feedback),
+            "customer_satisfaction": service.customer_satisfaction,
+        })
+
+    @staticmethod
+    def _update_ability_records(
         db: Session,
-        service_record_id: int,
-        user_id: int,
-        ability_scores: Dict[str, Dict]
-    ):
+        scores_by_service: Dict[int, Tuple[int, Dict[str, Dict]]]
+    ) -> int:
         """
-        Update ability records
+        Replace ability records of one or more service records (caller commits)
+
+        Old records are removed with a single DELETE and new ones written with a single
+        multi-row INSERT; dimensions are resolved once for the whole batch.
 
         Args:
             db: Database session
-            service_record_id: Service record ID
-            user_id: User ID
-            ability_scores: Ability scores dict
+            scores_by_service: {service_record_id: (user_id, ability_scores)}, ability_scores like
                 {
                     "color_matching": {"score": 85, "evidence": "..."},
                     "pattern_precision": {"score": 90, "evidence": "..."}
                 }
+
+        Returns:
+            Number of ability records written
         """
+        if not scores_by_service:
+            return 0
 
         # Delete existing ability records (if re-analyzing)
         db.query(AbilityRecord).filter(
-            AbilityRecord.service_record_id == service_record_id
-        ).delete()
-
-        # Create new ability records
-        for dimension_name, score_data in ability_scores.items():
-            # Find or create ability dimension
-            dimension = db.query(AbilityDimension).filter(
-                AbilityDimension.name == dimension_name
-            ).first()
-
-            if not dimension:
-                # Auto-create new dimension
-                dimension = AbilityDimension(
-                    name=dimension_name,
-                    name_en=dimension_name.lower().replace(" ", "_"),
-                    description=f"Auto-created dimension: {dimension_name}"
-                )
-                db.add(dimension)
-                db.flush()
-
-            # Create ability record
-            ability_record = AbilityRecord(
-                user_id=user_id,
-                service_record_id=service_record_id,
-                dimension_id=dimension.id,
-                score=score_data["score"],
-                evidence=score_data.get("evidence", "")
+            AbilityRecord.service_record_id.in_(list(scores_by_service))
+        ).delete(synchronize_session=False)
+
+        # Find or create ability dimensions
+        names = {name for _, scores in scores_by_service.values() for name in scores}
+        dimension_ids = dict(
+            db.query(AbilityDimension.name, AbilityDimension.id).filter(AbilityDimension.name.in_(names)).all()
+        )
+        for dimension_name in sorted(names - set(dimension_ids)):
+            # Auto-create new dimension
+            dimension = AbilityDimension(
+                name=dimension_name,
+                name_en=dimension_name.lower().replace(" ", "_"),
+                description=f"Auto-created dimension: {dimension_name}"
             )
-            db.add(ability_record)
+            db.add(dimension)
+            db.flush()
+            dimension_ids[dimension_name] = dimension.id
 
-        db.commit()
+        now = datetime.datetime.utcnow()
+        rows = [
+            {
+                "user_id": user_id,
+                "service_record_id": service_record_id,
+                "dimension_id": dimension_ids[dimension_name],
+                "score": score_data["score"],
+                "evidence": score_data.get("evidence", ""),
+                "created_at": now,
+            }
+            for service_record_id, (user_id, ability_scores) in scores_by_service.items()
+            for dimension_name, score_data in ability_scores.items()
+        ]
+        if rows:
+            db.execute(insert(AbilityRecord), rows)
 
-        logger.info(f"Ability records updated, {len(ability_scores)} dimensions")
+        logger.info(f"Ability records updated, {len(rows)} records for {len(scores_by_service)} services")
+        return len(rows)
 
     @staticmethod
-    async def _update_customer_profile(db: Session, customer_id: int, analysis_result: dict):
-        """Incrementally update customer preference profile (colors, styles, notes)"""
+    def _update_customer_profile(db: Session, customer_id: int, analysis_result: dict):
+        """Incrementally update customer preference profile (colors, styles, notes); caller commits"""
         from app.models.customer_profile import CustomerProfile
         customer_updates = analysis_result.get("customer_updates", {})
         if not customer_updates:
@@ -184,6 +370,8 @@ class AnalysisService:
         if not profile:
             profile = CustomerProfile(customer_id=customer_id)
             db.add(profile)
+            # Visible to later records of the same customer in a bulk batch
+            db.flush()
         # append_unique colors
         if "colors" in customer_updates:
             existing = list(profile.color_preferences or [])
@@ -205,7 +393,6 @@ class AnalysisService:
                 if note and note not in existing:
                     existing = (existing + "; " + note).strip("; ")
             profile.pattern_preferences = existing
-        db.commit()
         logger.info(f"Customer profile incrementally updated, customer_id: {customer_id}")
 
     @staticmethod
@@ -290,3 +477,8 @@ class AnalysisService:
         }
 
         return radar_data
+
+
+JobService.register(
+    REANALYZE_JOB_KIND, AnalysisService.run_reanalysis_job, timeout=settings.BULK_ANALYSIS_TIMEOUT_SECONDS
+)
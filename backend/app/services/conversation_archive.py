@@ -0,0 +1,102 @@
+"""
+会话冷存储打包
+
+定期把已结束（completed / abandoned）且超过 CONVERSATION_PACK_AFTER_HOURS 的会话
+从独立目录打包进按月分段的 gzip 文件（见 ConversationFileManager.pack），
+减少磁盘占用与 inode 数量，保持 CONVERSATIONS_DIR 目录列表精简。
+"""
+import asyncio
+import datetime
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import open_session
+from app.models.conversation_session import ConversationSession
+from app.services.conversation_file import ConversationFileManager
+
+logger = logging.getLogger(__name__)
+
+_FINISHED_STATUSES = ("completed", "abandoned")
+# 单次 IN 查询的会话 ID 数（SQLite 参数个数上限）
+_QUERY_CHUNK = 500
+
+
+class ConversationArchiveService:
+    """选出可打包的会话并写入冷存储"""
+
+    @staticmethod
+    def find_packable(
+        db: Session,
+        min_age_hours: Optional[float] = None,
+        session_ids: Optional[List[int]] = None,
+    ) -> Dict[int, str]:
+        """
+        选出已结束超过 min_age_hours 小时的会话，返回 {会话 ID: 分段}，分段按结束月份
+        （completed_at，缺省取 updated_at）。只检查仍以独立目录存放的会话
+        """
+        if min_age_hours is None:
+            min_age_hours = settings.CONVERSATION_PACK_AFTER_HOURS
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours=min_age_hours)
+        candidates = session_ids or list(ConversationFileManager._iter_session_ids())
+
+        segments: Dict[int, str] = {}
+        for start in range(0, len(candidates), _QUERY_CHUNK):
+            chunk = candidates[start:start + _QUERY_CHUNK]
+            sessions = db.query(ConversationSession).filter(
+                ConversationSession.id.in_(chunk),
+                ConversationSession.status.in_(_FINISHED_STATUSES),
+                ConversationSession.updated_at < cutoff,
+            ).all()
+            segments.update(
+                (s.id, (s.completed_at or s.updated_at).strftime("%Y-%m")) for s in sessions
+            )
+        return segments
+
+    @staticmethod
+    def pack_segments(segments: Dict[int, str]) -> int:
+        """持有打包锁写入冷存储（只涉及文件，可在线程池中执行）；其他进程正在打包时直接返回 0"""
+        if not segments:
+            return 0
+        lock = ConversationFileManager.pack_lock()
+        if lock is None:
+            logger.info("会话打包正在其他进程执行，跳过")
+            return 0
+        try:
+            packed = ConversationFileManager.pack(segments)
+        finally:
+            lock.close()
+        if packed:
+            logger.info(f"已打包 {packed} 个会话到冷存储")
+        return packed
+
+    @staticmethod
+    def pack_finished(
+        db: Session,
+        min_age_hours: Optional[float] = None,
+        session_ids: Optional[List[int]] = None,
+    ) -> int:
+        """打包已结束超过 min_age_hours 小时的会话，返回打包的会话数"""
+        segments = ConversationArchiveService.find_packable(db, min_age_hours, session_ids)
+        return ConversationArchiveService.pack_segments(segments)
+
+    @staticmethod
+    async def run_periodically(interval: float) -> None:
+        """
+        后台循环：每 interval 秒执行一次打包（由应用生命周期启动与取消）。
+        候选查询在事件循环线程中执行（SQLite StaticPool 下所有会话共用一个连接，不能跨线程使用），
+        只有文件压缩与写入放到线程池
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                db = open_session()
+                try:
+                    segments = ConversationArchiveService.find_packable(db)
+                finally:
+                    db.close()
+                await asyncio.to_thread(ConversationArchiveService.pack_segments, segments)
+            except Exception as e:
+                logger.error(f"会话打包失败: {e}", exc_info=True)
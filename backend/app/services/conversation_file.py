@@ -2,16 +2,37 @@
 对话文件管理服务
 本地 JSONL 文件存储：每个会话一个文件，按步骤分段，用于审计/回放
 """
+import gzip
+import io
 import json
 import logging
+import os
+import shutil
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterator, List, Optional, Tuple
 import datetime
 
+from app.core.cache import LRUCache
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# 侧车索引格式版本（结构变化时递增，旧索引自动重建）
+_INDEX_VERSION = 2
+# 冷存储目录清单格式版本
+_CATALOG_VERSION = 1
+# 倒序分页时每次向前读取的块大小
+_REVERSE_BLOCK = 64 * 1024
+# 分页接口返回的消息角色（工具调用与系统说明不展示给客户端）
+_PAGE_ROLES = ("user", "assistant")
+# 已打包会话分页用的进程内缓存：{(分段路径, 偏移): (解压后的字节, 索引)}
+_packed_members: LRUCache[Tuple[bytes, dict]] = LRUCache(maxsize=16)
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境：不加锁
+    fcntl = None
+
 
 class ConversationFileManager:
     """
@@ -30,6 +51,27 @@ class ConversationFileManager:
       - name: 工具名称（tool 角色，可选）
       - ui_metadata: UI 元数据（assistant 最终回复，可选）
       - ts: ISO 8601 时间戳
+
+    归档采用纯追加方式：步骤完成时只追加一行归档标记
+      {"_archive_marker": true, "step": "collect", "ts": ...}
+    标记行是归档状态的唯一依据——位于某步骤标记之前的该步骤消息即视为已归档，
+    读取方从标记推导 archived，不再重写文件。旧文件中已写入的 archived=true 仍然生效。
+    compact() 可离线将推导出的 archived 状态物化回文件（临时文件 + rename 原子替换）。
+
+    侧车索引：{CONVERSATIONS_DIR}/{session_id}/index.json
+      {"version": 2, "size": 已索引字节数,
+       "steps": {"collect": [[start, end], ...]},
+       "archived": {"collect": 最近一条归档标记的结束偏移}}
+    记录每个步骤的消息行所在字节区间（半开区间，相邻行合并），
+    读取当前步骤时直接 seek 到最近一次归档之后的区间，只解码该步骤的未归档消息。
+    索引始终覆盖文件的 [0, size) 部分；文件增长后（含其他进程追加）
+    从 size 处增量扫描补齐，文件被截断/重写时整体重建。
+
+    冷存储：已结束的会话由 pack() 打包为分段文件中的一个 gzip member，并删除会话目录
+      {CONVERSATIONS_DIR}/archive/{YYYY-MM}.jsonl.gz   每个会话一个独立 gzip member，追加写入
+      {CONVERSATIONS_DIR}/archive/catalog.json
+      {"version": 1, "sessions": {"12": {"segment": "2026-10.jsonl.gz", "offset": 0, "length": 812, "size": 4096}}}
+    read_full_history 在会话目录不存在时按清单 seek 到对应 member 解压读取。
     """
 
     @staticmethod
@@ -49,39 +91,64 @@ class ConversationFileManager:
         return ConversationFileManager.get_session_dir(session_id) / "messages.jsonl"
 
     @staticmethod
-    def append_message(session_id: int, message: dict) -> None:
-        """追加一条消息到 JSONL 文件（每行一个 JSON 对象）"""
+    def _messages_path(session_id: int) -> Path:
+        """返回 JSONL 文件路径（只读场景使用，不创建目录）"""
+        return ConversationFileManager._base_dir() / str(session_id) / "messages.jsonl"
+
+    @staticmethod
+    def _index_path(session_id: int) -> Path:
+        return ConversationFileManager._base_dir() / str(session_id) / "index.json"
+
+    @staticmethod
+    def get_log_size(session_id: int) -> int:
+        """返回 JSONL 文件当前字节数（文件不存在时为 0），供调用方判断缓存是否过期"""
+        try:
+            return ConversationFileManager._messages_path(session_id).stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    def append_message(session_id: int, message: dict) -> Optional[Tuple[int, int]]:
+        """
+        追加一条消息到 JSONL 文件（每行一个 JSON 对象）。
+        侧车索引不在写入时更新，由下次读取时从已索引的位置增量补齐（一次扫描覆盖多次追加）。
+        返回本行写入的字节区间 (start, end)；写入失败返回 None。
+        """
         if "ts" not in message:
             message["ts"] = datetime.datetime.utcnow().isoformat()
 
         file_path = ConversationFileManager.get_file_path(session_id)
+        line = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
         try:
-            with open(file_path, "a", encoding="utf-8") as f:
-                f.write(json.dumps(message, ensure_ascii=False) + "\n")
+            with open(file_path, "ab") as f:
+                f.write(line)
+                end = f.tell()
         except Exception as e:
             logger.error(f"写入对话文件失败 session_id={session_id}: {e}")
+            return None
+        return end - len(line), end
 
     @staticmethod
     def read_current_step_messages(session_id: int, current_step: str) -> List[dict]:
         """
         读取当前步骤（未归档）的消息，用于构建 LLM 上下文。
-        跳过归档标记行，只返回普通消息对象。
+        通过侧车索引只读取该步骤所在的字节区间；跳过归档标记行，只返回普通消息对象。
         """
-        file_path = ConversationFileManager.get_file_path(session_id)
+        file_path = ConversationFileManager._messages_path(session_id)
         if not file_path.exists():
             return []
 
         messages = []
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    try:
-                        msg = json.loads(line)
-                    except json.JSONDecodeError:
-                        continue
+            index = ConversationFileManager._load_index(session_id)
+            archived_upto = index["archived"].get(current_step, 0)
+            ranges = [
+                [max(start, archived_upto), end]
+                for start, end in index["steps"].get(current_step, [])
+                if end > archived_upto
+            ]
+            with open(file_path, "rb") as f:
+                for msg in ConversationFileManager._iter_ranges(f, ranges):
                     # 跳过归档标记行
                     if msg.get("_archive_marker"):
                         continue
@@ -94,71 +161,454 @@ class ConversationFileManager:
         return messages
 
     @staticmethod
-    def archive_step(session_id: int, step_name: str) -> None:
+    def archive_step(session_id: int, step_name: str) -> Optional[Tuple[int, int]]:
         """
         将指定步骤的所有消息标记为 archived。
-        在原文件末尾追加一条归档标记，并重写文件将该步骤的 archived 设为 true。
+        只在文件末尾追加一条归档标记行（O(1) 写入，不重写文件），返回标记行的字节区间。
         """
-        file_path = ConversationFileManager.get_file_path(session_id)
+        file_path = ConversationFileManager._messages_path(session_id)
         if not file_path.exists():
-            return
+            return None
+
+        marker = {
+            "_archive_marker": True,
+            "step": step_name,
+            "ts": datetime.datetime.utcnow().isoformat(),
+        }
+        return ConversationFileManager.append_message(session_id, marker)
 
-        # 读取所有行，将匹配步骤的消息 archived 设为 true
-        updated_lines = []
+    @staticmethod
+    def read_full_history(session_id: int) -> List[dict]:
+        """读取完整历史（用于回放/审计），包含所有消息和归档标记；已打包的会话从冷存储读取"""
+        file_path = ConversationFileManager._messages_path(session_id)
+        messages = []
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    try:
-                        msg = json.loads(line)
-                    except json.JSONDecodeError:
-                        updated_lines.append(line)
-                        continue
-                    if msg.get("step") == step_name and not msg.get("_archive_marker"):
-                        msg["archived"] = True
-                    updated_lines.append(json.dumps(msg, ensure_ascii=False))
+            if file_path.exists():
+                with open(file_path, "rb") as f:
+                    messages = ConversationFileManager._decode_lines(f)
+            else:
+                messages = ConversationFileManager._read_packed(session_id)
         except Exception as e:
-            logger.error(f"归档步骤失败 session_id={session_id} step={step_name}: {e}")
+            logger.error(f"读取完整历史失败 session_id={session_id}: {e}")
+
+        return ConversationFileManager._apply_archive_markers(messages)
+
+    @staticmethod
+    def read_page(
+        session_id: int, cursor: Optional[int] = None, limit: int = 50, order: str = "desc"
+    ) -> Tuple[List[dict], Optional[int], bool]:
+        """
+        按字节偏移游标分页读取可展示的消息（user / assistant 文本回复），跳过归档标记与工具消息。
+        order="asc" 时游标为下一页起始偏移（缺省为文件开头），"desc" 时为下一页结束偏移（缺省为文件末尾），
+        消息按 order 顺序返回。archived 由侧车索引中各步骤最近一次归档标记的位置推导，
+        每页只读取该页覆盖的字节。返回 (消息列表, 下一页游标, 是否还有更多)：
+        desc 读到文件开头时游标为 None；asc 读到末尾时游标为当前末尾，可用于继续拉取新消息。
+        游标不在行边界时抛出 ValueError
+        """
+        file_path = ConversationFileManager._messages_path(session_id)
+        data = None
+        if file_path.exists():
+            index = ConversationFileManager._load_index(session_id)
+        else:
+            # 已打包的会话：在内存中按同样的偏移分页
+            packed = ConversationFileManager._packed_member(session_id)
+            if packed is None:
+                return [], None, False
+            data, index = packed
+
+        with (open(file_path, "rb") if data is None else io.BytesIO(data)) as f:
+            size = index["size"]
+            if cursor is None:
+                cursor = 0 if order == "asc" else size
+            if cursor > size:
+                raise ValueError("Invalid cursor")
+            if cursor > 0:
+                f.seek(cursor - 1)
+                if f.read(1) != b"\n":
+                    raise ValueError("Invalid cursor")
+
+            if order == "asc":
+                lines = ConversationFileManager._iter_lines(f, cursor, size)
+            else:
+                lines = ConversationFileManager._iter_lines_reverse(f, cursor)
+
+            messages: List[dict] = []
+            next_cursor = cursor
+            has_more = False
+            for start, raw in lines:
+                if len(messages) >= limit:
+                    has_more = True
+                    break
+                next_cursor = start + len(raw) if order == "asc" else start
+                try:
+                    msg = json.loads(raw)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+                if (
+                    not isinstance(msg, dict)
+                    or msg.get("_archive_marker")
+                    or msg.get("role") not in _PAGE_ROLES
+                    or not msg.get("content")
+                ):
+                    continue
+                msg["archived"] = bool(
+                    msg.get("archived") or index["archived"].get(msg.get("step"), 0) > start
+                )
+                messages.append(msg)
+        if order == "desc" and not has_more:
+            next_cursor = None
+        return messages, next_cursor, has_more
+
+    @staticmethod
+    def _iter_lines(f, start: int, end: int) -> Iterator[Tuple[int, bytes]]:
+        """从 start 向后逐行产出 (行起始偏移, 行内容)，止于 end"""
+        f.seek(start)
+        offset = start
+        while offset < end:
+            raw = f.readline()
+            if not raw:
+                return
+            yield offset, raw
+            offset += len(raw)
+
+    @staticmethod
+    def _iter_lines_reverse(f, end: int) -> Iterator[Tuple[int, bytes]]:
+        """从 end（行边界）向前逐行产出 (行起始偏移, 行内容)，按块读取"""
+        pos = end
+        buffer = b""
+        while True:
+            # buffer 对应 [pos, 上一次产出的行首)，以换行结尾；在末尾换行之前找上一行的行首
+            idx = buffer.rfind(b"\n", 0, len(buffer) - 1)
+            if idx >= 0:
+                yield pos + idx + 1, buffer[idx + 1:]
+                buffer = buffer[:idx + 1]
+                continue
+            if pos == 0:
+                if buffer:
+                    yield 0, buffer
+                return
+            size = min(_REVERSE_BLOCK, pos)
+            pos -= size
+            f.seek(pos)
+            buffer = f.read(size) + buffer
+
+    @staticmethod
+    def _decode_lines(lines) -> List[dict]:
+        messages = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                messages.append(json.loads(line))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+        return messages
+
+    @staticmethod
+    def _apply_archive_markers(messages: List[dict]) -> List[dict]:
+        """根据归档标记推导每条消息的 archived 状态（标记之前的同步骤消息已归档）"""
+        archived_steps = set()
+        for msg in reversed(messages):
+            if not isinstance(msg, dict):
+                continue
+            if msg.get("_archive_marker"):
+                archived_steps.add(msg.get("step"))
+            elif msg.get("step") in archived_steps:
+                msg["archived"] = True
+        return messages
+
+    @staticmethod
+    def compact(session_id: int) -> bool:
+        """
+        离线压实：把由归档标记推导出的 archived 状态写回每行，丢弃空行/损坏行。
+        写入同目录临时文件后 rename 原子替换；期间若有新追加的字节，一并拷贝到新文件末尾。
+        返回是否执行了压实。
+        """
+        file_path = ConversationFileManager._messages_path(session_id)
+        if not file_path.exists():
+            return False
+
+        size_before = file_path.stat().st_size
+        with open(file_path, "rb") as f:
+            raw = f.read(size_before)
+        # 只处理完整行，尾部不完整的行原样保留
+        complete_end = raw.rfind(b"\n") + 1
+        messages = []
+        for line in raw[:complete_end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                messages.append(json.loads(line))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+        ConversationFileManager._apply_archive_markers(messages)
+
+        tmp_path = file_path.with_name(f"{file_path.name}.{os.getpid()}.compact")
+        try:
+            with open(tmp_path, "wb") as out:
+                for msg in messages:
+                    out.write((json.dumps(msg, ensure_ascii=False) + "\n").encode("utf-8"))
+                out.write(raw[complete_end:])
+                with open(file_path, "rb") as f:
+                    f.seek(size_before)
+                    out.write(f.read())
+            os.replace(tmp_path, file_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+        ConversationFileManager.rebuild_index(session_id)
+        return True
+
+    @staticmethod
+    def compact_all() -> int:
+        """压实 CONVERSATIONS_DIR 下所有会话文件，返回处理的会话数"""
+        count = 0
+        for session_id in ConversationFileManager._iter_session_ids():
+            try:
+                if ConversationFileManager.compact(session_id):
+                    count += 1
+            except Exception as e:
+                logger.error(f"压实对话文件失败 session_id={session_id}: {e}")
+        return count
+
+    @staticmethod
+    def _iter_session_ids() -> Iterator[int]:
+        """遍历 CONVERSATIONS_DIR 下的会话目录，产出会话 ID"""
+        base_dir = ConversationFileManager._base_dir()
+        if not base_dir.exists():
             return
+        for session_dir in sorted(base_dir.iterdir()):
+            if session_dir.is_dir() and session_dir.name.isdigit():
+                yield int(session_dir.name)
+
+    # ── 冷存储 ────────────────────────────────────────────────────────────
 
-        # 重写文件
+    @staticmethod
+    def _archive_dir() -> Path:
+        return ConversationFileManager._base_dir() / "archive"
+
+    @staticmethod
+    def load_catalog() -> dict:
+        """读取冷存储清单（不存在或损坏时返回空清单）"""
+        catalog_path = ConversationFileManager._archive_dir() / "catalog.json"
         try:
-            with open(file_path, "w", encoding="utf-8") as f:
-                for line in updated_lines:
-                    f.write(line + "\n")
-
-            # 追加归档标记行
-            marker = {
-                "_archive_marker": True,
-                "step": step_name,
-                "ts": datetime.datetime.utcnow().isoformat(),
-            }
-            with open(file_path, "a", encoding="utf-8") as f:
-                f.write(json.dumps(marker, ensure_ascii=False) + "\n")
-        except Exception as e:
-            logger.error(f"重写对话文件失败 session_id={session_id}: {e}")
+            with open(catalog_path, "r", encoding="utf-8") as f:
+                catalog = json.load(f)
+            if isinstance(catalog, dict) and catalog.get("version") == _CATALOG_VERSION:
+                return catalog
+        except FileNotFoundError:
+            pass
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"读取冷存储清单失败: {e}")
+        return {"version": _CATALOG_VERSION, "sessions": {}}
 
     @staticmethod
-    def read_full_history(session_id: int) -> List[dict]:
-        """读取完整历史（用于回放/审计），包含所有消息和归档标记"""
-        file_path = ConversationFileManager.get_file_path(session_id)
-        if not file_path.exists():
+    def _save_catalog(catalog: dict) -> None:
+        catalog_path = ConversationFileManager._archive_dir() / "catalog.json"
+        tmp_path = catalog_path.with_name(f"{catalog_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(catalog, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, catalog_path)
+
+    @staticmethod
+    def _packed_member(session_id: int) -> Optional[Tuple[bytes, dict]]:
+        """
+        已打包会话解压后的字节与对应的索引（不存在时返回 None）。
+        member 写入后不再改变，按 (分段, 偏移) 缓存在进程内，翻页时不重复解压与扫描
+        """
+        entry = ConversationFileManager.load_catalog()["sessions"].get(str(session_id))
+        if entry is None:
+            return None
+        segment_path = ConversationFileManager._archive_dir() / entry["segment"]
+        key = (str(segment_path), entry["offset"])
+        cached = _packed_members.get(key)
+        if cached is not None:
+            return cached
+        with open(segment_path, "rb") as f:
+            f.seek(entry["offset"])
+            data = gzip.decompress(f.read(entry["length"]))
+        index = ConversationFileManager._empty_index()
+        ConversationFileManager._scan(io.BytesIO(data), index)
+        _packed_members.set(key, (data, index))
+        return data, index
+
+    @staticmethod
+    def _read_packed(session_id: int) -> List[dict]:
+        entry = ConversationFileManager.load_catalog()["sessions"].get(str(session_id))
+        if entry is None:
             return []
+        segment_path = ConversationFileManager._archive_dir() / entry["segment"]
+        with open(segment_path, "rb") as f:
+            f.seek(entry["offset"])
+            raw = gzip.decompress(f.read(entry["length"]))
+        return ConversationFileManager._decode_lines(raw.splitlines())
 
-        messages = []
+    @staticmethod
+    def pack(sessions: Dict[int, str]) -> int:
+        """
+        将已结束会话的 JSONL 压缩追加到冷存储分段（{会话 ID: 分段名}，如 {12: "2026-10"}），
+        更新清单后删除会话目录。顺序为 分段写入并 fsync → 清单原子替换 → 删除目录，
+        任一步中断都不会丢数据（最坏情况是分段中残留未被清单引用的字节，或会话被重复打包）。
+        调用方需保证这些会话不再追加消息，并通过 pack_lock() 串行化打包。返回打包的会话数
+        """
+        archive_dir = ConversationFileManager._archive_dir()
+        archive_dir.mkdir(parents=True, exist_ok=True)
+        entries = {}
+        for session_id, segment in sessions.items():
+            file_path = ConversationFileManager._messages_path(session_id)
+            if not file_path.exists():
+                continue
+            raw = file_path.read_bytes()
+            data = gzip.compress(raw, mtime=0)
+            segment_name = f"{segment}.jsonl.gz"
+            with open(archive_dir / segment_name, "ab") as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            entries[str(session_id)] = {
+                "segment": segment_name,
+                "offset": offset,
+                "length": len(data),
+                "size": len(raw),
+            }
+        if not entries:
+            return 0
+
+        catalog = ConversationFileManager.load_catalog()
+        catalog["sessions"].update(entries)
+        ConversationFileManager._save_catalog(catalog)
+        for session_id in entries:
+            shutil.rmtree(ConversationFileManager._base_dir() / session_id, ignore_errors=True)
+        return len(entries)
+
+    @staticmethod
+    def pack_lock():
+        """打包互斥锁（多 worker 只允许一个进程打包）；返回已持有的锁文件，拿不到锁时返回 None"""
+        archive_dir = ConversationFileManager._archive_dir()
+        archive_dir.mkdir(parents=True, exist_ok=True)
+        lock_file = open(archive_dir / ".lock", "w")
+        if fcntl is None:
+            return lock_file
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    try:
-                        messages.append(json.loads(line))
-                    except json.JSONDecodeError:
-                        continue
-        except Exception as e:
-            logger.error(f"读取完整历史失败 session_id={session_id}: {e}")
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
 
-        return messages
+    # ── 侧车索引 ──────────────────────────────────────────────────────────
+
+    @staticmethod
+    def rebuild_index(session_id: int) -> Optional[dict]:
+        """丢弃现有索引，从头扫描 JSONL 文件重建。文件不存在时返回 None"""
+        file_path = ConversationFileManager._messages_path(session_id)
+        if not file_path.exists():
+            return None
+        index = ConversationFileManager._empty_index()
+        with open(file_path, "rb") as f:
+            ConversationFileManager._scan(f, index)
+        ConversationFileManager._save_index(session_id, index)
+        return index
+
+    @staticmethod
+    def rebuild_all_indexes() -> int:
+        """为 CONVERSATIONS_DIR 下所有会话目录重建索引，返回处理的会话数"""
+        count = 0
+        for session_id in ConversationFileManager._iter_session_ids():
+            try:
+                if ConversationFileManager.rebuild_index(session_id) is not None:
+                    count += 1
+            except Exception as e:
+                logger.error(f"重建对话索引失败 session_id={session_id}: {e}")
+        return count
+
+    @staticmethod
+    def _empty_index() -> dict:
+        return {"version": _INDEX_VERSION, "size": 0, "steps": {}, "archived": {}}
+
+    @staticmethod
+    def _load_index(session_id: int) -> dict:
+        """
+        读取侧车索引，并与文件当前大小对齐：
+        - 索引缺失/损坏/版本不符，或文件比索引记录的更短（被重写）→ 全量重建
+        - 文件比索引更长（新追加的行）→ 从 size 处增量扫描并保存
+        """
+        file_path = ConversationFileManager._messages_path(session_id)
+        file_size = file_path.stat().st_size if file_path.exists() else 0
+
+        index = None
+        index_path = ConversationFileManager._index_path(session_id)
+        if index_path.exists():
+            try:
+                with open(index_path, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                index = None
+        if (
+            not isinstance(index, dict)
+            or index.get("version") != _INDEX_VERSION
+            or index.get("size", 0) > file_size
+        ):
+            index = ConversationFileManager._empty_index()
+
+        if index["size"] < file_size:
+            with open(file_path, "rb") as f:
+                ConversationFileManager._scan(f, index)
+            ConversationFileManager._save_index(session_id, index)
+        return index
+
+    @staticmethod
+    def _scan(f, index: dict) -> None:
+        """从 index["size"] 开始扫描完整行，登记各步骤的字节区间（不完整的尾行留待下次）"""
+        offset = index["size"]
+        f.seek(offset)
+        steps: Dict[str, list] = index["steps"]
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            start, offset = offset, offset + len(raw)
+            if not raw.strip():
+                continue
+            try:
+                msg = json.loads(raw)
+                step = msg.get("step")
+            except (json.JSONDecodeError, UnicodeDecodeError, AttributeError):
+                continue
+            if not step:
+                continue
+            if msg.get("_archive_marker"):
+                index["archived"][step] = offset
+                continue
+            ranges = steps.setdefault(step, [])
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = offset
+            else:
+                ranges.append([start, offset])
+        index["size"] = offset
+
+    @staticmethod
+    def _save_index(session_id: int, index: dict) -> None:
+        """原子写入索引（临时文件 + rename）"""
+        index_path = ConversationFileManager._index_path(session_id)
+        tmp_path = index_path.with_name(f"{index_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+
+    @staticmethod
+    def _iter_ranges(f, ranges: List[List[int]]) -> Iterator[dict]:
+        """按字节区间读取并解码消息行"""
+        for start, end in ranges:
+            f.seek(start)
+            for raw in f.read(end - start).splitlines():
+                if not raw.strip():
+                    continue
+                try:
+                    yield json.loads(raw)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
@@ -6,8 +6,11 @@ from sqlalchemy import and_, or_, desc
 from typing import Optional, List, Tuple
 from fastapi import HTTPException, status
 import datetime
+import json
 import logging
 
+from app.core.config import settings
+from app.models.agent_job import AgentJob
 from app.models.design_plan import DesignPlan
 from app.models.customer import Customer
 from app.schemas.design import (
@@ -15,10 +18,15 @@ from app.schemas.design import (
     DesignRefineRequest,
     DesignPlanUpdate,
 )
+from app.services.ai.caching_provider import reads_bypassed, without_cache_reads
 from app.services.ai.factory import AIProviderFactory
+from app.services.job_service import JobService
 
 logger = logging.getLogger(__name__)
 
+# 后台执行估算的任务类型
+ESTIMATE_JOB_KIND = "estimate_design"
+
 
 class DesignService:
     """设计方案服务"""
@@ -82,6 +90,8 @@ class DesignService:
         try:
             # 获取AI Provider
             ai_provider = AIProviderFactory.get_provider()
+            if design_request.bypass_cache:
+                ai_provider = without_cache_reads(ai_provider)
 
             # 构建客户甲型上下文
             customer_context = None
@@ -105,13 +115,6 @@ class DesignService:
             )
             logger.info(f"AI生成成功，图片URL: {generated_image_url}")
 
-            # 调用AI估算执行难度
-            logger.info("调用AI估算执行难度...")
-            estimation = await ai_provider.estimate_execution(
-                design_image=generated_image_url
-            )
-            logger.info(f"AI估算成功: {estimation}")
-
             # 创建设计方案记录
             design_plan = DesignPlan(
                 user_id=user_id,
@@ -123,17 +126,12 @@ class DesignService:
                 style_keywords=design_request.style_keywords,
                 reference_images=design_request.reference_images,
                 version=1,
-                estimated_duration=estimation.get("estimated_duration"),
-                estimated_materials=estimation.get("materials"),
-                difficulty_level=estimation.get("difficulty_level"),
                 title=design_request.title,
                 notes=design_request.notes,
                 is_archived=0
             )
 
-            db.add(design_plan)
-            db.commit()
-            db.refresh(design_plan)
+            design_plan = await DesignService._save_with_estimation(db, design_plan, ai_provider)
 
             logger.info(f"设计方案创建成功，ID: {design_plan.id}")
             return design_plan
@@ -181,6 +179,8 @@ class DesignService:
         try:
             # 获取AI Provider
             ai_provider = AIProviderFactory.get_provider()
+            if refine_request.bypass_cache:
+                ai_provider = without_cache_reads(ai_provider)
 
             # 构建客户甲型上下文信息（仅客户档案数据）
             customer_context = None
@@ -198,13 +198,6 @@ class DesignService:
             )
             logger.info(f"AI优化成功，图片URL: {refined_image_url}")
 
-            # 调用AI估算执行难度
-            logger.info("调用AI估算执行难度...")
-            estimation = await ai_provider.estimate_execution(
-                design_image=refined_image_url
-            )
-            logger.info(f"AI估算成功: {estimation}")
-
             # 创建新版本设计方案
             new_design = DesignPlan(
                 user_id=user_id,
@@ -218,17 +211,12 @@ class DesignService:
                 parent_design_id=original_design.id,
                 version=original_design.version + 1,
                 refinement_instruction=refine_request.refinement_instruction,
-                estimated_duration=estimation.get("estimated_duration"),
-                estimated_materials=estimation.get("materials"),
-                difficulty_level=estimation.get("difficulty_level"),
                 title=f"{original_design.title} v{original_design.version + 1}" if original_design.title else None,
                 notes=original_design.notes,
                 is_archived=0
             )
 
-            db.add(new_design)
-            db.commit()
-            db.refresh(new_design)
+            new_design = await DesignService._save_with_estimation(db, new_design, ai_provider)
 
             logger.info(f"优化设计方案创建成功，ID: {new_design.id}, 版本: {new_design.version}")
             return new_design
@@ -240,6 +228,80 @@ class DesignService:
                 detail=f"AI优化设计失败: {str(e)}"
             )
 
+    @staticmethod
+    def _apply_estimation(design_plan: DesignPlan, estimation: dict) -> None:
+        """将 AI 估算结果写入设计方案"""
+        design_plan.estimated_duration = estimation.get("estimated_duration")
+        design_plan.estimated_materials = estimation.get("materials")
+        design_plan.difficulty_level = estimation.get("difficulty_level")
+        design_plan.estimation_status = "succeeded"
+        design_plan.estimation_error = None
+        design_plan.estimated_at = datetime.datetime.utcnow()
+
+    @staticmethod
+    async def _save_with_estimation(db: Session, design_plan: DesignPlan, ai_provider) -> DesignPlan:
+        """
+        保存设计方案并完成执行估算（DESIGN_ESTIMATION_MODE）：
+        - inline: 估算完成后一并写入
+        - background: 设计图生成后立即写入（estimation_status=pending），估算作为后台任务回填，
+          省去请求路径上的一次视觉模型调用
+        """
+        if settings.DESIGN_ESTIMATION_MODE.lower() == "background":
+            design_plan.estimation_status = "pending"
+            db.add(design_plan)
+            db.commit()
+            JobService.enqueue(
+                db, design_plan.user_id, ESTIMATE_JOB_KIND,
+                {"design_id": design_plan.id, "bypass_cache": reads_bypassed(ai_provider)},
+            )
+            db.refresh(design_plan)
+            logger.info(f"设计方案 {design_plan.id} 已保存，执行估算转入后台")
+            return design_plan
+
+        # 调用AI估算执行难度
+        logger.info("调用AI估算执行难度...")
+        estimation = await ai_provider.estimate_execution(
+            design_image=design_plan.generated_image_path
+        )
+        logger.info(f"AI估算成功: {estimation}")
+
+        DesignService._apply_estimation(design_plan, estimation)
+        db.add(design_plan)
+        db.commit()
+        db.refresh(design_plan)
+        return design_plan
+
+    @staticmethod
+    async def run_estimation_job(db: Session, job: AgentJob) -> dict:
+        """
+        后台任务：估算设计执行难度并回填设计方案。
+        失败（包括超时、多次中断）由 JobService 调用 mark_estimation_failed 记录到 estimation_status / estimation_error
+        """
+        payload = job.payload or {}
+        design_id = payload.get("design_id")
+        design_plan = db.get(DesignPlan, design_id)
+        if design_plan is None:
+            raise ValueError(f"设计方案 ID {design_id} 不存在")
+
+        ai_provider = AIProviderFactory.get_provider()
+        if payload.get("bypass_cache"):
+            ai_provider = without_cache_reads(ai_provider)
+        estimation = await ai_provider.estimate_execution(
+            design_image=design_plan.generated_image_path
+        )
+
+        DesignService._apply_estimation(design_plan, estimation)
+        logger.info(f"设计方案 {design_id} 执行估算完成: {estimation}")
+        return {"content": json.dumps({"design_id": design_id, **estimation}, ensure_ascii=False)}
+
+    @staticmethod
+    def mark_estimation_failed(db: Session, job: AgentJob, detail: str) -> None:
+        """估算任务失败回调：标记设计方案估算失败，前端停止轮询"""
+        design_plan = db.get(DesignPlan, (job.payload or {}).get("design_id"))
+        if design_plan is not None and design_plan.estimation_status == "pending":
+            design_plan.estimation_status = "failed"
+            design_plan.estimation_error = detail[:500]
+
     @staticmethod
     def get_design_by_id(
         db: Session,
@@ -492,3 +554,8 @@ class DesignService:
         ).limit(limit).all()
 
         return designs
+
+
+JobService.register(
+    ESTIMATE_JOB_KIND, DesignService.run_estimation_job, on_failure=DesignService.mark_estimation_failed
+)
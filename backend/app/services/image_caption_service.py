@@ -0,0 +1,178 @@
+"""
+图片描述服务
+
+会话中上传的图片只做一次视觉理解：生成简短描述（caption + 主要颜色 + 风格标签 + 指甲数量），
+按图片内容 SHA-256 存入 image_captions 表。Agent 在提示词中引用描述文本而不是只给出图片路径，
+同一张图片在后续回合或其他会话中再次出现时直接命中缓存，不再调用视觉模型。
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Dict, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.database import open_session
+from app.models.image_caption import ImageCaption
+from app.services.ai.base import AIProvider
+
+logger = logging.getLogger(__name__)
+
+# 描述字段的长度上限（描述文本会进入每一轮的系统提示词）
+_MAX_CAPTION_CHARS = 300
+_MAX_TAGS = 6
+
+
+class ImageCaptionService:
+    """图片描述服务（按内容哈希缓存）"""
+
+    # 进程内缓存：内容哈希 -> 描述文本，命中时不访问数据库
+    _memory: LRUCache[str] = LRUCache(maxsize=1024)
+    # 正在生成描述的图片：同一张图并发上传时只调用一次模型
+    _inflight: Dict[str, "asyncio.Task"] = {}
+
+    @staticmethod
+    def resolve_path(image_path: str) -> str:
+        """/uploads/... 形式的 URL 转为本地文件路径"""
+        if image_path.startswith("/uploads/"):
+            return os.path.join(settings.UPLOAD_DIR, image_path[len("/uploads/"):])
+        return image_path
+
+    @classmethod
+    def content_hash(cls, image_path: str) -> str:
+        """图片内容的 SHA-256（分块读取）"""
+        digest = hashlib.sha256()
+        with open(cls.resolve_path(image_path), "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def format_caption(caption: ImageCaption) -> str:
+        """将描述记录压缩为一行文本（写入系统提示词与对话记录）"""
+        parts = [caption.caption.rstrip(".。") + "."]
+        if caption.palette:
+            parts.append(f"Colors: {', '.join(caption.palette)}.")
+        if caption.style_tags:
+            parts.append(f"Style: {', '.join(caption.style_tags)}.")
+        if caption.nail_count is not None:
+            parts.append(f"Nails: {caption.nail_count}.")
+        return " ".join(parts)
+
+    @classmethod
+    def get_cached(cls, content_hash: str) -> Optional[str]:
+        """读取已缓存的描述文本（进程内缓存 → image_captions 表）"""
+        text = cls._memory.get(content_hash)
+        if text is not None:
+            return text
+        db = open_session()
+        try:
+            row = db.query(ImageCaption).filter(ImageCaption.content_hash == content_hash).first()
+            if row is None:
+                return None
+            text = cls.format_caption(row)
+        finally:
+            db.close()
+        cls._memory.set(content_hash, text)
+        return text
+
+    @classmethod
+    async def describe(cls, image_path: str, provider: Optional[AIProvider] = None) -> Optional[str]:
+        """
+        返回图片的描述文本：命中缓存直接返回，否则调用 AI Provider 生成并缓存。
+        图片无法读取、模型调用失败或超时时返回 None（调用方退回为只提供图片路径）
+        """
+        if not settings.IMAGE_CAPTIONS_ENABLED:
+            return None
+        try:
+            content_hash = await asyncio.to_thread(cls.content_hash, image_path)
+        except OSError as e:
+            logger.warning(f"无法读取图片 {image_path}，跳过描述: {e}")
+            return None
+
+        text = cls.get_cached(content_hash)
+        if text is not None:
+            metrics.inc("image_caption_cache", result="hit")
+            return text
+
+        task = cls._inflight.get(content_hash)
+        if task is None:
+            metrics.inc("image_caption_cache", result="miss")
+            task = asyncio.ensure_future(cls._generate(content_hash, image_path, provider))
+            cls._inflight[content_hash] = task
+            task.add_done_callback(lambda _: cls._inflight.pop(content_hash, None))
+        else:
+            metrics.inc("image_caption_cache", result="shared")
+        # shield：单个等待方被取消时不影响其他等待同一张图片的请求
+        return await asyncio.shield(task)
+
+    @classmethod
+    async def _generate(
+        cls, content_hash: str, image_path: str, provider: Optional[AIProvider]
+    ) -> Optional[str]:
+        if provider is None:
+            from app.services.ai.factory import AIProviderFactory
+            provider = AIProviderFactory.get_provider()
+        try:
+            result = await asyncio.wait_for(
+                provider.describe_image(image_path),
+                timeout=settings.IMAGE_CAPTION_TIMEOUT_SECONDS,
+            )
+        except Exception as e:
+            metrics.inc("image_caption_errors")
+            logger.warning(f"图片描述生成失败 {image_path}: {e!r}")
+            return None
+
+        caption = cls._normalize(content_hash, result)
+        if caption is None:
+            logger.warning(f"图片描述结果无效 {image_path}: {result!r}")
+            return None
+        text = cls.format_caption(caption)
+        cls._save(caption)
+        cls._memory.set(content_hash, text)
+        return text
+
+    @staticmethod
+    def _normalize(content_hash: str, result: dict) -> Optional[ImageCaption]:
+        """校验并截断模型返回的描述字段"""
+        if not isinstance(result, dict) or not str(result.get("caption") or "").strip():
+            return None
+
+        def _tags(value) -> list:
+            if not isinstance(value, list):
+                return []
+            return [str(v).strip() for v in value if str(v).strip()][:_MAX_TAGS]
+
+        nail_count = result.get("nail_count")
+        try:
+            nail_count = int(nail_count) if nail_count is not None else None
+        except (TypeError, ValueError):
+            nail_count = None
+
+        return ImageCaption(
+            content_hash=content_hash,
+            caption=str(result["caption"]).strip()[:_MAX_CAPTION_CHARS],
+            palette=_tags(result.get("palette")),
+            style_tags=_tags(result.get("style_tags")),
+            nail_count=nail_count,
+            provider=settings.AI_PROVIDER.lower(),
+        )
+
+    @classmethod
+    def _save(cls, caption: ImageCaption) -> None:
+        """写入 image_captions 表；其他 worker 已写入同一哈希时忽略（唯一约束冲突）"""
+        db = open_session()
+        try:
+            db.add(caption)
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"图片描述写入失败: {e}")
+        finally:
+            db.close()
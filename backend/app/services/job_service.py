@@ -0,0 +1,334 @@
+"""
+后台任务服务（进程内执行，状态持久化到 agent_jobs 表）
+
+- enqueue: 写入 pending 任务并在当前事件循环中调度执行，调用方立即拿到任务句柄
+- 执行时使用独立的数据库会话，通过条件 UPDATE 抢占任务（多 worker 下同一任务只执行一次）
+- 服务启动时及之后每 AGENT_JOB_SWEEP_SECONDS 秒由 resume_pending 重新调度未完成的任务（进程重启 / 崩溃遗留）
+- 任务结果由 Agent 在下一轮对话开始时通过 take_finished 读入对话
+- 长任务可在执行中提交 result（如断点 progress），任务失败时保留这些字段，retry 后从断点继续
+"""
+import asyncio
+import datetime
+import json
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.database import open_session
+from app.models.agent_job import AgentJob
+
+logger = logging.getLogger(__name__)
+
+# 任务处理函数：接收任务专用的数据库会话与任务行，返回写入 AgentJob.result 的字典
+JobHandler = Callable[[Session, AgentJob], Awaitable[dict]]
+# 失败回调：任务最终失败（出错、超时、中断次数过多）时在同一事务内调用，参数为会话、任务行与错误描述
+FailureHandler = Callable[[Session, AgentJob, str], None]
+
+
+class JobService:
+    """后台任务服务"""
+
+    _handlers: Dict[str, JobHandler] = {}
+    # 按任务类型覆盖的执行超时（秒），未设置时使用 AGENT_JOB_TIMEOUT_SECONDS
+    _timeouts: Dict[str, float] = {}
+    _failure_handlers: Dict[str, FailureHandler] = {}
+    _tasks: Dict[int, "asyncio.Task"] = {}
+    _waiters: Dict[int, Set[asyncio.Event]] = {}
+
+    # ── 注册与入队 ──────────────────────────────────────────────────────────
+
+    @classmethod
+    def register(
+        cls,
+        kind: str,
+        handler: JobHandler,
+        timeout: Optional[float] = None,
+        on_failure: Optional[FailureHandler] = None,
+    ) -> None:
+        cls._handlers[kind] = handler
+        if timeout is not None:
+            cls._timeouts[kind] = timeout
+        if on_failure is not None:
+            cls._failure_handlers[kind] = on_failure
+
+    @classmethod
+    def enqueue(
+        cls,
+        db: Session,
+        user_id: int,
+        kind: str,
+        payload: dict,
+        session_id: Optional[int] = None,
+    ) -> AgentJob:
+        """创建任务并调度执行（无运行中的事件循环时保持 pending，待下次启动恢复）"""
+        job = AgentJob(
+            user_id=user_id,
+            session_id=session_id,
+            kind=kind,
+            status="pending",
+            payload=payload,
+            attempts=0,
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        metrics.inc("agent_jobs_enqueued", kind=kind)
+        cls._schedule(job.id)
+        return job
+
+    @classmethod
+    def retry(cls, db: Session, job_id: int, user_id: int) -> Optional[AgentJob]:
+        """
+        重新执行失败的任务（保留 result 中的断点），返回任务；任务不存在时返回 None。
+        对话中的任务由 Agent 重新发起，不支持在此重试
+        """
+        job = cls.get_job(db, job_id, user_id)
+        if job is None:
+            return None
+        if job.status != "failed":
+            raise ValueError(f"Only failed jobs can be retried (status: {job.status})")
+        if job.session_id is not None:
+            raise ValueError("Jobs started from a conversation cannot be retried")
+        job.status = "pending"
+        job.error = None
+        job.attempts = 0
+        job.started_at = None
+        job.finished_at = None
+        db.commit()
+        db.refresh(job)
+        metrics.inc("agent_jobs_retried", kind=job.kind)
+        cls._schedule(job.id)
+        return job
+
+    @classmethod
+    def _schedule(cls, job_id: int) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            logger.warning(f"No running event loop, job {job_id} stays pending until resumed")
+            return
+        task = loop.create_task(cls._run(job_id))
+        cls._tasks[job_id] = task
+        task.add_done_callback(lambda _: cls._tasks.pop(job_id, None))
+
+    # ── 执行 ────────────────────────────────────────────────────────────────
+
+    @classmethod
+    async def _run(cls, job_id: int) -> None:
+        db = open_session()
+        try:
+            if not cls._claim(db, job_id):
+                return
+            cls._notify(job_id)
+            job = db.get(AgentJob, job_id)
+            started = datetime.datetime.utcnow()
+            timeout = cls._timeouts.get(job.kind, settings.AGENT_JOB_TIMEOUT_SECONDS)
+            try:
+                handler = cls._handlers.get(job.kind)
+                if handler is None:
+                    raise ValueError(f"Unknown job kind: {job.kind}")
+                result = await asyncio.wait_for(handler(db, job), timeout=timeout)
+            except Exception as e:
+                db.rollback()
+                if isinstance(e, asyncio.TimeoutError):
+                    detail = f"timed out after {timeout:g}s"
+                else:
+                    detail = getattr(e, "detail", None) or str(e) or type(e).__name__
+                logger.error(f"Job {job_id} ({job.kind}) failed: {detail}", exc_info=True)
+                job = db.get(AgentJob, job_id)
+                job.status = "failed"
+                job.error = str(detail)
+                job.result = cls._failure_result(job, f"Tool execution failed: {detail}")
+                cls._on_failure(db, job, str(detail))
+            else:
+                job.status = "succeeded"
+                job.result = result
+            job.finished_at = datetime.datetime.utcnow()
+            db.commit()
+            metrics.inc("agent_jobs_finished", kind=job.kind, status=job.status)
+            metrics.observe(
+                "agent_job_seconds",
+                (job.finished_at - started).total_seconds(),
+                kind=job.kind,
+            )
+        finally:
+            db.close()
+            cls._notify(job_id)
+
+    @staticmethod
+    def _failure_result(job: AgentJob, error: str) -> dict:
+        """失败结果：错误信息 + 处理函数在执行中已提交的字段（如断点 progress）"""
+        kept = {key: value for key, value in (job.result or {}).items() if key != "content"}
+        return {**kept, "content": json.dumps({"error": error}, ensure_ascii=False)}
+
+    @classmethod
+    def _on_failure(cls, db: Session, job: AgentJob, detail: str) -> None:
+        """调用任务类型的失败回调（回调出错只记录日志，不影响任务状态的写入）"""
+        handler = cls._failure_handlers.get(job.kind)
+        if handler is None:
+            return
+        try:
+            with db.begin_nested():
+                handler(db, job, detail)
+        except Exception as e:
+            logger.error(f"Failure handler for job {job.id} ({job.kind}) failed: {e}", exc_info=True)
+
+    @staticmethod
+    def _claim(db: Session, job_id: int) -> bool:
+        """原子地将 pending 任务置为 running，返回是否抢占成功"""
+        now = datetime.datetime.utcnow()
+        updated = db.query(AgentJob).filter(
+            AgentJob.id == job_id,
+            AgentJob.status == "pending",
+        ).update(
+            {
+                AgentJob.status: "running",
+                AgentJob.started_at: now,
+                AgentJob.updated_at: now,
+                AgentJob.attempts: AgentJob.attempts + 1,
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+        return updated == 1
+
+    @classmethod
+    def resume_pending(cls) -> int:
+        """
+        恢复未完成的任务：本进程内没有执行协程的 running 任务视为进程中断 ——
+        单 worker 部署（AGENT_JOB_SINGLE_WORKER）下全部如此处理，多 worker 时仅处理超过
+        该类型任务超时仍未更新的任务（可能仍在其他 worker 中执行）；
+        中断的任务重置为 pending（超过最大尝试次数则置为 failed），随后调度所有 pending 任务
+        """
+        db = open_session()
+        try:
+            now = datetime.datetime.utcnow()
+            running = db.query(AgentJob).filter(AgentJob.status == "running").all()
+            for job in running:
+                if job.id in cls._tasks:
+                    continue
+                timeout = cls._timeouts.get(job.kind, settings.AGENT_JOB_TIMEOUT_SECONDS)
+                if (not settings.AGENT_JOB_SINGLE_WORKER
+                        and job.updated_at >= now - datetime.timedelta(seconds=timeout)):
+                    continue
+                if job.attempts >= settings.AGENT_JOB_MAX_ATTEMPTS:
+                    job.status = "failed"
+                    job.error = "interrupted too many times"
+                    job.result = cls._failure_result(job, "Tool execution failed: interrupted too many times")
+                    job.finished_at = now
+                    cls._on_failure(db, job, job.error)
+                else:
+                    job.status = "pending"
+            db.commit()
+
+            pending_ids = [
+                job_id for (job_id,) in db.query(AgentJob.id).filter(
+                    AgentJob.status == "pending"
+                ).order_by(AgentJob.id).all()
+                if job_id not in cls._tasks
+            ]
+        finally:
+            db.close()
+
+        for job_id in pending_ids:
+            cls._schedule(job_id)
+        if pending_ids:
+            logger.info(f"Resumed {len(pending_ids)} pending background jobs")
+        return len(pending_ids)
+
+    @classmethod
+    async def run_periodically(cls, interval: float) -> None:
+        """后台循环：每 interval 秒执行一次 resume_pending（由应用生命周期启动与取消）"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                cls.resume_pending()
+            except Exception as e:
+                logger.error(f"Background job sweep failed: {e}", exc_info=True)
+
+    @classmethod
+    async def shutdown(cls) -> None:
+        """取消本进程内仍在执行的任务，并将其重置为 pending，下次启动时重新执行"""
+        job_ids = list(cls._tasks)
+        tasks = list(cls._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if not tasks:
+            return
+        await asyncio.gather(*tasks, return_exceptions=True)
+        db = open_session()
+        try:
+            db.query(AgentJob).filter(
+                AgentJob.id.in_(job_ids),
+                AgentJob.status == "running",
+            ).update({AgentJob.status: "pending"}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        logger.info(f"Interrupted {len(job_ids)} background jobs, they will resume on next start")
+
+    # ── 查询 ────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def get_job(db: Session, job_id: int, user_id: int) -> Optional[AgentJob]:
+        return db.query(AgentJob).filter(
+            AgentJob.id == job_id,
+            AgentJob.user_id == user_id,
+        ).first()
+
+    @staticmethod
+    def list_jobs(
+        db: Session,
+        user_id: int,
+        session_id: Optional[int] = None,
+        skip: int = 0,
+        limit: int = 20,
+    ) -> Tuple[List[AgentJob], int]:
+        query = db.query(AgentJob).filter(AgentJob.user_id == user_id)
+        if session_id is not None:
+            query = query.filter(AgentJob.session_id == session_id)
+        total = query.count()
+        jobs = query.order_by(AgentJob.created_at.desc()).offset(skip).limit(limit).all()
+        return jobs, total
+
+    @staticmethod
+    def take_finished(db: Session, session_id: int) -> List[AgentJob]:
+        """
+        取出会话中已完成但尚未交付给 Agent 的任务，并标记为已交付。
+        标记随调用方的事务一起提交，与结果写回的 session.context 保持一致
+        """
+        jobs = db.query(AgentJob).filter(
+            AgentJob.session_id == session_id,
+            AgentJob.status.in_(("succeeded", "failed")),
+            AgentJob.consumed_at.is_(None),
+        ).order_by(AgentJob.id).populate_existing().all()
+        now = datetime.datetime.utcnow()
+        for job in jobs:
+            job.consumed_at = now
+        return jobs
+
+    # ── 状态变更通知（SSE 推送） ─────────────────────────────────────────────
+
+    @classmethod
+    def _notify(cls, job_id: int) -> None:
+        for event in cls._waiters.get(job_id, ()):
+            event.set()
+
+    @classmethod
+    async def wait_for_change(cls, job_id: int, timeout: float) -> None:
+        """等待本进程内任务状态变更，最多 timeout 秒（其他进程执行的任务依靠轮询）"""
+        event = asyncio.Event()
+        cls._waiters.setdefault(job_id, set()).add(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            waiters = cls._waiters.get(job_id)
+            if waiters is not None:
+                waiters.discard(event)
+                if not waiters:
+                    cls._waiters.pop(job_id, None)
@@ -0,0 +1,319 @@
+"""
+会话消息存储
+
+MessageStore 定义 Agent 读写会话消息的接口，通过 settings.CONVERSATION_STORE 选择实现：
+  - jsonl: 本地 JSONL 文件（ConversationFileManager），单实例部署的默认选项
+  - sql:   conversation_messages 表，多实例部署无需共享磁盘
+
+版本号（get_log_size 与写入返回的区间）用于 Agent 会话状态缓存判断是否有其他写入者：
+JSONL 为文件字节偏移，SQL 为会话内消息序号。
+SQL 实现的写入始终使用独立会话并立即提交（与 JSONL 追加即落盘一致）：回合的事务在等待 LLM / 工具时
+保持打开，SQLite StaticPool 下所有会话共用一个连接，其他会话 close() 时的回滚会撤销已 flush 未提交的行。
+读取时传入 db 则在调用方会话中进行；JSONL 实现忽略 db。
+"""
+import datetime
+import logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import open_session
+from app.models.conversation_session import ConversationSession
+from app.models.conversation_message import ConversationMessage
+from app.services.conversation_file import ConversationFileManager
+
+logger = logging.getLogger(__name__)
+
+# 分页接口返回的消息角色（与 JSONL 实现一致）
+_PAGE_ROLES = ("user", "assistant")
+
+
+class MessageStore(ABC):
+    """会话消息存储接口"""
+
+    @abstractmethod
+    def location(self, session_id: int) -> Optional[str]:
+        """会话消息的存放位置（写入 ConversationSession.file_path），无对应文件时返回 None"""
+
+    @abstractmethod
+    def get_log_size(self, session_id: int, db: Optional[Session] = None) -> int:
+        """当前版本号，没有消息时为 0"""
+
+    @abstractmethod
+    def append_message(
+        self, session_id: int, message: dict, db: Optional[Session] = None
+    ) -> Optional[Tuple[int, int]]:
+        """追加一条消息，返回写入前后的版本号 (before, after)；写入失败返回 None"""
+
+    @abstractmethod
+    def archive_step(
+        self, session_id: int, step_name: str, db: Optional[Session] = None
+    ) -> Optional[Tuple[int, int]]:
+        """归档步骤的全部消息，返回版本号区间 (before, after)"""
+
+    @abstractmethod
+    def read_current_step_messages(
+        self, session_id: int, current_step: str, db: Optional[Session] = None
+    ) -> List[dict]:
+        """读取当前步骤未归档的消息（不含归档标记）"""
+
+    @abstractmethod
+    def read_full_history(self, session_id: int, db: Optional[Session] = None) -> List[dict]:
+        """读取完整历史（含归档标记，archived 已按标记推导）"""
+
+    @abstractmethod
+    def read_page(
+        self, session_id: int, cursor: Optional[int] = None, limit: int = 50,
+        order: str = "desc", db: Optional[Session] = None,
+    ) -> Tuple[List[dict], Optional[int], bool]:
+        """按游标分页读取可展示的消息，返回 (消息列表, 下一页游标, 是否还有更多)"""
+
+
+class JsonlMessageStore(MessageStore):
+    """本地 JSONL 文件存储（委托 ConversationFileManager）"""
+
+    def location(self, session_id: int) -> Optional[str]:
+        return str(ConversationFileManager.get_file_path(session_id))
+
+    def get_log_size(self, session_id: int, db: Optional[Session] = None) -> int:
+        return ConversationFileManager.get_log_size(session_id)
+
+    def append_message(self, session_id, message, db=None):
+        return ConversationFileManager.append_message(session_id, message)
+
+    def archive_step(self, session_id, step_name, db=None):
+        return ConversationFileManager.archive_step(session_id, step_name)
+
+    def read_current_step_messages(self, session_id, current_step, db=None):
+        return ConversationFileManager.read_current_step_messages(session_id, current_step)
+
+    def read_full_history(self, session_id, db=None):
+        return ConversationFileManager.read_full_history(session_id)
+
+    def read_page(self, session_id, cursor=None, limit=50, order="desc", db=None):
+        return ConversationFileManager.read_page(session_id, cursor=cursor, limit=limit, order=order)
+
+
+class SqlMessageStore(MessageStore):
+    """
+    数据库存储：每条消息一行，seq 为会话内递增序号。
+    归档时将该步骤消息的 archived 置为 True，并追加一行归档标记（与 JSONL 的完整历史保持一致）。
+    同一会话的写入由 Agent 回合锁串行化；多实例并发写入同一会话时由 (session_id, seq) 唯一约束兜底
+    """
+
+    def location(self, session_id: int) -> Optional[str]:
+        return None
+
+    @contextmanager
+    def _session(self, db: Optional[Session]) -> Iterator[Session]:
+        """读取使用的会话：传入 db 时为调用方会话，否则为独立会话"""
+        if db is not None:
+            yield db
+            return
+        own = open_session()
+        try:
+            yield own
+        finally:
+            own.close()
+
+    @contextmanager
+    def _write_session(self) -> Iterator[Session]:
+        """写入使用的独立会话，退出时提交"""
+        own = open_session()
+        try:
+            yield own
+            own.commit()
+        except Exception:
+            own.rollback()
+            raise
+        finally:
+            own.close()
+
+    @staticmethod
+    def _max_seq(db: Session, session_id: int) -> int:
+        return db.query(func.max(ConversationMessage.seq)).filter(
+            ConversationMessage.session_id == session_id
+        ).scalar() or 0
+
+    def get_log_size(self, session_id: int, db: Optional[Session] = None) -> int:
+        with self._session(db) as s:
+            return self._max_seq(s, session_id)
+
+    def append_message(self, session_id, message, db=None):
+        if "ts" not in message:
+            message["ts"] = datetime.datetime.utcnow().isoformat()
+        with self._write_session() as s:
+            before = self._max_seq(s, session_id)
+            s.add(ConversationMessage(
+                session_id=session_id,
+                seq=before + 1,
+                step=message.get("step") or "",
+                role=message.get("role"),
+                archived=bool(message.get("archived", False)),
+                payload=message,
+            ))
+        return before, before + 1
+
+    def archive_step(self, session_id, step_name, db=None):
+        marker = {
+            "_archive_marker": True,
+            "step": step_name,
+            "ts": datetime.datetime.utcnow().isoformat(),
+        }
+        with self._write_session() as s:
+            s.query(ConversationMessage).filter(
+                ConversationMessage.session_id == session_id,
+                ConversationMessage.step == step_name,
+                ConversationMessage.archived.is_(False),
+            ).update({"archived": True}, synchronize_session=False)
+            before = self._max_seq(s, session_id)
+            s.add(ConversationMessage(
+                session_id=session_id,
+                seq=before + 1,
+                step=step_name,
+                role=None,
+                archived=True,
+                payload=marker,
+            ))
+        return before, before + 1
+
+    @staticmethod
+    def _to_message(row: ConversationMessage) -> dict:
+        message = dict(row.payload or {})
+        if not message.get("_archive_marker"):
+            message["archived"] = row.archived
+        return message
+
+    def read_current_step_messages(self, session_id, current_step, db=None):
+        with self._session(db) as s:
+            rows = s.query(ConversationMessage).filter(
+                ConversationMessage.session_id == session_id,
+                ConversationMessage.step == current_step,
+                ConversationMessage.archived.is_(False),
+            ).order_by(ConversationMessage.seq).all()
+            return [self._to_message(row) for row in rows]
+
+    def read_full_history(self, session_id, db=None):
+        with self._session(db) as s:
+            rows = s.query(ConversationMessage).filter(
+                ConversationMessage.session_id == session_id
+            ).order_by(ConversationMessage.seq).all()
+            return [self._to_message(row) for row in rows]
+
+    def read_page(self, session_id, cursor=None, limit=50, order="desc", db=None):
+        """游标为消息序号：asc 返回序号大于游标的消息，desc 返回序号小于游标的消息"""
+        messages: List[dict] = []
+        next_cursor = cursor if order == "asc" else None
+        with self._session(db) as s:
+            query = s.query(ConversationMessage).filter(
+                ConversationMessage.session_id == session_id,
+                ConversationMessage.role.in_(_PAGE_ROLES),
+            )
+            position = cursor
+            while True:
+                batch_query = query
+                if order == "asc":
+                    if position is not None:
+                        batch_query = batch_query.filter(ConversationMessage.seq > position)
+                    batch_query = batch_query.order_by(ConversationMessage.seq)
+                else:
+                    if position is not None:
+                        batch_query = batch_query.filter(ConversationMessage.seq < position)
+                    batch_query = batch_query.order_by(ConversationMessage.seq.desc())
+                # 多取一行用于判断是否还有更多；不可展示的行（如仅含 tool_calls）在内存中跳过
+                rows = batch_query.limit(limit + 1).all()
+                for row in rows:
+                    if len(messages) >= limit:
+                        return messages, next_cursor, True
+                    position = next_cursor = row.seq
+                    message = self._to_message(row)
+                    if message.get("content"):
+                        messages.append(message)
+                if len(rows) <= limit:
+                    if order == "desc":
+                        next_cursor = None
+                    return messages, next_cursor, False
+
+    def import_messages(self, db: Session, session_id: int, messages: List[dict]) -> int:
+        """批量写入一个会话的完整历史（导入 JSONL 时使用），调用方负责提交"""
+        rows = [
+            {
+                "session_id": session_id,
+                "seq": seq,
+                "step": message.get("step") or "",
+                "role": None if message.get("_archive_marker") else message.get("role"),
+                "archived": bool(message.get("_archive_marker") or message.get("archived", False)),
+                "payload": message,
+                "created_at": datetime.datetime.utcnow(),
+            }
+            for seq, message in enumerate(messages, start=1)
+        ]
+        if rows:
+            db.execute(insert(ConversationMessage), rows)
+        return len(rows)
+
+
+def import_jsonl_sessions(
+    db: Session, session_ids: Optional[List[int]] = None, replace: bool = False
+) -> Tuple[int, int]:
+    """
+    将 JSONL 会话（含已打包进冷存储的会话）批量导入 conversation_messages 表，每个会话一个事务。
+    跳过数据库中不存在的会话；已有消息的会话默认跳过，replace=True 时先删除再导入。
+    返回 (导入的会话数, 跳过的会话数)
+    """
+    if session_ids is None:
+        ids = set(ConversationFileManager._iter_session_ids())
+        ids.update(int(sid) for sid in ConversationFileManager.load_catalog()["sessions"])
+        session_ids = sorted(ids)
+
+    store = SqlMessageStore()
+    imported = skipped = 0
+    for session_id in session_ids:
+        exists = db.query(ConversationSession.id).filter(ConversationSession.id == session_id).first()
+        if exists is None:
+            logger.warning(f"会话 {session_id} 不在数据库中，跳过导入")
+            skipped += 1
+            continue
+        has_rows = db.query(ConversationMessage.id).filter(
+            ConversationMessage.session_id == session_id
+        ).first() is not None
+        if has_rows and not replace:
+            skipped += 1
+            continue
+        messages = ConversationFileManager.read_full_history(session_id)
+        if not messages:
+            skipped += 1
+            continue
+        try:
+            if has_rows:
+                db.query(ConversationMessage).filter(
+                    ConversationMessage.session_id == session_id
+                ).delete(synchronize_session=False)
+            store.import_messages(db, session_id, messages)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"导入会话 {session_id} 失败: {e}")
+            skipped += 1
+            continue
+        imported += 1
+    return imported, skipped
+
+
+_STORES: Dict[str, Callable[[], MessageStore]] = {
+    "jsonl": JsonlMessageStore,
+    "sql": SqlMessageStore,
+}
+
+
+def get_message_store(name: Optional[str] = None) -> MessageStore:
+    """按名称（缺省为 settings.CONVERSATION_STORE）创建消息存储"""
+    name = name or settings.CONVERSATION_STORE
+    try:
+        return _STORES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown CONVERSATION_STORE: {name}") from None
@@ -0,0 +1,215 @@
+"""
+Agent prompt token 预算
+
+在每次调用 Chat Completions 前估算 prompt token 数，并按模型上限收缩消息列表：
+1. 截断 tool 结果中过长的 JSON 字段（长字符串、长列表）
+2. 超出预算时，将较早轮次的 tool 结果压缩为简短摘要
+3. 仍超出时，从最早的历史消息开始整组丢弃（assistant tool_calls 与其 tool 结果同进同退）
+
+系统提示词与当前轮次的用户消息始终保留。只返回新列表，不修改传入的消息（会话缓存共享这些 dict）。
+token 数为启发式估算（CJK 字符约 1 token，其他字符约 4 个 1 token），不依赖 tokenizer。
+"""
+import json
+import logging
+import math
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 每条消息的结构开销（role、分隔符等）
+_MESSAGE_OVERHEAD = 4
+# 压缩后的旧 tool 结果保留的原文字符数
+_TOOL_SUMMARY_CHARS = 200
+
+
+def _is_cjk(ch: str) -> bool:
+    code = ord(ch)
+    return (
+        0x4E00 <= code <= 0x9FFF
+        or 0x3400 <= code <= 0x4DBF
+        or 0x3000 <= code <= 0x30FF
+        or 0xAC00 <= code <= 0xD7AF
+        or 0xFF00 <= code <= 0xFFEF
+    )
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """估算文本的 token 数"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if _is_cjk(ch))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def count_message_tokens(message: dict) -> int:
+    tokens = _MESSAGE_OVERHEAD
+    content = message.get("content")
+    if isinstance(content, str):
+        tokens += estimate_tokens(content)
+    elif content is not None:
+        tokens += estimate_tokens(json.dumps(content, ensure_ascii=False))
+    if message.get("name"):
+        tokens += estimate_tokens(message["name"])
+    for tc in message.get("tool_calls") or []:
+        fn = tc.get("function", {})
+        tokens += estimate_tokens(fn.get("name", "")) + estimate_tokens(fn.get("arguments", ""))
+    return tokens
+
+
+def count_tokens(messages: List[dict], tools: Optional[List[dict]] = None) -> int:
+    """估算整个请求的 prompt token 数（消息 + 工具定义）"""
+    total = sum(count_message_tokens(m) for m in messages)
+    if tools:
+        total += estimate_tokens(json.dumps(tools, ensure_ascii=False))
+    return total
+
+
+def _trim_value(value: Any, max_chars: int, max_items: int) -> Tuple[Any, bool]:
+    """递归截断 JSON 值中的长字符串与长列表，返回 (新值, 是否有改动)"""
+    if isinstance(value, str):
+        if len(value) > max_chars:
+            return f"{value[:max_chars]}…[truncated {len(value) - max_chars} chars]", True
+        return value, False
+    if isinstance(value, list):
+        changed = len(value) > max_items
+        items = []
+        for item in value[:max_items]:
+            new_item, item_changed = _trim_value(item, max_chars, max_items)
+            items.append(new_item)
+            changed = changed or item_changed
+        if len(value) > max_items:
+            items.append(f"…[{len(value) - max_items} more items truncated]")
+        return items, changed
+    if isinstance(value, dict):
+        changed = False
+        result = {}
+        for key, item in value.items():
+            new_item, item_changed = _trim_value(item, max_chars, max_items)
+            result[key] = new_item
+            changed = changed or item_changed
+        return result, changed
+    return value, False
+
+
+def trim_json_fields(content: str, max_chars: int, max_items: int) -> str:
+    """截断 tool 结果 JSON 中的超长字段；非 JSON 内容整体按长度截断"""
+    try:
+        data = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        trimmed, _ = _trim_value(content, max_chars, max_items)
+        return trimmed
+    trimmed, changed = _trim_value(data, max_chars, max_items)
+    if not changed:
+        return content
+    return json.dumps(trimmed, ensure_ascii=False)
+
+
+def summarize_tool_result(content: str) -> str:
+    """将较早轮次的 tool 结果压缩为摘要（保留 result 字段与开头片段）"""
+    try:
+        data = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        data = None
+    summary = {"_compacted": True}
+    if isinstance(data, dict):
+        for key in ("result", "error", "total"):
+            if key in data:
+                summary[key] = data[key]
+    summary["preview"] = content[:_TOOL_SUMMARY_CHARS]
+    return json.dumps(summary, ensure_ascii=False)
+
+
+@dataclass
+class BudgetReport:
+    """一次预算处理的统计"""
+    budget: int
+    tokens_before: int
+    tokens_after: int
+    trimmed_fields: int = 0
+    compacted_tool_results: int = 0
+    dropped_messages: int = 0
+
+    @property
+    def over_budget(self) -> bool:
+        return self.tokens_after > self.budget
+
+
+class PromptBudget:
+    """按 token 上限收缩 OpenAI 格式的消息列表"""
+
+    def __init__(self, max_tokens: int, max_field_chars: int = 2000, max_list_items: int = 20):
+        self.max_tokens = max_tokens
+        self.max_field_chars = max_field_chars
+        self.max_list_items = max_list_items
+
+    def fit(
+        self, messages: List[dict], tools_tokens: int = 0
+    ) -> Tuple[List[dict], BudgetReport]:
+        """收缩消息列表；tools_tokens 为随请求发送的工具定义所占 token 数"""
+        before = count_tokens(messages) + tools_tokens
+        report = BudgetReport(budget=self.max_tokens, tokens_before=before, tokens_after=before)
+        result = list(messages)
+
+        # 1. 截断超长 JSON 字段（始终执行）
+        for idx, msg in enumerate(result):
+            if msg.get("role") != "tool" or not isinstance(msg.get("content"), str):
+                continue
+            trimmed = trim_json_fields(msg["content"], self.max_field_chars, self.max_list_items)
+            if trimmed != msg["content"]:
+                result[idx] = {**msg, "content": trimmed}
+                report.trimmed_fields += 1
+
+        tokens = count_tokens(result) + tools_tokens
+        if tokens > self.max_tokens:
+            # 2. 压缩最后一组 tool 结果之前的所有 tool 结果
+            last_tool_group = self._last_tool_group_start(result)
+            for idx in range(last_tool_group):
+                msg = result[idx]
+                if msg.get("role") == "tool" and isinstance(msg.get("content"), str):
+                    compacted = summarize_tool_result(msg["content"])
+                    if len(compacted) < len(msg["content"]):
+                        result[idx] = {**msg, "content": compacted}
+                        report.compacted_tool_results += 1
+            tokens = count_tokens(result) + tools_tokens
+
+        if tokens > self.max_tokens:
+            # 3. 从最早的历史开始整组丢弃，保留系统提示词与当前用户消息之后的全部内容
+            head = 1 if result and result[0].get("role") == "system" else 0
+            protected = self._last_user_index(result)
+            while tokens > self.max_tokens and head < protected:
+                end = self._group_end(result, head, protected)
+                dropped = result[head:end]
+                del result[head:end]
+                protected -= len(dropped)
+                report.dropped_messages += len(dropped)
+                tokens -= sum(count_message_tokens(m) for m in dropped)
+
+        report.tokens_after = tokens
+        return result, report
+
+    @staticmethod
+    def _last_user_index(messages: List[dict]) -> int:
+        for idx in range(len(messages) - 1, -1, -1):
+            if messages[idx].get("role") == "user":
+                return idx
+        return len(messages)
+
+    @staticmethod
+    def _last_tool_group_start(messages: List[dict]) -> int:
+        for idx in range(len(messages) - 1, -1, -1):
+            if messages[idx].get("role") == "assistant" and messages[idx].get("tool_calls"):
+                return idx
+        return len(messages)
+
+    @staticmethod
+    def _group_end(messages: List[dict], start: int, limit: int) -> int:
+        """丢弃单元：assistant tool_calls 连同其后的 tool 结果，否则为单条消息"""
+        end = start + 1
+        if messages[start].get("role") == "assistant" and messages[start].get("tool_calls"):
+            while end < limit and messages[end].get("role") == "tool":
+                end += 1
+        # 开头残留的孤立 tool 结果一并丢弃，避免出现无对应 tool_calls 的 tool 消息
+        while end < limit and messages[end].get("role") == "tool":
+            end += 1
+        return end
@@ -1,16 +1,21 @@
 """
 共享 pytest fixtures — 为所有测试提供数据库会话、TestClient、认证等基础设施
 """
+import json
 import pytest
-from unittest.mock import AsyncMock, patch
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
 from app.main import app
+from app.db import database
 from app.db.database import Base, get_db
 from app.core.security import hash_password
+from app.models.user import User
+from app.services.agent_service import AgentService
 
 
 # 内存 SQLite，所有测试共享同一引擎但每个函数独立事务
@@ -25,6 +30,13 @@ engine = create_engine(
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+@pytest.fixture(autouse=True)
+def session_factory(monkeypatch):
+    """后台任务、缓存等自行打开的会话同样连接测试数据库"""
+    monkeypatch.setattr(database, "session_factory", TestingSessionLocal)
+    return TestingSessionLocal
+
+
 @pytest.fixture
 def db_session():
     """每个测试函数独立的数据库会话（create_all → yield → drop_all）"""
@@ -170,6 +182,17 @@ MOCK_ESTIMATION = {
     "materials": ["基础底胶", "彩色甲油", "亮片"],
     "techniques": ["渐变", "彩绘"],
 }
+MOCK_COMPARISON = {
+    "similarity_score": 85,
+    "overall_assessment": "完成度高",
+    "differences": {"color_accuracy": "颜色准确"},
+    "suggestions": ["可以更细致"],
+    "contextual_insights": {},
+    "ability_scores": {
+        "颜色搭配": {"score": 88, "evidence": "色彩协调"},
+        "图案精度": {"score": 85, "evidence": "图案清晰"},
+    },
+}
 
 
 def _mock_ai_provider():
@@ -178,17 +201,7 @@ def _mock_ai_provider():
     mock_provider.generate_design.return_value = MOCK_GENERATED_IMAGE
     mock_provider.refine_design.return_value = "https://example.com/refined_design.png"
     mock_provider.estimate_execution.return_value = MOCK_ESTIMATION
-    mock_provider.compare_images.return_value = {
-        "similarity_score": 85,
-        "overall_assessment": "完成度高",
-        "differences": {"color_accuracy": "颜色准确"},
-        "suggestions": ["可以更细致"],
-        "contextual_insights": {},
-        "ability_scores": {
-            "颜色搭配": {"score": 88, "evidence": "色彩协调"},
-            "图案精度": {"score": 85, "evidence": "图案清晰"},
-        },
-    }
+    mock_provider.compare_images.return_value = MOCK_COMPARISON
     return mock_provider
 
 
@@ -222,3 +235,63 @@ def test_service_record(client, auth_headers, test_customer, test_design):
     )
     assert response.status_code == 201
     return response.json()
+
+
+# ---- Agent fixtures（mock LLM 客户端与工具执行器） ----
+
+def _tool_call(call_id, name, arguments):
+    return SimpleNamespace(
+        id=call_id,
+        type="function",
+        function=SimpleNamespace(name=name, arguments=json.dumps(arguments)),
+    )
+
+
+def _completion(content=None, tool_calls=None):
+    """构造非流式 ChatCompletion 响应"""
+    message = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def _final_json(message_text="Done", step_complete=False, **extra):
+    return json.dumps({
+        "message_text": message_text,
+        "step_summary": "summary",
+        "step_complete": step_complete,
+        "quick_replies": [],
+        "ui_hint": "none",
+        "ui_data": None,
+        "needs_image_upload": False,
+        **extra,
+    })
+
+
+@pytest.fixture
+def user(db_session):
+    user = User(
+        email="agent@example.com",
+        username="agent",
+        hashed_password="x",
+        is_active=True,
+    )
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    return user
+
+
+@pytest.fixture
+def agent():
+    service = AgentService()
+    service._llm = MagicMock()
+    service._llm.chat.completions.create = AsyncMock()
+    service._tools.execute = AsyncMock(
+        return_value=json.dumps({"result": "Found the following customers", "total": 0})
+    )
+    return service
+
+
+@pytest.fixture
+def session(agent, db_session, user):
+    session, _ = agent.create_session(db_session, user.id)
+    return session
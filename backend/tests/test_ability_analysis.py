@@ -19,6 +19,7 @@ from app.models.ability_dimension import AbilityDimension
 from app.models.ability_record import AbilityRecord
 from app.services.analysis_service import AnalysisService
 from app.services.ability_service import AbilityService
+from app.db import database
 
 
 # 测试数据库（使用内存数据库）
@@ -39,6 +40,12 @@ def db():
         Base.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture(autouse=True)
+def session_factory(monkeypatch):
+    """分析缓存等自行打开的会话写入本模块的测试数据库"""
+    monkeypatch.setattr(database, "session_factory", TestingSessionLocal)
+
+
 @pytest.fixture
 def test_user(db):
     """创建测试用户"""
@@ -351,7 +358,7 @@ async def test_reanalysis_updates_ability_records(
         updated_result["ability_scores"]["颜色搭配"]["score"] = 95  # 提升评分
         mock_provider.compare_images.return_value = updated_result
 
-        await AnalysisService.analyze_service(db=db, service_record_id=test_service_record.id)
+        await AnalysisService.analyze_service(db=db, service_record_id=test_service_record.id, force=True)
 
         # 验证记录数未增加（旧记录被删除）
         final_count = db.query(AbilityRecord).filter(
@@ -367,6 +374,65 @@ async def test_reanalysis_updates_ability_records(
         assert color_record.score == 95
 
 
+@pytest.mark.asyncio
+async def test_reanalysis_replays_cached_result(
+    db,
+    test_user,
+    test_dimensions,
+    test_service_record
+):
+    """测试照片与复盘文本未变化时重新分析复用缓存结果，修改文本或 force 时重新调用 AI"""
+
+    with patch("app.services.ai.factory.AIProviderFactory.get_provider") as mock_factory:
+        mock_provider = AsyncMock()
+        mock_provider.compare_images.return_value = MOCK_AI_COMPARISON_RESULT
+        mock_factory.return_value = mock_provider
+
+        await AnalysisService.analyze_service(db=db, service_record_id=test_service_record.id)
+        db.query(AbilityRecord).delete()
+        db.commit()
+
+        # 输入未变化：回放缓存，写回对比结果与能力记录
+        replayed = await AnalysisService.analyze_service(db=db, service_record_id=test_service_record.id)
+        assert mock_provider.compare_images.await_count == 1
+        assert replayed.similarity_score == 88
+        assert db.query(AbilityRecord).filter(
+            AbilityRecord.service_record_id == test_service_record.id
+        ).count() == 6
+
+        # force 跳过缓存
+        await AnalysisService.analyze_service(db=db, service_record_id=test_service_record.id, force=True)
+        assert mock_provider.compare_images.await_count == 2
+
+        # 复盘文本变化：缓存未命中
+        test_service_record.artist_review = "渐变部分已改进"
+        db.commit()
+        await AnalysisService.analyze_service(db=db, service_record_id=test_service_record.id)
+        assert mock_provider.compare_images.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_malformed_result_is_not_cached(
+    db,
+    test_user,
+    test_dimensions,
+    test_service_record
+):
+    """测试缺少 similarity_score 的 AI 结果报错且不写入缓存，下一次分析重新调用 AI"""
+
+    with patch("app.services.ai.factory.AIProviderFactory.get_provider") as mock_factory:
+        mock_provider = AsyncMock()
+        mock_provider.compare_images.side_effect = [{"overall_assessment": "truncated"}, MOCK_AI_COMPARISON_RESULT]
+        mock_factory.return_value = mock_provider
+
+        with pytest.raises(ValueError, match="similarity_score"):
+            await AnalysisService.analyze_service(db=db, service_record_id=test_service_record.id)
+
+        comparison = await AnalysisService.analyze_service(db=db, service_record_id=test_service_record.id)
+        assert comparison.similarity_score == 88
+        assert mock_provider.compare_images.await_count == 2
+
+
 def test_ability_records_cascade_delete(
     db,
     test_user,
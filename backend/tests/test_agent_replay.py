@@ -0,0 +1,155 @@
+"""
+Agent 回放基准测试单元测试
+覆盖: 录制会话切分为回放轮次、录制客户端按序回放、回放计时与 DB 提交统计
+"""
+import asyncio
+import json
+import logging
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app import cli
+from app.core.config import settings
+from app.models.user import User
+from app.services import agent_tools
+from app.services.agent_replay import AgentReplayBenchmark, ReplayToolExecutor, load_turns, summarize
+from app.services.agent_service import AgentService
+from app.services.ai.fake_chat import RecordedChatClient
+from tests.conftest import _completion, _final_json, _tool_call
+
+
+@pytest.fixture(autouse=True)
+def conversations_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CONVERSATIONS_DIR", str(tmp_path / "conversations"))
+
+
+@pytest.fixture
+def recorded_session(db_session):
+    """用 mock LLM 录制一个两轮会话：第一轮调用工具，第二轮完成 collect 步骤"""
+    user = User(email="replay@example.com", username="replay", hashed_password="x", is_active=True)
+    db_session.add(user)
+    db_session.commit()
+
+    agent = AgentService()
+    agent._llm = MagicMock()
+    agent._llm.chat.completions.create = AsyncMock(side_effect=[
+        _completion(tool_calls=[_tool_call("call_1", "search_customer", {"query": "Momo"})]),
+        _completion(content=_final_json("Found Momo")),
+        _completion(content=_final_json("Draft ready", step_complete=True)),
+    ])
+    agent._tools.execute = AsyncMock(return_value=json.dumps({"result": "recorded", "total": 1}))
+    session, _ = agent.create_session(db_session, user.id)
+
+    asyncio.run(agent.process_message(db_session, session.id, user.id, "Momo came in today"))
+    asyncio.run(agent.process_message(db_session, session.id, user.id, "that's all"))
+    return session.id
+
+
+class TestLoadTurns:
+
+    def test_turns_follow_recording(self, recorded_session):
+        turns = AgentReplayBenchmark.load_sessions()[recorded_session]
+
+        assert [t.content for t in turns] == ["Momo came in today", "that's all"]
+        first, second = turns
+        assert first.llm_messages[0]["tool_calls"][0]["function"]["name"] == "search_customer"
+        assert first.tool_results == [json.dumps({"result": "recorded", "total": 1})]
+        assert json.loads(first.llm_messages[1]["content"])["step_complete"] is False
+        assert json.loads(second.llm_messages[0]["content"])["step_complete"] is True
+
+    def test_rule_replies_need_no_llm(self):
+        turns = load_turns([
+            {"role": "assistant", "step": "collect", "content": "Hi"},
+            {"role": "user", "step": "confirm", "content": "Edit Details"},
+            {"role": "assistant", "step": "confirm", "content": "Sure", "rule": "edit_details"},
+        ])
+        assert len(turns) == 1 and turns[0].llm_messages == []
+
+
+class TestRecordedChatClient:
+
+    @pytest.mark.asyncio
+    async def test_returns_recorded_messages_then_fallback(self):
+        client = RecordedChatClient([{"content": "first"}])
+
+        first = await client.chat.completions.create(model="m", messages=[])
+        fallback = await client.chat.completions.create(model="m", messages=[])
+
+        assert first.choices[0].message.content == "first"
+        assert json.loads(fallback.choices[0].message.content)["step_complete"] is False
+        assert client.exhausted == 1 and len(client.requests) == 2
+
+
+class TestReplayBenchmark:
+
+    @pytest.mark.asyncio
+    async def test_replay_reports_per_turn_overhead(self, recorded_session, tmp_path):
+        sessions = AgentReplayBenchmark.load_sessions([recorded_session])
+        source_files = sorted((tmp_path / "conversations").rglob("*"))
+
+        timings = await AgentReplayBenchmark(work_dir=str(tmp_path)).run(sessions, repeat=2)
+
+        assert len(timings) == 4
+        assert [t.llm_calls for t in timings[:2]] == [2, 1]
+        assert all(t.commits == 1 for t in timings)
+        for t in timings:
+            assert t.overhead_ms <= t.total_ms
+            assert t.file_io_ms > 0 and t.prompt_build_ms > 0 and t.db_commit_ms > 0
+        assert set(summarize(timings)["overhead_ms"]) == {"mean", "p50", "p95", "max"}
+        # 回放不改动原始会话记录
+        assert sorted((tmp_path / "conversations").rglob("*")) == source_files
+        assert settings.CONVERSATIONS_DIR == str(tmp_path / "conversations")
+
+    @pytest.mark.asyncio
+    async def test_parallel_read_round_uses_recorded_results(
+        self, db_session, tmp_path, monkeypatch, caplog
+    ):
+        """并行执行的多个只读工具同样按序返回录制结果，不调用真实工具"""
+        user = User(email="reads@example.com", username="reads", hashed_password="x", is_active=True)
+        db_session.add(user)
+        db_session.commit()
+        agent = AgentService()
+        agent._llm = MagicMock()
+        agent._llm.chat.completions.create = AsyncMock(side_effect=[
+            _completion(tool_calls=[
+                _tool_call("call_1", "get_customer_detail", {"customer_id": 1}),
+                _tool_call("call_2", "list_inspirations", {}),
+            ]),
+            _completion(content=_final_json("Here you go")),
+        ])
+        agent._tools.execute = AsyncMock(side_effect=['{"result": "detail"}', '{"result": "inspirations"}'])
+        session, _ = agent.create_session(db_session, user.id)
+        await agent.process_message(db_session, session.id, user.id, "Show Momo and some ideas")
+
+        monkeypatch.setattr(agent_tools, "shares_connection", lambda: False)
+        real_calls, replayed = [], []
+
+        def real_tool(self, **kwargs):
+            real_calls.append(kwargs)
+            return "{}"
+
+        original = ReplayToolExecutor._execute_read
+
+        def execute_read(self, tool_name, *args):
+            result = original(self, tool_name, *args)
+            replayed.append((tool_name, result))
+            return result
+
+        monkeypatch.setattr(agent_tools.ToolExecutor, "_tool_get_customer_detail", real_tool)
+        monkeypatch.setattr(agent_tools.ToolExecutor, "_tool_list_inspirations", real_tool)
+        monkeypatch.setattr(ReplayToolExecutor, "_execute_read", execute_read)
+        sessions = AgentReplayBenchmark.load_sessions([session.id])
+        with caplog.at_level(logging.WARNING, logger="app.services.agent_replay"):
+            timings = await AgentReplayBenchmark(work_dir=str(tmp_path)).run(sessions)
+
+        assert [t.llm_calls for t in timings] == [2]
+        assert real_calls == []
+        assert sorted(result for _, result in replayed) == ['{"result": "detail"}', '{"result": "inspirations"}']
+        assert "diverged" not in caplog.text
+
+    def test_cli_bench_agent(self, recorded_session, capsys):
+        assert cli.main(["bench-agent", "--json"]) == 0
+        report = json.loads(capsys.readouterr().out)
+        assert len(report["turns"]) == 2
+        assert "overhead_ms" in report["summary"]
@@ -0,0 +1,471 @@
+"""
+AgentService 单元测试
+覆盖: 推理循环（非流式 / 流式）、工具调用、JSONL 写入 — mock LLM 客户端与工具执行器
+"""
+import asyncio
+import json
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.core.config import settings
+from app.models.user import User
+from app.services import agent_tools
+from tests.conftest import _completion, _final_json, _tool_call
+
+
+# ---- LLM 响应构造 ----
+
+class _Stream:
+    """模拟 stream=True 时返回的异步 chunk 迭代器"""
+
+    def __init__(self, deltas):
+        self._chunks = [
+            SimpleNamespace(choices=[SimpleNamespace(delta=d)]) for d in deltas
+        ]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self._chunks:
+            yield chunk
+
+
+def _delta(content=None, tool_calls=None):
+    return SimpleNamespace(content=content, tool_calls=tool_calls)
+
+
+def _tool_delta(index, call_id=None, name=None, arguments=None):
+    return SimpleNamespace(
+        index=index,
+        id=call_id,
+        type="function" if call_id else None,
+        function=SimpleNamespace(name=name, arguments=arguments),
+    )
+
+
+# ---- fixtures ----
+
+@pytest.fixture(autouse=True)
+def conversations_dir(tmp_path, monkeypatch):
+    """对话 JSONL 文件写入临时目录"""
+    monkeypatch.setattr(settings, "CONVERSATIONS_DIR", str(tmp_path / "conversations"))
+    return tmp_path / "conversations"
+
+
+class TestProcessMessage:
+    """非流式推理循环"""
+
+    @pytest.mark.asyncio
+    async def test_tool_round_then_final_reply(self, agent, db_session, user, session):
+        """先执行 tool_calls，再解析最终 JSON 回复，并写入 JSONL"""
+        agent._llm.chat.completions.create.side_effect = [
+            _completion(tool_calls=[_tool_call("call_1", "search_customer", {"query": "Momo"})]),
+            _completion(content=_final_json("Found nobody")),
+        ]
+
+        reply = await agent.process_message(db_session, session.id, user.id, "Momo")
+
+        assert reply.content == "Found nobody"
+        assert reply.current_step == "collect"
+        agent._tools.execute.assert_awaited_once()
+        roles = [m["role"] for m in agent._store.read_full_history(session.id)]
+        assert roles == ["assistant", "user", "assistant", "tool", "assistant"]
+
+
+class TestProcessMessageStream:
+    """流式推理循环"""
+
+    @pytest.mark.asyncio
+    async def test_stream_events(self, agent, db_session, user, session):
+        """产出 token / tool_start / tool_end / message 事件，tool_call 增量被正确拼接"""
+        final = _final_json("Streamed \"reply\"")
+        split = final.index("reply")
+        agent._llm.chat.completions.create.side_effect = [
+            _Stream([
+                _delta(tool_calls=[_tool_delta(0, "call_1", "search_customer", '{"que')]),
+                _delta(tool_calls=[_tool_delta(0, arguments='ry": "Momo"}')]),
+            ]),
+            _Stream([_delta(content=final[:10]), _delta(content=final[10:split]),
+                     _delta(content=final[split:])]),
+        ]
+
+        events = [
+            (event, data)
+            async for event, data in agent.process_message_stream(
+                db_session, session.id, user.id, "Momo"
+            )
+        ]
+        names = [e for e, _ in events]
+
+        assert names == ["tool_start", "tool_end", "token", "token", "message"]
+        assert events[0][1]["arguments"] == {"query": "Momo"}
+        # token 只包含 message_text 的值（JSON 结构与其他字段不下发）
+        assert "".join(d["text"] for e, d in events if e == "token") == 'Streamed "reply"'
+        assert events[-1][1].content == 'Streamed "reply"'
+        assert agent._llm.chat.completions.create.call_args.kwargs["stream"] is True
+
+        history = agent._store.read_full_history(session.id)
+        assert history[2]["tool_calls"][0]["function"]["arguments"] == '{"query": "Momo"}'
+
+
+class TestSessionStateCache:
+    """写穿式会话状态缓存"""
+
+    @pytest.mark.asyncio
+    async def test_hot_session_skips_file_reads(self, agent, db_session, user, session, monkeypatch):
+        """连续两轮对话：第二轮直接使用缓存的历史，不再解析 JSONL"""
+        agent._llm.chat.completions.create.side_effect = [
+            _completion(content=_final_json("first")),
+            _completion(content=_final_json("second")),
+        ]
+        await agent.process_message(db_session, session.id, user.id, "hello")
+
+        read = MagicMock(side_effect=AssertionError("should not re-read the file"))
+        monkeypatch.setattr(agent._store, "read_current_step_messages", read)
+        await agent.process_message(db_session, session.id, user.id, "again")
+
+        sent = agent._llm.chat.completions.create.call_args.kwargs["messages"]
+        assert [m["role"] for m in sent] == ["system", "assistant", "user", "assistant", "user"]
+        assert sent[-2]["content"] == "first"
+
+    @pytest.mark.asyncio
+    async def test_external_write_invalidates(self, agent, db_session, user, session):
+        """其他写入者追加消息后，缓存失效并重新读取文件"""
+        agent._llm.chat.completions.create.side_effect = [
+            _completion(content=_final_json("first")),
+            _completion(content=_final_json("second")),
+        ]
+        await agent.process_message(db_session, session.id, user.id, "hello")
+        agent._store.append_message(session.id, {
+            "step": "collect", "archived": False, "role": "system", "content": "external",
+        })
+
+        await agent.process_message(db_session, session.id, user.id, "again")
+
+        sent = agent._llm.chat.completions.create.call_args.kwargs["messages"]
+        assert any(m["content"] == "external" for m in sent)
+
+    @pytest.mark.asyncio
+    async def test_step_complete_resets_history(self, agent, db_session, user, session):
+        """步骤完成后缓存切换到下一步骤的空历史"""
+        agent._llm.chat.completions.create.side_effect = [
+            _completion(content=_final_json("draft", step_complete=True)),
+            _completion(content=_final_json("confirm?")),
+        ]
+        await agent.process_message(db_session, session.id, user.id, "that's all")
+        await agent.process_message(db_session, session.id, user.id, "yes")
+
+        sent = agent._llm.chat.completions.create.call_args.kwargs["messages"]
+        assert [m["role"] for m in sent] == ["system", "user"]
+        assert "[confirm step" in sent[0]["content"]
+
+    def test_abandon_invalidates(self, agent, db_session, user, session):
+        agent._session_cache.set(session.id, object())
+        assert agent.abandon_session(db_session, session.id, user.id)
+        assert agent._session_cache.get(session.id) is None
+
+
+class TestToolScheduling:
+    """同一轮内的工具调度"""
+
+    def test_schedule_groups_adjacent_read_only_tools(self):
+        names = [
+            "get_customer_detail", "list_inspirations", "create_customer",
+            "get_customer_detail", "get_ability_summary", "unknown_tool",
+            "search_customer", "search_customer",
+        ]
+        # search_customer 会回填 customer_id，按写工具串行执行
+        assert agent_tools.ToolExecutor.schedule(names) == [[0, 1], [2], [3, 4], [5], [6], [7]]
+
+    @pytest.mark.asyncio
+    async def test_read_only_batch_runs_in_parallel(self, agent, db_session, user, session, monkeypatch):
+        """只读工具在工作线程中各用独立会话并行执行，结果仍按 tool_calls 顺序写入 JSONL"""
+        monkeypatch.setattr(agent_tools, "shares_connection", lambda: False)
+        barrier = threading.Barrier(2, timeout=1)
+        sessions = []
+
+        def read_tool(name):
+            def run(db, user_id, session, **args):
+                sessions.append(db)
+                barrier.wait()  # 两个工具同时在执行才能通过
+                if name == "get_customer_detail":
+                    time.sleep(0.01)  # 后完成，但结果仍排在前面
+                return json.dumps({"result": name})
+            return run
+
+        monkeypatch.setattr(agent._tools, "_tool_get_customer_detail", read_tool("get_customer_detail"))
+        monkeypatch.setattr(agent._tools, "_tool_list_inspirations", read_tool("list_inspirations"))
+        agent._llm.chat.completions.create.side_effect = [
+            _completion(tool_calls=[
+                _tool_call("call_1", "get_customer_detail", {"customer_id": 1}),
+                _tool_call("call_2", "list_inspirations", {}),
+            ]),
+            _completion(content=_final_json("ok")),
+        ]
+
+        await agent.process_message(db_session, session.id, user.id, "Momo")
+
+        assert len(sessions) == 2 and sessions[0] is not sessions[1]
+        assert db_session not in sessions
+        agent._tools.execute.assert_not_awaited()
+        tool_msgs = [
+            m for m in agent._store.read_full_history(session.id) if m["role"] == "tool"
+        ]
+        assert [m["tool_call_id"] for m in tool_msgs] == ["call_1", "call_2"]
+        assert json.loads(tool_msgs[0]["content"]) == {"result": "get_customer_detail"}
+
+
+    @pytest.mark.asyncio
+    async def test_read_only_batch_is_sequential_on_shared_connection(self, agent, db_session, user, session):
+        """所有会话共用一个连接时（测试引擎为 StaticPool），只读工具仍通过 execute 在回合会话中顺序执行"""
+        agent._llm.chat.completions.create.side_effect = [
+            _completion(tool_calls=[
+                _tool_call("call_1", "get_customer_detail", {"customer_id": 1}),
+                _tool_call("call_2", "list_inspirations", {}),
+            ]),
+            _completion(content=_final_json("ok")),
+        ]
+
+        await agent.process_message(db_session, session.id, user.id, "Momo")
+
+        assert [c.args[0] for c in agent._tools.execute.await_args_list] == [
+            "get_customer_detail", "list_inspirations",
+        ]
+        assert all(c.args[2] is db_session for c in agent._tools.execute.await_args_list)
+
+
+class TestStepTools:
+    """按步骤开放工具"""
+
+    def test_step_tools_align_with_step_flow(self):
+        from app.services.agent_service import STEP_FLOW
+        assert set(agent_tools.STEP_TOOLS) == set(STEP_FLOW)
+        all_names = {t["function"]["name"] for t in agent_tools.TOOLS_DEFINITION}
+        for names in agent_tools.STEP_TOOLS.values():
+            assert set(names) <= all_names
+
+    @pytest.mark.asyncio
+    async def test_request_carries_only_current_step_tools(self, agent, db_session, user, session):
+        agent._llm.chat.completions.create.return_value = _completion(content=_final_json("hi"))
+
+        await agent.process_message(db_session, session.id, user.id, "hello")
+
+        sent = agent._llm.chat.completions.create.call_args.kwargs["tools"]
+        assert {t["function"]["name"] for t in sent} == set(agent_tools.STEP_TOOLS["collect"])
+        assert sent is agent_tools.get_step_tools("collect").definitions
+
+    @pytest.mark.asyncio
+    async def test_executor_rejects_tool_outside_step(self, db_session, user, session):
+        result = await agent_tools.ToolExecutor().execute(
+            "complete_service", {"service_id": 1}, db_session, user.id, session
+        )
+        assert "not available in the collect step" in json.loads(result)["error"]
+
+
+class TestRuleFastPath:
+    """确定性快速路径：命中规则时不调用 LLM"""
+
+    @pytest.mark.asyncio
+    async def test_abort_is_case_insensitive(self, agent, db_session, user, session):
+        reply = await agent.process_message(db_session, session.id, user.id, "Abort")
+
+        assert reply.current_step == "done"
+        assert session.status == "abandoned"
+        agent._llm.chat.completions.create.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_edit_details_keeps_step_and_summary(self, agent, db_session, user, session):
+        session.current_step = "confirm"
+        session.step_summaries = [{"step": "confirm", "summary": "draft"}]
+        db_session.commit()
+
+        reply = await agent.process_message(db_session, session.id, user.id, "Edit Details")
+
+        assert reply.current_step == "confirm"
+        assert session.step_summaries == [{"step": "confirm", "summary": "draft"}]
+        last = agent._store.read_full_history(session.id)[-1]
+        assert last["rule"] == "edit_details"
+        agent._llm.chat.completions.create.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_analysis_without_record_advances(self, agent, db_session, user, session):
+        from app.core.metrics import metrics
+        before = metrics.get_counter("agent_rule_hits", rule="skip_analysis")
+        session.current_step = "analysis"
+        db_session.commit()
+
+        reply = await agent.process_message(db_session, session.id, user.id, "ok")
+
+        assert reply.step_complete and reply.current_step == "review"
+        assert session.step_summaries[-1]["step"] == "analysis"
+        assert metrics.get_counter("agent_rule_hits", rule="skip_analysis") == before + 1
+        agent._llm.chat.completions.create.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_free_text_goes_to_llm(self, agent, db_session, user, session):
+        session.current_step = "confirm"
+        db_session.commit()
+        agent._llm.chat.completions.create.return_value = _completion(content=_final_json("ok"))
+
+        await agent.process_message(db_session, session.id, user.id, "edit the duration to 3h")
+
+        agent._llm.chat.completions.create.assert_awaited_once()
+
+
+class TestModelRouting:
+    """按步骤选择模型与延迟预算"""
+
+    @pytest.mark.asyncio
+    async def test_step_model_and_turn_record(self, agent, db_session, user, session, monkeypatch):
+        monkeypatch.setattr(settings, "AGENT_STEP_MODELS", "collect:cheap-model")
+        agent._llm.chat.completions.create.return_value = _completion(content=_final_json("hi"))
+
+        await agent.process_message(db_session, session.id, user.id, "hello")
+
+        assert agent._llm.chat.completions.create.call_args.kwargs["model"] == "cheap-model"
+        llm = agent._store.read_full_history(session.id)[-1]["llm"]
+        assert llm["calls"][0]["model"] == "cheap-model"
+        assert llm["calls"][0]["fallback"] is False
+        assert llm["prompt_tokens"] > 0
+
+    @pytest.mark.asyncio
+    async def test_timeout_falls_back(self, agent, db_session, user, session, monkeypatch):
+        monkeypatch.setattr(settings, "AGENT_STEP_MODELS", "collect:slow-model")
+        monkeypatch.setattr(settings, "AGENT_STEP_TIMEOUTS", "collect:0.01")
+        monkeypatch.setattr(settings, "AGENT_FALLBACK_MODEL", "quick-model")
+
+        async def create(**kwargs):
+            if kwargs["model"] == "slow-model":
+                await asyncio.sleep(1)
+            return _completion(content=_final_json("fallback reply"))
+
+        agent._llm.chat.completions.create.side_effect = create
+
+        reply = await agent.process_message(db_session, session.id, user.id, "hello")
+
+        assert reply.content == "fallback reply"
+        call = agent._store.read_full_history(session.id)[-1]["llm"]["calls"][0]
+        assert call["model"] == "quick-model" and call["fallback"] is True
+
+    @pytest.mark.asyncio
+    async def test_no_budget_when_fallback_is_step_model(self, agent, db_session, user, session, monkeypatch):
+        """降级模型就是步骤模型时不因预算取消请求再重发同一请求"""
+        monkeypatch.setattr(settings, "AGENT_STEP_MODELS", "collect:fast")
+        monkeypatch.setattr(settings, "AGENT_STEP_TIMEOUTS", "collect:0.01")
+        monkeypatch.setattr(settings, "AGENT_FALLBACK_MODEL", "fast")
+
+        async def create(**kwargs):
+            await asyncio.sleep(0.05)
+            return _completion(content=_final_json("slow but fine"))
+
+        agent._llm.chat.completions.create.side_effect = create
+
+        reply = await agent.process_message(db_session, session.id, user.id, "hello")
+
+        assert reply.content == "slow but fine"
+        agent._llm.chat.completions.create.assert_awaited_once()
+        call = agent._store.read_full_history(session.id)[-1]["llm"]["calls"][0]
+        assert call["model"] == agent._fast_model and call["fallback"] is False
+
+
+class TestTurnSerialisation:
+    """会话回合串行化与幂等提交"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_turns_do_not_overlap(self, agent, db_session, user, session):
+        active = []
+        overlap = []
+
+        async def create(**kwargs):
+            active.append(1)
+            overlap.append(len(active))
+            await asyncio.sleep(0.01)
+            active.pop()
+            return _completion(content=_final_json("ok"))
+
+        agent._llm.chat.completions.create.side_effect = create
+
+        await asyncio.gather(
+            agent.process_message(db_session, session.id, user.id, "first"),
+            agent.process_message(db_session, session.id, user.id, "second"),
+        )
+
+        assert max(overlap) == 1
+        roles = [m["role"] for m in agent._store.read_full_history(session.id)]
+        assert roles == ["assistant", "user", "assistant", "user", "assistant"]
+        assert agent._turn_locks == {}
+
+    @pytest.mark.asyncio
+    async def test_duplicate_submission_returns_cached_reply(self, agent, db_session, user, session):
+        agent._llm.chat.completions.create.return_value = _completion(content=_final_json("once"))
+
+        first, second = await asyncio.gather(
+            agent.process_message(db_session, session.id, user.id, "hi", idempotency_key="k1"),
+            agent.process_message(db_session, session.id, user.id, "hi", idempotency_key="k1"),
+        )
+
+        assert first == second
+        agent._llm.chat.completions.create.assert_awaited_once()
+        with pytest.raises(ValueError):
+            await agent.process_message(db_session, session.id, user.id, "other", idempotency_key="k1")
+
+    @pytest.mark.asyncio
+    async def test_cached_reply_not_served_to_other_user(self, agent, db_session, user, session):
+        agent._llm.chat.completions.create.return_value = _completion(content=_final_json("private"))
+        await agent.process_message(db_session, session.id, user.id, "hi", idempotency_key="k1")
+
+        other = User(email="other@example.com", username="other", hashed_password="x", is_active=True)
+        db_session.add(other)
+        db_session.commit()
+
+        with pytest.raises(ValueError):
+            await agent.process_message(db_session, session.id, other.id, "hi", idempotency_key="k1")
+
+
+class TestUnitOfWork:
+    """工具只修改内存中的 context，回合结束时统一提交"""
+
+    @pytest.fixture
+    def customer(self, db_session, user):
+        from app.models.customer import Customer
+        customer = Customer(user_id=user.id, name="Momo", phone="13800000000")
+        db_session.add(customer)
+        db_session.commit()
+        return customer
+
+    @pytest.mark.asyncio
+    async def test_context_updates_commit_once(self, agent, db_session, user, session, customer):
+        from app.core.metrics import metrics
+        session.current_step = "confirm"
+        db_session.commit()
+        agent._tools = agent_tools.ToolExecutor()
+        agent._llm.chat.completions.create.side_effect = [
+            _completion(tool_calls=[_tool_call("call_1", "search_customer", {"query": "Momo"})]),
+            _completion(content=_final_json("found")),
+        ]
+
+        reply = await agent.process_message(db_session, session.id, user.id, "Momo")
+
+        assert reply.context["customer_id"] == customer.id
+        assert metrics.get_observation("agent_turn_commits")["last"] == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_turn_keeps_collected_context(self, agent, db_session, user, session, customer):
+        session.current_step = "confirm"
+        db_session.commit()
+        agent._tools = agent_tools.ToolExecutor()
+        agent._llm.chat.completions.create.side_effect = [
+            _completion(tool_calls=[_tool_call("call_1", "search_customer", {"query": "Momo"})]),
+            RuntimeError("boom"),
+        ]
+
+        with pytest.raises(RuntimeError):
+            await agent.process_message(db_session, session.id, user.id, "Momo")
+
+        db_session.expire_all()
+        assert session.context["customer_id"] == customer.id
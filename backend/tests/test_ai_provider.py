@@ -143,3 +143,28 @@ class TestCompareImages:
                 "https://example.com/design.png",
                 "https://example.com/actual.png",
             )
+
+
+class TestDescribeImage:
+    """测试 describe_image"""
+
+    @pytest.mark.asyncio
+    async def test_describe_local_image(self, provider, mock_openai_client, tmp_path):
+        """本地图片以 data URL 发送，返回解析后的描述"""
+        description = {"caption": "Red glossy almond nails", "palette": ["red"],
+                       "style_tags": ["classic"], "nail_count": 10}
+        vision_response = MagicMock()
+        vision_response.choices = [
+            MagicMock(message=MagicMock(content=json.dumps(description)))
+        ]
+        mock_openai_client.chat.completions.create.return_value = vision_response
+        (tmp_path / "actuals").mkdir()
+        (tmp_path / "actuals" / "photo.jpg").write_bytes(b"\xff\xd8\xff\xe0" + b"\x00" * 16)
+
+        with patch("app.services.ai.openai_provider.settings") as mock_settings:
+            mock_settings.UPLOAD_DIR = str(tmp_path)
+            result = await provider.describe_image("/uploads/actuals/photo.jpg")
+
+        assert result == description
+        content = mock_openai_client.chat.completions.create.call_args.kwargs["messages"][0]["content"]
+        assert content[1]["image_url"]["url"].startswith("data:image/jpeg;base64,")
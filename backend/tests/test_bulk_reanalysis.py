@@ -0,0 +1,218 @@
+"""
+批量重新分析后台任务测试
+覆盖: 筛选条件、并发上限、分批写入能力记录、失败计数不中断任务、断点续跑、任务失败后保留断点并重试、接口入队
+"""
+import asyncio
+import copy
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.models.ability_record import AbilityRecord
+from app.models.agent_job import AgentJob
+from app.models.comparison_result import ComparisonResult
+from app.models.customer import Customer
+from app.models.design_plan import DesignPlan
+from app.models.service_record import ServiceRecord
+from app.models.user import User
+from app.services.ability_service import AbilityService
+from app.services.analysis_service import REANALYZE_JOB_KIND, AnalysisService
+from app.services.job_service import JobService
+from tests.conftest import MOCK_COMPARISON
+
+
+@pytest.fixture(autouse=True)
+def bulk_env(monkeypatch):
+    monkeypatch.setattr(settings, "BULK_ANALYSIS_BATCH_SIZE", 3)
+    monkeypatch.setattr(settings, "BULK_ANALYSIS_CONCURRENCY", 2)
+
+
+@pytest.fixture
+def records(db_session):
+    """用户的 7 条服务记录：5 条可分析（其中 1 条为另一客户），1 条未完成，1 条缺少实际图"""
+    AbilityService.initialize_dimensions(db_session)
+    user = User(email="bulk@example.com", username="bulk", hashed_password="x", is_active=True)
+    db_session.add(user)
+    db_session.commit()
+    customers = [Customer(user_id=user.id, name=name, phone=f"1390000000{i}", is_active=1)
+                 for i, name in enumerate(["A", "B"])]
+    design = DesignPlan(user_id=user.id, ai_prompt="pink", generated_image_path="/uploads/designs/d.png")
+    db_session.add_all([*customers, design])
+    db_session.commit()
+
+    services = []
+    for day in range(1, 8):
+        services.append(ServiceRecord(
+            user_id=user.id,
+            customer_id=customers[1 if day == 5 else 0].id,
+            design_plan_id=design.id,
+            service_date=date(2026, 3, day),
+            actual_image_path=None if day == 7 else f"/uploads/actuals/{day}.jpg",
+            status="pending" if day == 6 else "completed",
+        ))
+    db_session.add_all(services)
+    db_session.commit()
+    return user, customers, services
+
+
+def _provider(compare_images):
+    provider = MagicMock()
+    provider.compare_images = compare_images
+    return provider
+
+
+async def _run(db_session, user, filters):
+    job = AnalysisService.start_bulk_reanalysis(db_session, user.id, filters)
+    await asyncio.gather(*list(JobService._tasks.values()))
+    db_session.refresh(job)
+    return job
+
+
+class TestBulkReanalysis:
+
+    @pytest.mark.asyncio
+    async def test_filters_concurrency_and_batched_writes(self, db_session, records):
+        user, customers, services = records
+        in_flight = {"now": 0, "max": 0}
+
+        async def compare_images(**kwargs):
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            in_flight["now"] -= 1
+            return copy.deepcopy(MOCK_COMPARISON)
+
+        with patch("app.services.analysis_service.AIProviderFactory.get_provider",
+                   return_value=_provider(compare_images)), \
+                patch.object(AnalysisService, "_update_ability_records",
+                             wraps=AnalysisService._update_ability_records) as update:
+            job = await _run(db_session, user, {"customer_id": customers[0].id})
+
+        assert job.status == "succeeded"
+        progress = job.result["progress"]
+        assert progress["total"] == progress["processed"] == progress["succeeded"] == 4
+        assert progress["last_id"] == services[3].id
+        assert in_flight["max"] == 2
+        # 4 条记录分 2 批，每批一次能力记录写入
+        assert update.call_count == 2
+        dimensions = len(MOCK_COMPARISON["ability_scores"])
+        assert db_session.query(AbilityRecord).count() == 4 * dimensions
+        assert db_session.query(ComparisonResult).count() == 4
+
+    @pytest.mark.asyncio
+    async def test_failures_counted_without_failing_job(self, db_session, records):
+        user, _, services = records
+        failing = services[1].actual_image_path
+
+        async def compare_images(**kwargs):
+            if kwargs["actual_image"] == failing:
+                raise RuntimeError("upstream 500")
+            return copy.deepcopy(MOCK_COMPARISON)
+
+        with patch("app.services.analysis_service.AIProviderFactory.get_provider",
+                   return_value=_provider(compare_images)):
+            job = await _run(db_session, user, {"date_from": "2026-03-02", "date_to": "2026-03-05"})
+
+        assert job.status == "succeeded"
+        progress = job.result["progress"]
+        assert (progress["total"], progress["succeeded"], progress["failed"]) == (4, 3, 1)
+        assert job.result["failures"][0]["service_record_id"] == services[1].id
+        assert db_session.query(ComparisonResult).filter_by(service_record_id=services[1].id).count() == 0
+
+    @pytest.mark.asyncio
+    async def test_resumes_after_checkpoint(self, db_session, records):
+        user, _, services = records
+        calls = []
+
+        async def compare_images(**kwargs):
+            calls.append(kwargs["actual_image"])
+            return copy.deepcopy(MOCK_COMPARISON)
+
+        # 第一批已提交后进程中断：任务仍为 running，断点在 result.progress
+        job = AgentJob(
+            user_id=user.id, kind=REANALYZE_JOB_KIND, status="running", payload={}, attempts=1,
+            result={"progress": {"total": 5, "processed": 3, "succeeded": 3, "failed": 0,
+                                 "skipped": 0, "last_id": services[2].id}, "failures": []},
+        )
+        db_session.add(job)
+        db_session.commit()
+
+        with patch("app.services.analysis_service.AIProviderFactory.get_provider",
+                   return_value=_provider(compare_images)):
+            result = await AnalysisService.run_reanalysis_job(db_session, job)
+
+        assert sorted(calls) == [services[3].actual_image_path, services[4].actual_image_path]
+        assert result["progress"]["processed"] == result["progress"]["succeeded"] == 5
+
+    @pytest.mark.asyncio
+    async def test_failed_job_keeps_checkpoint_and_retries(self, db_session, records):
+        user, _, services = records
+        calls = []
+
+        async def compare_images(**kwargs):
+            calls.append(kwargs["actual_image"])
+            return copy.deepcopy(MOCK_COMPARISON)
+
+        real_update = AnalysisService._update_ability_records
+        writes = {"n": 0}
+
+        def flaky_update(db, scores_by_service):
+            writes["n"] += 1
+            if writes["n"] == 2:
+                raise RuntimeError("database is locked")
+            return real_update(db, scores_by_service)
+
+        with patch("app.services.analysis_service.AIProviderFactory.get_provider",
+                   return_value=_provider(compare_images)), \
+                patch.object(AnalysisService, "_update_ability_records", side_effect=flaky_update):
+            job = await _run(db_session, user, {})
+
+            # 第二批写入失败：任务失败，但第一批的断点保留
+            assert job.status == "failed"
+            assert job.result["progress"]["processed"] == 3
+            assert "database is locked" in job.result["content"]
+
+            JobService.retry(db_session, job.id, user.id)
+            await asyncio.gather(*list(JobService._tasks.values()))
+
+        db_session.refresh(job)
+        assert job.status == "succeeded"
+        assert job.result["progress"]["processed"] == job.result["progress"]["succeeded"] == 5
+        # 第一批没有重新分析
+        assert calls.count(services[0].actual_image_path) == 1
+        assert calls.count(services[3].actual_image_path) == 2
+
+        with pytest.raises(ValueError):
+            JobService.retry(db_session, job.id, user.id)
+
+    def test_endpoint_enqueues_job(self, client, db_session):
+        user = User(email="bulk-api@example.com", username="bulkapi", hashed_password="x", is_active=True)
+        db_session.add(user)
+        db_session.commit()
+        headers = {"Authorization": f"Bearer {create_access_token(user.id)}"}
+
+        response = client.post(
+            "/api/v1/services/reanalyze",
+            json={"only_unanalyzed": True, "concurrency": 3},
+            headers=headers,
+        )
+
+        assert response.status_code == 202
+        body = response.json()
+        assert body["kind"] == REANALYZE_JOB_KIND
+        assert body["status"] == "pending"
+        job = db_session.get(AgentJob, body["id"])
+        assert job.payload == {"only_unanalyzed": True, "force": True, "concurrency": 3}
+
+        bad = client.post(
+            "/api/v1/services/reanalyze",
+            json={"date_from": "2026-03-05", "date_to": "2026-03-01"},
+            headers=headers,
+        )
+        assert bad.status_code == 400
+
+        too_many = client.post("/api/v1/services/reanalyze", json={"concurrency": 99}, headers=headers)
+        assert too_many.status_code == 422
@@ -0,0 +1,153 @@
+"""
+AI 结果缓存单元测试
+覆盖: 相同输入命中缓存、参考图按内容哈希、估算按设计图哈希、过期与容量淘汰、单请求跳过缓存、工厂包装
+"""
+import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.ai_cache_entry import AICacheEntry
+from app.models.user import User
+from app.schemas.design import DesignGenerateRequest
+from app.services.ai.caching_provider import CachingAIProvider, without_cache_reads
+from app.services.ai.factory import AIProviderFactory
+from app.services.design_service import DesignService
+from tests.conftest import MOCK_ESTIMATION
+
+
+@pytest.fixture(autouse=True)
+def cache_env(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    metrics.reset()
+
+
+@pytest.fixture
+def inner():
+    provider = MagicMock()
+    provider.generate_design = AsyncMock(side_effect=["/uploads/designs/a.png", "/uploads/designs/b.png"])
+    provider.estimate_execution = AsyncMock(return_value=MOCK_ESTIMATION)
+    return provider
+
+
+@pytest.fixture
+def cached(inner, db_session):
+    return CachingAIProvider(inner)
+
+
+def _upload(tmp_path, rel, data=b"image-bytes"):
+    path = tmp_path / "uploads" / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return f"/uploads/{rel}"
+
+
+class TestCachingAIProvider:
+
+    @pytest.mark.asyncio
+    async def test_identical_generate_requests_hit(self, cached, inner, tmp_path):
+        _upload(tmp_path, "designs/a.png")
+        ref = _upload(tmp_path, "inspirations/ref.png")
+        ref_copy = _upload(tmp_path, "inspirations/ref-copy.png")
+
+        first = await cached.generate_design("pink  gradient\n", [ref], "10nails", "short nails")
+        again = await cached.generate_design("pink gradient", [ref_copy], "10nails", "short nails")
+        other = await cached.generate_design("pink gradient", [ref], "5nails", "short nails")
+
+        assert first == again == "/uploads/designs/a.png"
+        assert other == "/uploads/designs/b.png"
+        assert inner.generate_design.await_count == 2
+        assert metrics.get_counter("ai_cache", operation="generate_design", result="hit") == 1
+        assert metrics.get_counter("ai_cache", operation="generate_design", result="miss") == 2
+
+    @pytest.mark.asyncio
+    async def test_estimate_keyed_by_image_content(self, cached, inner, tmp_path):
+        first = _upload(tmp_path, "designs/v1.png", b"same")
+        second = _upload(tmp_path, "designs/v2.png", b"same")
+
+        assert await cached.estimate_execution(first) == MOCK_ESTIMATION
+        assert await cached.estimate_execution(second) == MOCK_ESTIMATION
+        inner.estimate_execution.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_expired_and_deleted_entries_miss(self, cached, inner, tmp_path, db_session):
+        _upload(tmp_path, "designs/a.png")
+        await cached.generate_design("pink")
+
+        db_session.query(AICacheEntry).update({
+            "expires_at": datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+        })
+        db_session.commit()
+        assert await cached.generate_design("pink") == "/uploads/designs/b.png"
+
+        # 缓存的设计图文件已删除
+        inner.generate_design.side_effect = None
+        inner.generate_design.return_value = "/uploads/designs/c.png"
+        assert await cached.generate_design("pink") == "/uploads/designs/c.png"
+        assert inner.generate_design.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction(self, cached, inner, tmp_path, db_session, monkeypatch):
+        monkeypatch.setattr(settings, "AI_CACHE_MAX_ENTRIES", 2)
+        images = [_upload(tmp_path, f"designs/{i}.png", bytes([i])) for i in range(3)]
+
+        await cached.estimate_execution(images[0])
+        await cached.estimate_execution(images[1])
+        await cached.estimate_execution(images[0])  # 命中，成为最近使用
+        await cached.estimate_execution(images[2])  # 淘汰 images[1]
+
+        assert db_session.query(AICacheEntry).count() == 2
+        await cached.estimate_execution(images[0])
+        await cached.estimate_execution(images[1])
+        assert inner.estimate_execution.await_count == 4
+        assert metrics.get_counter("ai_cache_evictions") == 2
+
+    @pytest.mark.asyncio
+    async def test_bypass_skips_read_but_refreshes_entry(self, cached, inner, tmp_path):
+        _upload(tmp_path, "designs/a.png")
+        _upload(tmp_path, "designs/b.png")
+        await cached.generate_design("pink")
+
+        assert await without_cache_reads(cached).generate_design("pink") == "/uploads/designs/b.png"
+        assert await cached.generate_design("pink") == "/uploads/designs/b.png"
+        assert cached.bypass_reads is False
+        assert metrics.get_counter("ai_cache", operation="generate_design", result="bypass") == 1
+
+
+class TestDesignServiceCache:
+
+    @pytest.mark.asyncio
+    async def test_regenerate_same_request_is_cached(self, cached, inner, tmp_path, db_session):
+        _upload(tmp_path, "designs/a.png")
+        _upload(tmp_path, "designs/b.png")
+        user = User(email="cache@example.com", username="cache", hashed_password="x", is_active=True)
+        db_session.add(user)
+        db_session.commit()
+
+        with patch("app.services.ai.factory.AIProviderFactory.get_provider", return_value=cached):
+            first = await DesignService.generate_design(db_session, DesignGenerateRequest(prompt="pink"), user.id)
+            second = await DesignService.generate_design(db_session, DesignGenerateRequest(prompt="pink"), user.id)
+            fresh = await DesignService.generate_design(
+                db_session, DesignGenerateRequest(prompt="pink", bypass_cache=True), user.id
+            )
+
+        assert first.generated_image_path == second.generated_image_path == "/uploads/designs/a.png"
+        assert fresh.generated_image_path == "/uploads/designs/b.png"
+        assert inner.generate_design.await_count == 2
+        assert inner.estimate_execution.await_count == 2
+
+
+class TestFactory:
+
+    def test_wraps_provider_when_enabled(self, monkeypatch):
+        monkeypatch.setattr(settings, "AI_CACHE_ENABLED", True)
+        AIProviderFactory.reset()
+        try:
+            with patch("app.services.ai.factory.OpenAIProvider") as mock_cls:
+                provider = AIProviderFactory.get_provider("openai")
+            assert isinstance(provider, CachingAIProvider)
+            assert provider.inner is mock_cls.return_value
+        finally:
+            AIProviderFactory.reset()
@@ -0,0 +1,336 @@
+"""
+ConversationFileManager 单元测试
+覆盖: JSONL 追加/读取、步骤字节偏移索引（增量补齐、重建）、步骤归档、冷存储打包、游标分页
+"""
+import asyncio
+import datetime
+import gzip
+import json
+import threading
+
+import pytest
+
+from app import cli
+from app.core.config import settings
+from app.models.conversation_session import ConversationSession
+from app.models.user import User
+from app.services.conversation_archive import ConversationArchiveService
+from app.services.conversation_file import ConversationFileManager as FM
+
+
+@pytest.fixture(autouse=True)
+def conversations_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CONVERSATIONS_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _msg(step, role="user", content="hi", **extra):
+    return {"step": step, "archived": False, "role": role, "content": content, **extra}
+
+
+class TestStepIndex:
+    """步骤字节偏移索引"""
+
+    def test_index_tracks_step_ranges(self):
+        """追加时不写索引，读取时一次扫描补齐每个步骤的字节区间"""
+        FM.append_message(1, _msg("collect", content="a"))
+        FM.append_message(1, _msg("collect", content="b"))
+        FM.append_message(1, _msg("confirm", content="c"))
+        assert not FM._index_path(1).exists()
+
+        assert [m["content"] for m in FM.read_current_step_messages(1, "confirm")] == ["c"]
+        assert [m["content"] for m in FM.read_current_step_messages(1, "collect")] == ["a", "b"]
+
+        index = json.loads(FM._index_path(1).read_text())
+        assert index["size"] == FM._messages_path(1).stat().st_size
+        assert len(index["steps"]["collect"]) == 1  # 相邻行合并为一个区间
+        assert index["steps"]["confirm"][0][0] == index["steps"]["collect"][0][1]
+
+        FM.append_message(1, _msg("confirm", content="d"))
+        assert json.loads(FM._index_path(1).read_text())["size"] == index["size"]
+        assert [m["content"] for m in FM.read_current_step_messages(1, "confirm")] == ["c", "d"]
+
+    def test_index_catches_up_with_external_appends(self):
+        """其他进程直接追加的行在下次读取时被增量索引"""
+        FM.append_message(2, _msg("collect", content="a"))
+        with open(FM._messages_path(2), "a", encoding="utf-8") as f:
+            f.write(json.dumps(_msg("collect", content="b")) + "\n")
+
+        assert [m["content"] for m in FM.read_current_step_messages(2, "collect")] == ["a", "b"]
+
+    def test_corrupt_index_is_rebuilt(self):
+        """损坏的索引文件自动重建"""
+        FM.append_message(3, _msg("collect", content="a"))
+        FM._index_path(3).write_text("{not json")
+
+        assert [m["content"] for m in FM.read_current_step_messages(3, "collect")] == ["a"]
+        assert json.loads(FM._index_path(3).read_text())["size"] > 0
+
+    def test_missing_session_returns_empty(self, conversations_dir):
+        assert FM.read_current_step_messages(99, "collect") == []
+        assert not (conversations_dir / "99").exists()
+
+    def test_cli_rebuilds_all_indexes(self):
+        FM.append_message(4, _msg("collect"))
+        FM.append_message(5, _msg("collect"))
+        assert not FM._index_path(4).exists() and not FM._index_path(5).exists()
+
+        assert cli.main(["rebuild-conversation-index"]) == 0
+        assert FM._index_path(4).exists() and FM._index_path(5).exists()
+
+
+class TestArchiveStep:
+    """步骤归档"""
+
+    def test_archive_is_append_only(self):
+        """归档只追加标记行，已写入的字节保持不变"""
+        FM.append_message(6, _msg("collect", content="a"))
+        before = FM._messages_path(6).read_bytes()
+        FM.archive_step(6, "collect")
+        FM.append_message(6, _msg("confirm", content="b"))
+
+        after = FM._messages_path(6).read_bytes()
+        assert after.startswith(before)
+        assert FM.read_current_step_messages(6, "collect") == []
+        assert [m["content"] for m in FM.read_current_step_messages(6, "confirm")] == ["b"]
+
+    def test_history_derives_archived_from_markers(self):
+        FM.append_message(7, _msg("collect", content="a"))
+        FM.archive_step(7, "collect")
+        FM.append_message(7, _msg("confirm", content="b"))
+
+        history = FM.read_full_history(7)
+        assert history[0]["archived"] is True
+        assert history[1]["_archive_marker"] is True
+        assert history[2]["archived"] is False
+
+    def test_step_reopened_after_archive(self):
+        """归档之后同一步骤的新消息仍可读取"""
+        FM.append_message(8, _msg("collect", content="old"))
+        FM.archive_step(8, "collect")
+        FM.append_message(8, _msg("collect", content="new"))
+
+        assert [m["content"] for m in FM.read_current_step_messages(8, "collect")] == ["new"]
+
+    def test_compact_materialises_archived_flags(self):
+        FM.append_message(9, _msg("collect", content="a"))
+        FM.archive_step(9, "collect")
+        FM.append_message(9, _msg("confirm", content="b"))
+
+        assert cli.main(["compact-conversations", "--session-id", "9"]) == 0
+
+        lines = [json.loads(l) for l in FM._messages_path(9).read_text().splitlines()]
+        assert lines[0]["archived"] is True
+        assert lines[2]["archived"] is False
+        assert [m["content"] for m in FM.read_current_step_messages(9, "confirm")] == ["b"]
+        assert not list(FM._messages_path(9).parent.glob("*.compact"))
+
+
+class TestColdStorage:
+    """已结束会话打包进 gzip 分段后仍可透明读取"""
+
+    @pytest.fixture
+    def finished(self, db_session):
+        user = User(email="cold@example.com", username="cold", hashed_password="x", is_active=True)
+        db_session.add(user)
+        db_session.commit()
+        old = datetime.datetime.utcnow() - datetime.timedelta(days=3)
+        rows = {}
+        for status in ("completed", "abandoned", "active"):
+            row = ConversationSession(
+                user_id=user.id, status=status, current_step="review", updated_at=old,
+                completed_at=datetime.datetime(2026, 9, 30) if status == "completed" else None,
+            )
+            db_session.add(row)
+            db_session.commit()
+            FM.append_message(row.id, _msg("collect", content=f"{status} 你好"))
+            FM.archive_step(row.id, "collect")
+            FM.append_message(row.id, _msg("confirm", role="assistant", content="ok"))
+            rows[status] = row.id
+        return rows
+
+    def test_pack_finished_sessions(self, db_session, finished, conversations_dir):
+        before = {sid: FM.read_full_history(sid) for sid in finished.values()}
+
+        assert ConversationArchiveService.pack_finished(db_session) == 2
+
+        assert not (conversations_dir / str(finished["completed"])).exists()
+        assert (conversations_dir / str(finished["active"])).exists()
+        catalog = FM.load_catalog()["sessions"]
+        assert catalog[str(finished["completed"])]["segment"] == "2026-09.jsonl.gz"
+        assert set(catalog) == {str(finished["completed"]), str(finished["abandoned"])}
+        for sid, history in before.items():
+            assert FM.read_full_history(sid) == history
+        assert FM.read_full_history(finished["completed"])[0]["archived"] is True
+
+    @pytest.mark.asyncio
+    async def test_background_loop_queries_on_event_loop_thread(self, finished, monkeypatch):
+        """候选查询在事件循环线程执行（StaticPool 的连接不能跨线程使用），只有文件打包放到线程池"""
+        threads = {"find": set(), "pack": set()}
+        find, pack = ConversationArchiveService.find_packable, ConversationArchiveService.pack_segments
+
+        def spy_find(db, *args):
+            threads["find"].add(threading.get_ident())
+            return find(db, *args)
+
+        def spy_pack(segments):
+            threads["pack"].add(threading.get_ident())
+            return pack(segments)
+
+        monkeypatch.setattr(ConversationArchiveService, "find_packable", staticmethod(spy_find))
+        monkeypatch.setattr(ConversationArchiveService, "pack_segments", staticmethod(spy_pack))
+        task = asyncio.create_task(ConversationArchiveService.run_periodically(0))
+        try:
+            for _ in range(200):
+                if len(FM.load_catalog()["sessions"]) == 2:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            task.cancel()
+
+        assert set(FM.load_catalog()["sessions"]) == {str(finished["completed"]), str(finished["abandoned"])}
+        assert threads["find"] == {threading.get_ident()}
+        assert threading.get_ident() not in threads["pack"]
+
+    def test_recent_sessions_are_kept(self, db_session, finished):
+        assert ConversationArchiveService.pack_finished(db_session, min_age_hours=24 * 7) == 0
+        assert FM.load_catalog()["sessions"] == {}
+
+    def test_segments_hold_multiple_sessions(self, db_session, finished, monkeypatch):
+        monkeypatch.setattr("app.db.database.SessionLocal", lambda: db_session)
+        monkeypatch.setattr(db_session, "close", lambda: None)
+        assert cli.main(["pack-conversations", "--session-id", str(finished["abandoned"])]) == 0
+        segment = FM.load_catalog()["sessions"][str(finished["abandoned"])]["segment"]
+        FM.append_message(99, _msg("collect", content="later"))
+
+        assert FM.pack({99: segment.removesuffix(".jsonl.gz")}) == 1
+
+        entry = FM.load_catalog()["sessions"]["99"]
+        assert entry["segment"] == segment and entry["offset"] > 0
+        assert [m["content"] for m in FM.read_full_history(99)] == ["later"]
+        assert FM.read_full_history(finished["abandoned"])[0]["content"] == "abandoned 你好"
+
+
+class TestReadPage:
+    """按字节偏移游标分页读取会话消息"""
+
+    @staticmethod
+    def _seed(session_id, turns=5):
+        FM.append_message(session_id, _msg("collect", role="assistant", content="greeting"))
+        for i in range(turns):
+            FM.append_message(session_id, _msg("collect", content=f"u{i}"))
+            FM.append_message(session_id, {"step": "collect", "role": "assistant", "tool_calls": [{"id": "c"}]})
+            FM.append_message(session_id, _msg("collect", role="tool", content="{}"))
+            FM.append_message(session_id, _msg(
+                "collect", role="assistant", content=f"a{i}",
+                ui_metadata={"quick_replies": ["ok"], "ui_hint": "none"},
+            ))
+        FM.archive_step(session_id, "collect")
+        FM.append_message(session_id, _msg("confirm", content="last"))
+
+    def test_desc_pages_cover_history(self):
+        self._seed(20)
+        seen, cursor = [], None
+        while True:
+            page, cursor, has_more = FM.read_page(20, cursor=cursor, limit=4, order="desc")
+            seen += [m["content"] for m in page]
+            if not has_more:
+                break
+        assert cursor is None
+        expected = ["greeting"] + [c for i in range(5) for c in (f"u{i}", f"a{i}")] + ["last"]
+        assert seen == list(reversed(expected))
+
+    def test_asc_pages_and_archived_flags(self):
+        self._seed(21, turns=2)
+        page, cursor, has_more = FM.read_page(21, limit=3, order="asc")
+        assert [m["content"] for m in page] == ["greeting", "u0", "a0"]
+        assert has_more and all(m["archived"] for m in page)
+        assert page[2]["ui_metadata"]["quick_replies"] == ["ok"]
+
+        page, cursor, has_more = FM.read_page(21, cursor=cursor, limit=10, order="asc")
+        assert [m["content"] for m in page] == ["u1", "a1", "last"]
+        assert not has_more and page[-1]["archived"] is False
+        assert cursor == FM.get_log_size(21)
+
+    def test_reverse_reader_crosses_blocks(self, monkeypatch):
+        monkeypatch.setattr("app.services.conversation_file._REVERSE_BLOCK", 7)
+        self._seed(22, turns=3)
+        page, _, _ = FM.read_page(22, limit=100, order="desc")
+        assert [m["content"] for m in page][:3] == ["last", "a2", "u2"]
+        assert page[-1]["content"] == "greeting"
+
+    def test_invalid_cursor(self):
+        self._seed(23, turns=1)
+        with pytest.raises(ValueError):
+            FM.read_page(23, cursor=3)
+        with pytest.raises(ValueError):
+            FM.read_page(23, cursor=FM.get_log_size(23) + 10)
+
+    def test_packed_session_pages(self):
+        self._seed(24, turns=2)
+        FM.pack({24: "2026-10"})
+        page, cursor, has_more = FM.read_page(24, limit=2, order="desc")
+        assert [m["content"] for m in page] == ["last", "a1"]
+        page, _, _ = FM.read_page(24, cursor=cursor, limit=10, order="desc")
+        assert page[-1]["content"] == "greeting"
+
+    def test_packed_session_decompressed_once(self, monkeypatch):
+        self._seed(25, turns=2)
+        FM.pack({25: "2026-10"})
+        decompress = gzip.decompress
+        calls = []
+        monkeypatch.setattr(gzip, "decompress", lambda data: calls.append(1) or decompress(data))
+
+        page, cursor, _ = FM.read_page(25, limit=2, order="desc")
+        page, _, _ = FM.read_page(25, cursor=cursor, limit=10, order="desc")
+
+        assert page[-1]["content"] == "greeting"
+        assert len(calls) == 1
+
+    def test_index_failure_does_not_leak_file(self, monkeypatch):
+        self._seed(26, turns=1)
+        opened = []
+        real_open = open
+
+        def tracking_open(*args, **kwargs):
+            f = real_open(*args, **kwargs)
+            opened.append(f)
+            return f
+
+        def broken_index(session_id):
+            raise OSError("index unavailable")
+
+        monkeypatch.setattr("app.services.conversation_file.open", tracking_open, raising=False)
+        monkeypatch.setattr(FM, "_load_index", staticmethod(broken_index))
+
+        with pytest.raises(OSError):
+            FM.read_page(26)
+        assert all(f.closed for f in opened)
+
+    def test_api_returns_page(self, client, db_session):
+        from app.core.dependencies import get_current_active_user
+        from app.main import app
+
+        user = User(email="page@example.com", username="page", hashed_password="x", is_active=True)
+        db_session.add(user)
+        db_session.commit()
+        row = ConversationSession(user_id=user.id, status="active", current_step="confirm")
+        db_session.add(row)
+        db_session.commit()
+        self._seed(row.id, turns=2)
+        app.dependency_overrides[get_current_active_user] = lambda: user
+
+        response = client.get(f"/api/v1/conversations/{row.id}/messages?limit=2")
+        assert response.status_code == 200
+        body = response.json()
+        assert [m["content"] for m in body["messages"]] == ["last", "a1"]
+        assert body["has_more"] is True
+        assert body["messages"][1]["ui_metadata"]["quick_replies"] == ["ok"]
+
+        response = client.get(
+            f"/api/v1/conversations/{row.id}/messages",
+            params={"cursor": body["next_cursor"], "limit": 50},
+        )
+        assert response.json()["next_cursor"] is None
+        assert client.get(f"/api/v1/conversations/{row.id}/messages?cursor=1").status_code == 400
+        assert client.get(f"/api/v1/conversations/{row.id + 1}/messages").status_code == 404
@@ -0,0 +1,131 @@
+"""
+DesignService 执行估算模式单元测试
+覆盖: inline 同步估算、background 先保存后回填、后台估算失败记录、刚生成的设计图字节复用
+"""
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from app.core.config import settings
+from app.models.agent_job import AgentJob
+from app.models.user import User
+from app.schemas.design import DesignGenerateRequest, DesignRefineRequest
+from app.services.design_service import ESTIMATE_JOB_KIND, DesignService
+from app.services.job_service import JobService
+from tests.conftest import MOCK_ESTIMATION, _mock_ai_provider
+
+
+@pytest.fixture
+def user(db_session):
+    user = User(email="designer@example.com", username="designer", hashed_password="x", is_active=True)
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    return user
+
+
+@pytest.fixture
+def provider():
+    provider = _mock_ai_provider()
+    with patch("app.services.ai.factory.AIProviderFactory.get_provider", return_value=provider):
+        yield provider
+
+
+async def _drain():
+    await asyncio.gather(*list(JobService._tasks.values()))
+
+
+class TestEstimationModes:
+
+    @pytest.mark.asyncio
+    async def test_inline_estimates_before_returning(self, db_session, user, provider):
+        design = await DesignService.generate_design(
+            db_session, DesignGenerateRequest(prompt="粉色渐变"), user.id
+        )
+
+        assert design.estimation_status == "succeeded"
+        assert design.estimated_duration == 60 and design.estimated_at is not None
+        assert db_session.query(AgentJob).count() == 0
+
+    @pytest.mark.asyncio
+    async def test_background_returns_first_then_backfills(self, db_session, user, provider, monkeypatch):
+        monkeypatch.setattr(settings, "DESIGN_ESTIMATION_MODE", "background")
+        gate = asyncio.Event()
+
+        async def slow_estimate(design_image):
+            await gate.wait()
+            return MOCK_ESTIMATION
+        provider.estimate_execution.side_effect = slow_estimate
+
+        design = await DesignService.generate_design(
+            db_session, DesignGenerateRequest(prompt="粉色渐变"), user.id
+        )
+        assert design.estimation_status == "pending"
+        assert design.estimated_duration is None
+
+        refined = await DesignService.refine_design(
+            db_session, design.id, DesignRefineRequest(refinement_instruction="更多亮片"), user.id
+        )
+        assert refined.estimation_status == "pending"
+
+        gate.set()
+        await _drain()
+        db_session.refresh(design)
+        db_session.refresh(refined)
+        for plan in (design, refined):
+            assert plan.estimation_status == "succeeded"
+            assert plan.estimated_materials == MOCK_ESTIMATION["materials"]
+        jobs = db_session.query(AgentJob).filter(AgentJob.kind == ESTIMATE_JOB_KIND).all()
+        assert [job.status for job in jobs] == ["succeeded", "succeeded"]
+
+    @pytest.mark.asyncio
+    async def test_background_failure_is_recorded_on_plan(self, db_session, user, provider, monkeypatch):
+        monkeypatch.setattr(settings, "DESIGN_ESTIMATION_MODE", "background")
+        provider.estimate_execution.side_effect = RuntimeError("vision quota exceeded")
+
+        design = await DesignService.generate_design(
+            db_session, DesignGenerateRequest(prompt="粉色渐变"), user.id
+        )
+        await _drain()
+
+        db_session.refresh(design)
+        assert design.estimation_status == "failed"
+        assert design.estimation_error == "vision quota exceeded"
+        assert design.generated_image_path
+
+    @pytest.mark.asyncio
+    async def test_background_timeout_is_recorded_on_plan(self, db_session, user, provider, monkeypatch):
+        monkeypatch.setattr(settings, "DESIGN_ESTIMATION_MODE", "background")
+        monkeypatch.setattr(settings, "AGENT_JOB_TIMEOUT_SECONDS", 0.05)
+
+        async def slow_estimate(design_image):
+            await asyncio.sleep(1)
+
+        provider.estimate_execution.side_effect = slow_estimate
+
+        design = await DesignService.generate_design(
+            db_session, DesignGenerateRequest(prompt="粉色渐变"), user.id
+        )
+        await _drain()
+
+        db_session.refresh(design)
+        assert design.estimation_status == "failed"
+        assert "timed out" in design.estimation_error
+
+
+class TestGeneratedImageReuse:
+
+    @pytest.mark.asyncio
+    async def test_estimate_uses_generated_bytes(self, tmp_path, monkeypatch):
+        from app.services.ai.openai_provider import OpenAIProvider
+
+        monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+        with patch("app.services.ai.openai_provider.AsyncOpenAI"):
+            provider = OpenAIProvider()
+        provider._generated_images.set("/uploads/designs/new.png", b"fresh-bytes")
+
+        # 文件不存在：字节直接来自生成阶段的缓存
+        content = provider._image_content("/uploads/designs/new.png")
+
+        assert content["image_url"]["url"] == "data:image/png;base64,ZnJlc2gtYnl0ZXM="
@@ -0,0 +1,118 @@
+"""
+离线 Fake AI Provider 单元测试
+覆盖: 本地绘制设计图（相同输入相同文件）、结构合法的估算 / 分析结果、延迟与错误注入、工厂选项、合成对话后端驱动 Agent 回合
+"""
+import json
+
+import pytest
+from PIL import Image
+
+from app.core.config import settings
+from app.models.user import User
+from app.services.ability_service import INITIAL_DIMENSIONS
+from app.services.agent_service import AgentService
+from app.services.ai.factory import AIProviderFactory
+from app.services.ai.fake_chat import SyntheticChatClient
+from app.services.ai.fake_provider import FakeAIProvider, FakeProviderError, FaultInjector
+
+
+@pytest.fixture(autouse=True)
+def fake_env(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(settings, "CONVERSATIONS_DIR", str(tmp_path / "conversations"))
+    monkeypatch.setattr(settings, "FAKE_AI_LATENCY_SECONDS", "default:0")
+    monkeypatch.setattr(settings, "FAKE_AI_ERROR_RATE", "default:0")
+
+
+class TestFakeAIProvider:
+
+    @pytest.mark.asyncio
+    async def test_generate_is_deterministic(self, tmp_path):
+        provider = FakeAIProvider()
+
+        first = await provider.generate_design("pink gradient", design_target="5nails")
+        again = await provider.generate_design("pink gradient", design_target="5nails")
+        refined = await provider.refine_design(first, "add gold foil", design_target="5nails")
+
+        assert first == again != refined
+        with Image.open(tmp_path / "uploads" / first[len("/uploads/"):]) as img:
+            assert img.format == "PNG" and img.size == (1024, 1024)
+
+    @pytest.mark.asyncio
+    async def test_structured_results_match_provider_schema(self):
+        provider = FakeAIProvider()
+
+        estimation = await provider.estimate_execution("/uploads/designs/a.png")
+        analysis = await provider.compare_images("/uploads/designs/a.png", "/uploads/actuals/b.jpg",
+                                                 artist_review="ok", customer_satisfaction=5)
+        caption = await provider.describe_image("/uploads/actuals/b.jpg")
+
+        assert estimation == await provider.estimate_execution("/uploads/designs/a.png")
+        assert set(estimation) == {"estimated_duration", "difficulty_level", "materials", "techniques"}
+        assert set(analysis["ability_scores"]) == {dim["name"] for dim in INITIAL_DIMENSIONS}
+        assert 0 <= analysis["similarity_score"] <= 100
+        assert {"differences", "suggestions", "contextual_insights", "customer_updates"} <= set(analysis)
+        assert set(caption) == {"caption", "palette", "style_tags", "nail_count"}
+
+    def test_factory_option(self):
+        AIProviderFactory.reset()
+        try:
+            assert isinstance(AIProviderFactory.get_provider("fake"), FakeAIProvider)
+        finally:
+            AIProviderFactory.reset()
+
+
+class TestFaultInjector:
+
+    def test_latency_distribution(self, monkeypatch):
+        monkeypatch.setattr(settings, "FAKE_AI_LATENCY_SECONDS", "default:0.5,generate_design:6")
+        monkeypatch.setattr(settings, "FAKE_AI_LATENCY_JITTER", 0.3)
+
+        samples = [FaultInjector(seed=7).latency("generate_design") for _ in range(2)]
+        assert samples[0] == samples[1] and samples[0] > 0
+        assert FaultInjector(seed=7).latency("chat") != samples[0]
+
+        monkeypatch.setattr(settings, "FAKE_AI_LATENCY_JITTER", 0)
+        assert FaultInjector().latency("estimate_execution") == 0.5
+
+    @pytest.mark.asyncio
+    async def test_error_rate(self, monkeypatch):
+        monkeypatch.setattr(settings, "FAKE_AI_ERROR_RATE", "default:0,compare_images:1")
+        provider = FakeAIProvider()
+
+        with pytest.raises(FakeProviderError) as exc:
+            await provider.compare_images("/uploads/designs/a.png", "/uploads/actuals/b.jpg")
+        assert exc.value.status_code == 503
+        assert await provider.estimate_execution("/uploads/designs/a.png")
+
+
+class TestSyntheticChat:
+
+    @pytest.mark.asyncio
+    async def test_drives_agent_turns(self, db_session, monkeypatch):
+        monkeypatch.setattr(settings, "AI_PROVIDER", "fake")
+        monkeypatch.setattr(settings, "FAKE_CHAT_TURNS_PER_STEP", 2)
+        user = User(email="load@example.com", username="load", hashed_password="x", is_active=True)
+        db_session.add(user)
+        db_session.commit()
+
+        agent = AgentService()
+        assert isinstance(agent._llm, SyntheticChatClient)
+        session, _ = agent.create_session(db_session, user.id)
+
+        first = await agent.process_message(db_session, session.id, user.id, "Momo came in today")
+        # 第一条消息：search_customer 工具往返 + 最终回复
+        assert agent._llm.requests == 2
+        assert first.current_step == "collect"
+
+        second = await agent.process_message(db_session, session.id, user.id, "that's all")
+        assert second.current_step == "confirm"
+
+    def test_required_tool_choice_returns_tool_call(self):
+        tools = [{"type": "function", "function": {"name": "search_customer"}}]
+        messages = [{"role": "user", "content": "a"}, {"role": "assistant", "content": "b"},
+                    {"role": "user", "content": "Momo"}]
+
+        assert "tool_calls" not in SyntheticChatClient.reply(messages, tools)
+        call = SyntheticChatClient.reply(messages, tools, tool_choice="required")["tool_calls"][0]
+        assert json.loads(call["function"]["arguments"]) == {"query": "Momo"}
@@ -248,6 +248,23 @@ class TestEstimateExecution:
                 await provider.estimate_execution("/uploads/designs/test.png")
 
 
+class TestDescribeImage:
+    """测试 describe_image"""
+
+    @pytest.mark.asyncio
+    async def test_describe_image_markdown_json(self, provider, mock_genai_client):
+        """解析 markdown 代码块包裹的描述 JSON"""
+        description = {"caption": "裸粉色短方甲", "palette": ["裸粉"], "style_tags": ["简约"], "nail_count": 5}
+        mock_response = MagicMock()
+        mock_response.text = f"```json\n{json.dumps(description, ensure_ascii=False)}\n```"
+        mock_genai_client.aio.models.generate_content.return_value = mock_response
+
+        with patch.object(provider, "_load_image_part", return_value=MagicMock()):
+            result = await provider.describe_image("/uploads/inspirations/test.png")
+
+        assert result == description
+
+
 class TestCompareImages:
     """测试 compare_images"""
 
@@ -0,0 +1,73 @@
+"""
+共享 HTTP 客户端单元测试
+覆盖: 进程内单例、连接池配置、HTTP/2 可选启用、Provider 与 Agent 共用同一客户端、共享客户端重建后 SDK 客户端仍可用
+"""
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from app.core import http
+from app.core.config import settings
+from app.services.agent_service import AgentService
+from app.services.ai.gemini_provider import GeminiProvider
+from app.services.ai.openai_provider import OpenAIProvider
+
+
+@pytest.fixture(autouse=True)
+def fresh_client(monkeypatch):
+    """每个测试使用新的共享客户端，结束后恢复模块级单例"""
+    monkeypatch.setattr(http, "_client", None)
+
+
+class TestSharedHttpClient:
+
+    @pytest.mark.asyncio
+    async def test_singleton_until_closed(self, monkeypatch):
+        monkeypatch.setattr(settings, "HTTP_MAX_KEEPALIVE_CONNECTIONS", 7)
+        client = http.get_http_client()
+
+        assert http.get_http_client() is client
+        assert client._transport._pool._max_keepalive_connections == 7
+
+        await http.close_http_client()
+        assert client.is_closed
+        assert http.get_http_client() is not client
+
+    @pytest.mark.asyncio
+    async def test_http2_only_when_h2_installed(self, monkeypatch):
+        monkeypatch.setattr(settings, "HTTP_HTTP2", True)
+        monkeypatch.setattr(http, "http2_available", lambda: False)
+        assert http.create_http_client()._transport._pool._http2 is False
+
+        monkeypatch.setattr(settings, "HTTP_HTTP2", False)
+        monkeypatch.setattr(http, "http2_available", lambda: True)
+        assert http.create_http_client()._transport._pool._http2 is False
+
+    @pytest.mark.asyncio
+    async def test_providers_and_agent_share_client(self):
+        assert isinstance(OpenAIProvider().client._client, http.SharedHTTPClient)
+        assert isinstance(AgentService()._llm._client, http.SharedHTTPClient)
+        with patch("app.services.ai.gemini_provider.genai.Client"):
+            client = GeminiProvider().client._api_client._async_httpx_client
+        assert isinstance(client, http.SharedHTTPClient)
+
+    @pytest.mark.asyncio
+    async def test_sdk_clients_survive_client_restart(self, monkeypatch):
+        """共享客户端关闭后（lifespan 结束），之前构造的 SDK 客户端改用重新创建的客户端发送请求"""
+        created = []
+
+        def create_http_client():
+            client = httpx.AsyncClient(
+                transport=httpx.MockTransport(lambda request: httpx.Response(200, json={"n": len(created)}))
+            )
+            created.append(client)
+            return client
+
+        monkeypatch.setattr(http, "create_http_client", create_http_client)
+        sdk_client = AgentService()._llm._client
+
+        assert (await sdk_client.get("https://example.com/a")).json() == {"n": 1}
+        await http.close_http_client()
+        assert (await sdk_client.get("https://example.com/b")).json() == {"n": 2}
+        assert created[0].is_closed and not created[1].is_closed
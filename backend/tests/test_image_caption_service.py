@@ -0,0 +1,106 @@
+"""
+图片描述服务单元测试
+覆盖: 按内容哈希缓存、并发去重、失败降级、Agent 上传图片时写入描述
+"""
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.models.image_caption import ImageCaption
+from app.services.image_caption_service import ImageCaptionService
+from tests.conftest import _completion, _final_json
+
+_DESCRIPTION = {
+    "caption": "Short square nude nails with gold foil on the ring finger.",
+    "palette": ["nude pink", "gold"],
+    "style_tags": ["minimalist", "foil"],
+    "nail_count": 5,
+}
+
+
+@pytest.fixture(autouse=True)
+def caption_env(tmp_path, monkeypatch):
+    monkeypatch.setattr(ImageCaptionService, "_memory", LRUCache(maxsize=16))
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(settings, "CONVERSATIONS_DIR", str(tmp_path / "conversations"))
+
+
+@pytest.fixture
+def provider():
+    p = MagicMock()
+    p.describe_image = AsyncMock(return_value=dict(_DESCRIPTION))
+    return p
+
+
+def _image(tmp_path, name, data=b"\x89PNG\r\n\x1a\n" + b"\x00" * 64):
+    path = tmp_path / "uploads" / "inspirations" / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return f"/uploads/inspirations/{name}"
+
+
+class TestImageCaptionService:
+
+    @pytest.mark.asyncio
+    async def test_same_content_described_once(self, db_session, tmp_path, provider):
+        first = await ImageCaptionService.describe(_image(tmp_path, "a.png"), provider)
+        # 同一内容换文件名、清空进程内缓存（模拟另一个 worker）后仍命中数据库缓存
+        ImageCaptionService._memory = LRUCache(maxsize=16)
+        second = await ImageCaptionService.describe(_image(tmp_path, "copy.png"), provider)
+
+        assert first == second
+        assert first == (
+            "Short square nude nails with gold foil on the ring finger. "
+            "Colors: nude pink, gold. Style: minimalist, foil. Nails: 5."
+        )
+        provider.describe_image.assert_awaited_once()
+        assert db_session.query(ImageCaption).count() == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_uploads_share_one_call(self, db_session, tmp_path, provider):
+        path = _image(tmp_path, "a.png")
+
+        results = await asyncio.gather(*[
+            ImageCaptionService.describe(path, provider) for _ in range(3)
+        ])
+
+        assert len(set(results)) == 1 and results[0]
+        provider.describe_image.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_failures_return_none(self, db_session, tmp_path, provider):
+        provider.describe_image.side_effect = RuntimeError("vision down")
+
+        assert await ImageCaptionService.describe(_image(tmp_path, "a.png"), provider) is None
+        assert await ImageCaptionService.describe("/uploads/missing.png", provider) is None
+        assert db_session.query(ImageCaption).count() == 0
+
+        provider.describe_image.side_effect = None
+        provider.describe_image.return_value = {"caption": "", "palette": "red"}
+        assert await ImageCaptionService.describe(_image(tmp_path, "a.png"), provider) is None
+
+
+class TestAgentImageUpload:
+
+    @pytest.mark.asyncio
+    async def test_upload_puts_caption_in_prompt(self, agent, db_session, session, user, tmp_path,
+                                                 monkeypatch, provider):
+        monkeypatch.setattr("app.services.ai.factory.AIProviderFactory._instance", provider)
+        path = _image(tmp_path, "a.png")
+        agent._llm.chat.completions.create.side_effect = [
+            _completion(content=_final_json("Nice reference")),
+            _completion(content=_final_json("Noted")),
+        ]
+
+        await agent.handle_image_upload(db_session, session.id, user.id, path, "inspiration")
+        await agent.process_message(db_session, session.id, user.id, "use that photo again")
+
+        caption = session.context["image_captions"][path]
+        assert caption.startswith("Short square nude nails")
+        sent = agent._llm.chat.completions.create.call_args.kwargs["messages"]
+        assert f"Inspiration image {path}: {caption}" in sent[0]["content"]
+        assert any(m["role"] == "system" and caption in m["content"] for m in sent[1:])
+        provider.describe_image.assert_awaited_once()
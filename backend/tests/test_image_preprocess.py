@@ -0,0 +1,156 @@
+"""
+视觉输入图片预处理单元测试
+覆盖: 缩小/旋正/去除 EXIF/重新编码、派生图内存与磁盘缓存（含容量淘汰）、无法解码与关闭预处理时原样返回、
+      Provider 发送预处理后的图片（含对比分析）
+"""
+import base64
+import io
+import json
+import os
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from PIL import Image
+
+from app.core.config import settings
+from app.services.ai import image_preprocess
+from app.services.ai.image_preprocess import prepare_image
+
+
+@pytest.fixture(autouse=True)
+def preprocess_env(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "VISION_CACHE_DIR", str(tmp_path / "vision_cache"))
+    monkeypatch.setattr(settings, "VISION_IMAGE_PREPROCESS", True)
+    monkeypatch.setattr(settings, "VISION_IMAGE_MAX_SIDE", 256)
+    monkeypatch.setattr(settings, "VISION_IMAGE_FORMAT", "JPEG")
+    image_preprocess._derivatives.clear()
+    yield
+    image_preprocess._derivatives.clear()
+
+
+def _photo(size=(1200, 600), mode="RGB", orientation=None, fmt="JPEG") -> bytes:
+    img = Image.new(mode, size, (200, 120, 150) if mode == "RGB" else (200, 120, 150, 0))
+    out = io.BytesIO()
+    kwargs = {}
+    if orientation:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        kwargs["exif"] = exif.tobytes()
+    img.save(out, format=fmt, **kwargs)
+    return out.getvalue()
+
+
+class TestPrepareImage:
+
+    def test_downsizes_rotates_and_strips_exif(self):
+        # orientation=6：相机横拍、需顺时针旋转 90° 显示
+        data, mime_type = prepare_image("photo.jpg", _photo(orientation=6))
+
+        assert mime_type == "image/jpeg"
+        with Image.open(io.BytesIO(data)) as img:
+            assert img.size == (128, 256)
+            assert not img.getexif()
+
+    def test_transparent_png_to_webp(self, monkeypatch):
+        monkeypatch.setattr(settings, "VISION_IMAGE_FORMAT", "webp")
+
+        data, mime_type = prepare_image("design.png", _photo(size=(100, 100), mode="RGBA", fmt="PNG"))
+
+        assert mime_type == "image/webp"
+        with Image.open(io.BytesIO(data)) as img:
+            assert img.format == "WEBP" and img.size == (100, 100)
+
+    def test_derivative_cached_by_content(self, tmp_path):
+        source = _photo()
+        with patch.object(image_preprocess, "_encode", wraps=image_preprocess._encode) as encode:
+            first = prepare_image("/uploads/actuals/a.jpg", source)
+            # 同一内容换路径：命中进程内缓存
+            assert prepare_image("/uploads/actuals/copy.jpg", source) == first
+            # 进程重启后：命中磁盘缓存
+            image_preprocess._derivatives.clear()
+            assert prepare_image("/uploads/actuals/a.jpg", source) == first
+            # 不同尺寸上限是不同的派生图
+            prepare_image("/uploads/actuals/a.jpg", source, max_side=64)
+
+        assert encode.call_count == 2
+        assert len(list((tmp_path / "vision_cache").iterdir())) == 2
+
+    def test_disk_cache_evicts_least_recently_used(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(settings, "VISION_CACHE_MAX_MB", 1)
+        cache_dir = tmp_path / "vision_cache"
+        cache_dir.mkdir()
+        for i, name in enumerate(["old", "recent"]):
+            (cache_dir / name).write_bytes(b"x" * 600 * 1024)
+            os.utime(cache_dir / name, (1000 + i, 1000 + i))
+
+        prepare_image("photo.jpg", _photo())
+
+        assert any(path.suffix == ".jpg" for path in cache_dir.iterdir())
+        assert not (cache_dir / "old").exists()
+        assert (cache_dir / "recent").exists()
+
+    def test_undecodable_or_disabled_returns_original(self, monkeypatch):
+        assert prepare_image("design.png", b"not-an-image") == (b"not-an-image", "image/png")
+
+        monkeypatch.setattr(settings, "VISION_IMAGE_PREPROCESS", False)
+        source = _photo()
+        assert prepare_image("photo.jpg", source) == (source, "image/jpeg")
+
+
+class TestProviderUsesPreprocessedImage:
+
+    def test_openai_low_detail_sends_small_jpeg(self, tmp_path, monkeypatch):
+        from app.services.ai.openai_provider import OpenAIProvider
+
+        monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+        (tmp_path / "actuals").mkdir()
+        (tmp_path / "actuals" / "photo.png").write_bytes(_photo(size=(2000, 1000), fmt="PNG"))
+        with patch("app.services.ai.openai_provider.AsyncOpenAI"):
+            provider = OpenAIProvider()
+
+        url = provider._image_content("/uploads/actuals/photo.png", detail="low")["image_url"]["url"]
+
+        assert url.startswith("data:image/jpeg;base64,")
+        with Image.open(io.BytesIO(base64.b64decode(url.split(",", 1)[1]))) as img:
+            assert img.size == (512, 256)
+
+    @pytest.mark.asyncio
+    async def test_openai_compare_sends_preprocessed_images(self, tmp_path, monkeypatch):
+        from app.services.ai.openai_provider import OpenAIProvider
+
+        monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+        for folder, size in (("designs", (1024, 1024)), ("actuals", (4000, 3000))):
+            (tmp_path / folder).mkdir()
+            (tmp_path / folder / "photo.png").write_bytes(_photo(size=size, fmt="PNG"))
+        with patch("app.services.ai.openai_provider.AsyncOpenAI"):
+            provider = OpenAIProvider()
+        message = SimpleNamespace(content=json.dumps({"similarity_score": 90}))
+        provider.client.chat.completions.create = AsyncMock(
+            return_value=SimpleNamespace(choices=[SimpleNamespace(message=message)])
+        )
+
+        await provider.compare_images("/uploads/designs/photo.png", "/uploads/actuals/photo.png")
+
+        content = provider.client.chat.completions.create.call_args.kwargs["messages"][1]["content"]
+        images = [part["image_url"] for part in content if part["type"] == "image_url"]
+        assert [image["detail"] for image in images] == ["high", "high"]
+        for image in images:
+            assert image["url"].startswith("data:image/jpeg;base64,")
+            with Image.open(io.BytesIO(base64.b64decode(image["url"].split(",", 1)[1]))) as img:
+                assert max(img.size) == 256
+
+    def test_gemini_part_uses_preprocessed_bytes(self, tmp_path):
+        from app.services.ai.gemini_provider import GeminiProvider
+
+        with patch("app.services.ai.gemini_provider.genai"):
+            provider = GeminiProvider()
+        provider._generated_images.set("/uploads/designs/new.png", _photo(fmt="PNG"))
+
+        with patch("app.services.ai.gemini_provider.types.Part") as mock_part:
+            provider._load_image_part("/uploads/designs/new.png")
+
+        kwargs = mock_part.from_bytes.call_args.kwargs
+        assert kwargs["mime_type"] == "image/jpeg"
+        with Image.open(io.BytesIO(kwargs["data"])) as img:
+            assert max(img.size) == 256
@@ -0,0 +1,148 @@
+"""
+后台任务服务单元测试
+覆盖: 入队执行、失败记录、重启恢复、结果交付，以及 Agent 耗时工具的后台执行
+"""
+import asyncio
+import datetime
+import json
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.core.config import settings
+from app.models.agent_job import AgentJob
+from app.models.user import User
+from app.services.agent_service import AgentService
+from app.services.agent_tools import ToolExecutor
+from app.services.job_service import JobService
+from tests.conftest import _completion, _final_json, _tool_call
+
+
+@pytest.fixture(autouse=True)
+def job_env(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CONVERSATIONS_DIR", str(tmp_path / "conversations"))
+
+
+@pytest.fixture
+def user(db_session):
+    user = User(email="jobs@example.com", username="jobs", hashed_password="x", is_active=True)
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    return user
+
+
+async def _drain():
+    await asyncio.gather(*list(JobService._tasks.values()))
+
+
+class TestJobService:
+
+    @pytest.mark.asyncio
+    async def test_enqueue_runs_handler(self, db_session, user, monkeypatch):
+        handler = AsyncMock(return_value={"content": "{}", "context": {"x": 1}})
+        monkeypatch.setitem(JobService._handlers, "test_kind", handler)
+
+        job = JobService.enqueue(db_session, user.id, "test_kind", {"args": {}})
+        assert job.status == "pending"
+        await _drain()
+
+        db_session.refresh(job)
+        assert job.status == "succeeded"
+        assert job.attempts == 1
+        assert job.result == {"content": "{}", "context": {"x": 1}}
+        handler.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_failure_is_recorded(self, db_session, user, monkeypatch):
+        monkeypatch.setitem(
+            JobService._handlers, "test_kind", AsyncMock(side_effect=RuntimeError("boom"))
+        )
+        job = JobService.enqueue(db_session, user.id, "test_kind", {})
+        await _drain()
+
+        db_session.refresh(job)
+        assert job.status == "failed"
+        assert job.error == "boom"
+        assert "boom" in json.loads(job.result["content"])["error"]
+
+    @pytest.mark.asyncio
+    async def test_resume_reruns_interrupted_job(self, db_session, user, monkeypatch):
+        monkeypatch.setitem(
+            JobService._handlers, "test_kind", AsyncMock(return_value={"content": "ok"})
+        )
+        stale = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+        job = AgentJob(
+            user_id=user.id, kind="test_kind", status="running",
+            payload={}, attempts=1, updated_at=stale,
+        )
+        db_session.add(job)
+        db_session.commit()
+
+        assert JobService.resume_pending() == 1
+        await _drain()
+
+        db_session.refresh(job)
+        assert job.status == "succeeded"
+        assert job.attempts == 2
+
+    @pytest.mark.asyncio
+    async def test_resume_after_quick_restart(self, db_session, user, monkeypatch):
+        """崩溃后立即重启：单 worker 下刚更新过的 running 任务同样恢复，多 worker 下等待超时"""
+        monkeypatch.setitem(
+            JobService._handlers, "test_kind", AsyncMock(return_value={"content": "ok"})
+        )
+        job = AgentJob(user_id=user.id, kind="test_kind", status="running", payload={}, attempts=1)
+        db_session.add(job)
+        db_session.commit()
+
+        monkeypatch.setattr(settings, "AGENT_JOB_SINGLE_WORKER", False)
+        assert JobService.resume_pending() == 0
+
+        monkeypatch.setattr(settings, "AGENT_JOB_SINGLE_WORKER", True)
+        assert JobService.resume_pending() == 1
+        await _drain()
+
+        db_session.refresh(job)
+        assert job.status == "succeeded"
+
+
+class TestBackgroundTools:
+    """耗时工具入队执行，结果在下一轮对话交付"""
+
+    @pytest.mark.asyncio
+    async def test_generate_design_delivered_next_turn(self, db_session, user, monkeypatch):
+        monkeypatch.setattr(settings, "AGENT_BACKGROUND_TOOLS", True)
+        monkeypatch.setattr(
+            ToolExecutor, "_generate_design",
+            AsyncMock(return_value=(
+                json.dumps({"result": "Design generated successfully", "design_id": 5}),
+                {"design_plan_id": 5, "design_image_url": "/uploads/designs/5.png"},
+            )),
+        )
+        agent = AgentService()
+        agent._llm = MagicMock()
+        agent._llm.chat.completions.create = AsyncMock(side_effect=[
+            _completion(tool_calls=[_tool_call("call_1", "generate_design", {"prompt": "green"})]),
+            _completion(content=_final_json("Working on it")),
+            _completion(content=_final_json("Here it is")),
+        ])
+        session, _ = agent.create_session(db_session, user.id)
+
+        first = await agent.process_message(db_session, session.id, user.id, "design please")
+        tool_result = json.loads(agent._store.read_full_history(session.id)[3]["content"])
+        assert tool_result["status"] == "pending"
+        assert first.context["pending_job_ids"] == [tool_result["job_id"]]
+
+        await _drain()
+        second = await agent.process_message(db_session, session.id, user.id, "done yet?")
+
+        assert second.context["design_plan_id"] == 5
+        assert "pending_job_ids" not in second.context
+        assert second.ui_metadata.ui_hint == "show_design_preview"
+        sent = agent._llm.chat.completions.create.call_args.kwargs["messages"]
+        assert any(
+            m["role"] == "system" and "Design generated successfully" in m["content"]
+            for m in sent[1:]
+        )
+        assert JobService.take_finished(db_session, session.id) == []
@@ -20,3 +20,9 @@ def test_api_health():
     response = client.get("/api/v1/health")
     assert response.status_code == 200
     assert response.json()["status"] == "healthy"
+
+
+def test_system_metrics():
+    response = client.get("/api/v1/system/metrics")
+    assert response.status_code == 200
+    assert set(response.json()) >= {"counters", "observations"}
@@ -0,0 +1,141 @@
+"""
+会话消息存储单元测试
+覆盖: SQL 存储的追加/归档/读取/分页、Agent 使用 SQL 存储的完整回合、JSONL 批量导入
+"""
+import pytest
+
+from app import cli
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.conversation_message import ConversationMessage
+from app.services.conversation_file import ConversationFileManager
+from app.services.message_store import (
+    JsonlMessageStore,
+    SqlMessageStore,
+    get_message_store,
+    import_jsonl_sessions,
+)
+from tests.conftest import _completion, _final_json, _tool_call
+
+
+@pytest.fixture(autouse=True)
+def store_env(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CONVERSATIONS_DIR", str(tmp_path / "conversations"))
+
+
+@pytest.fixture
+def sql_agent(agent):
+    agent._store = SqlMessageStore()
+    return agent
+
+
+def _msg(step, role="user", content="hi"):
+    return {"step": step, "archived": False, "role": role, "content": content}
+
+
+class TestSqlMessageStore:
+
+    def test_append_archive_and_read(self, db_session, session):
+        store = SqlMessageStore()
+        base = store.get_log_size(session.id)
+        assert store.append_message(session.id, _msg("collect", content="a")) == (base, base + 1)
+        store.archive_step(session.id, "collect")
+        store.append_message(session.id, _msg("confirm", content="b"))
+
+        assert store.read_current_step_messages(session.id, "collect") == []
+        assert [m["content"] for m in store.read_current_step_messages(session.id, "confirm")] == ["b"]
+        history = store.read_full_history(session.id)
+        assert history[-2]["_archive_marker"] is True
+        assert [m.get("archived") for m in history if m.get("content") == "a"] == [True]
+
+    def test_pages_by_seq(self, db_session, session):
+        store = SqlMessageStore()
+        for i in range(5):
+            store.append_message(session.id, _msg("collect", content=f"u{i}"))
+            store.append_message(session.id, {"step": "collect", "role": "assistant", "tool_calls": [{"id": "c"}]})
+
+        seen, cursor = [], None
+        while True:
+            page, cursor, has_more = store.read_page(session.id, cursor=cursor, limit=2)
+            seen += [m["content"] for m in page]
+            if not has_more:
+                break
+        assert seen == ["u4", "u3", "u2", "u1", "u0"]
+        assert cursor is None
+
+        page, cursor, has_more = store.read_page(session.id, limit=3, order="asc")
+        assert [m["content"] for m in page] == ["u0", "u1", "u2"] and has_more
+
+        page, cursor, has_more = store.read_page(session.id, cursor=cursor, limit=3, order="asc")
+        assert [m["content"] for m in page] == ["u3", "u4"] and not has_more
+        assert cursor == store.get_log_size(session.id)
+
+    def test_writes_survive_other_session_close(self, db_session, session, session_factory):
+        """回合会话尚未提交时，其他会话 close() 的回滚不会撤销已写入的消息（StaticPool 共用一个连接）"""
+        store = SqlMessageStore()
+        store.append_message(session.id, _msg("collect", content="a"), db=db_session)
+        other = session_factory()
+        other.query(ConversationMessage).count()
+        other.close()
+        db_session.commit()
+
+        assert [m.get("content") for m in store.read_full_history(session.id)][-1] == "a"
+
+    def test_factory(self):
+        assert isinstance(get_message_store("jsonl"), JsonlMessageStore)
+        assert isinstance(get_message_store("sql"), SqlMessageStore)
+        with pytest.raises(ValueError):
+            get_message_store("redis")
+
+
+class TestAgentWithSqlStore:
+
+    @pytest.mark.asyncio
+    async def test_turns_write_rows(self, sql_agent, db_session, user):
+        session, _ = sql_agent.create_session(db_session, user.id)
+        sql_agent._llm.chat.completions.create.side_effect = [
+            _completion(tool_calls=[_tool_call("call_1", "search_customer", {"query": "Momo"})]),
+            _completion(content=_final_json("draft", step_complete=True)),
+            _completion(content=_final_json("confirm?")),
+        ]
+
+        await sql_agent.process_message(db_session, session.id, user.id, "that's all")
+        assert metrics.get_observation("agent_turn_commits")["last"] == 1
+        reply = await sql_agent.process_message(db_session, session.id, user.id, "yes")
+
+        assert reply.current_step == "confirm"
+        assert session.file_path is None
+        assert not (ConversationFileManager._base_dir() / str(session.id)).exists()
+        history = SqlMessageStore().read_full_history(session.id)
+        assert [m.get("role") for m in history] == [
+            "assistant", "user", "assistant", "tool", "assistant", None, "user", "assistant",
+        ]
+        sent = sql_agent._llm.chat.completions.create.call_args.kwargs["messages"]
+        assert [m["role"] for m in sent] == ["system", "user"]
+
+
+class TestImport:
+
+    def test_import_jsonl_sessions(self, agent, db_session, session):
+        ConversationFileManager.append_message(session.id, _msg("collect", content="a"))
+        ConversationFileManager.archive_step(session.id, "collect")
+        ConversationFileManager.append_message(session.id, _msg("confirm", content="b"))
+        ConversationFileManager.append_message(999, _msg("collect", content="orphan"))
+
+        assert import_jsonl_sessions(db_session) == (1, 1)
+        assert import_jsonl_sessions(db_session) == (0, 2)
+
+        store = SqlMessageStore()
+        assert store.read_full_history(session.id) == ConversationFileManager.read_full_history(session.id)
+        assert [m["content"] for m in store.read_current_step_messages(session.id, "confirm")] == ["b"]
+        assert store.get_log_size(session.id) == db_session.query(ConversationMessage).count()
+
+    def test_cli_replace(self, agent, db_session, session, monkeypatch, capsys):
+        monkeypatch.setattr("app.db.database.SessionLocal", lambda: db_session)
+        monkeypatch.setattr(db_session, "close", lambda: None)
+        import_jsonl_sessions(db_session)
+        ConversationFileManager.append_message(session.id, _msg("collect", content="later"))
+
+        assert cli.main(["import-conversations", "--replace", "--session-id", str(session.id)]) == 0
+        assert "已导入 1 个会话" in capsys.readouterr().out
+        assert SqlMessageStore().read_full_history(session.id)[-1]["content"] == "later"
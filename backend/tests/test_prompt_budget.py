@@ -0,0 +1,67 @@
+"""
+Prompt token 预算单元测试
+覆盖: token 估算、超长 JSON 字段截断、旧 tool 结果压缩、历史整组丢弃
+"""
+import json
+
+from app.services.prompt_budget import PromptBudget, count_tokens, estimate_tokens
+
+
+def _tool_round(call_id, payload):
+    return [
+        {"role": "assistant", "tool_calls": [{
+            "id": call_id, "type": "function",
+            "function": {"name": "list_inspirations", "arguments": "{}"},
+        }]},
+        {"role": "tool", "tool_call_id": call_id, "name": "list_inspirations",
+         "content": json.dumps(payload)},
+    ]
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("美甲设计") == 4
+
+
+def test_under_budget_is_unchanged():
+    messages = [{"role": "system", "content": "sys"}, {"role": "user", "content": "hi"}]
+    result, report = PromptBudget(1000).fit(messages)
+    assert result == messages
+    assert report.tokens_before == report.tokens_after == count_tokens(messages)
+
+
+def test_trims_oversized_json_fields_without_mutating_input():
+    tool = _tool_round("c1", {"result": "ok", "notes": "x" * 5000, "items": list(range(50))})
+    messages = [{"role": "system", "content": "sys"}, {"role": "user", "content": "hi"}] + tool
+    original = json.loads(json.dumps(messages))
+
+    result, report = PromptBudget(100000, max_field_chars=100, max_list_items=5).fit(messages)
+
+    payload = json.loads(result[-1]["content"])
+    assert payload["notes"].startswith("x" * 100) and "truncated 4900 chars" in payload["notes"]
+    assert len(payload["items"]) == 6
+    assert report.trimmed_fields == 1
+    assert messages == original
+
+
+def test_compacts_old_tool_results_then_drops_oldest_history():
+    big = {"result": "Inspiration library", "inspirations": ["y" * 1500] * 10}
+    messages = (
+        [{"role": "system", "content": "sys"},
+         {"role": "user", "content": "old question"},
+         {"role": "assistant", "content": "old answer " * 200}]
+        + _tool_round("c1", big)
+        + [{"role": "user", "content": "current"}]
+        + _tool_round("c2", big)
+    )
+
+    result, report = PromptBudget(4000).fit(messages)
+
+    assert report.compacted_tool_results == 1
+    assert report.dropped_messages > 0
+    assert not report.over_budget
+    assert result[0]["role"] == "system"
+    # 当前用户消息及其后的 tool 轮次完整保留，不出现孤立的 tool 消息
+    assert [m["role"] for m in result[-3:]] == ["user", "assistant", "tool"]
+    assert result[1]["role"] != "tool"
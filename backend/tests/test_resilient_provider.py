@@ -0,0 +1,209 @@
+"""
+AI Provider 容错包装单元测试
+覆盖: 重试与退避、故障转移、4xx / 本地输入错误的处理、熔断打开与半开试探、对冲请求、工厂包装
+"""
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.ai.factory import AIProviderFactory
+from app.services.ai.resilient_provider import (
+    CircuitBreaker,
+    ProviderUnavailableError,
+    ResilientAIProvider,
+)
+
+ESTIMATION = {"estimated_duration": 60, "difficulty_level": "medium"}
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture(autouse=True)
+def resilience_env(monkeypatch):
+    monkeypatch.setattr(settings, "AI_RETRY_ATTEMPTS", "default:2,generate_design:0")
+    monkeypatch.setattr(settings, "AI_RETRY_BASE_DELAY_SECONDS", 0.0)
+    monkeypatch.setattr(settings, "AI_CIRCUIT_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(settings, "AI_CIRCUIT_RESET_SECONDS", 30.0)
+    monkeypatch.setattr(settings, "AI_HEDGE_OPERATIONS", "")
+    monkeypatch.setattr(settings, "AI_HEDGE_MIN_SAMPLES", 3)
+    metrics.reset()
+
+
+def _provider(**methods):
+    provider = MagicMock()
+    for name, mock in methods.items():
+        setattr(provider, name, mock)
+    return provider
+
+
+class TestRetryAndFailover:
+
+    @pytest.mark.asyncio
+    async def test_retries_transient_errors(self):
+        primary = _provider(estimate_execution=AsyncMock(side_effect=[TimeoutError(), ESTIMATION]))
+        resilient = ResilientAIProvider([("openai", primary)])
+
+        assert await resilient.estimate_execution("/uploads/designs/a.png") == ESTIMATION
+        assert primary.estimate_execution.await_count == 2
+        assert metrics.get_counter("ai_retry", provider="openai", operation="estimate_execution") == 1
+
+    @pytest.mark.asyncio
+    async def test_fails_over_after_retries_exhausted(self):
+        primary = _provider(estimate_execution=AsyncMock(side_effect=ConnectionError("down")))
+        backup = _provider(estimate_execution=AsyncMock(return_value=ESTIMATION))
+        resilient = ResilientAIProvider([("openai", primary), ("gemini", backup)])
+
+        assert await resilient.estimate_execution("/uploads/designs/a.png") == ESTIMATION
+        assert primary.estimate_execution.await_count == 3
+        assert metrics.get_counter("ai_failover", provider="openai", operation="estimate_execution") == 1
+
+    @pytest.mark.asyncio
+    async def test_per_method_retry_count(self):
+        primary = _provider(generate_design=AsyncMock(side_effect=ConnectionError("down")))
+        backup = _provider(generate_design=AsyncMock(return_value="/uploads/designs/b.png"))
+        resilient = ResilientAIProvider([("openai", primary), ("gemini", backup)])
+
+        assert await resilient.generate_design("pink") == "/uploads/designs/b.png"
+        primary.generate_design.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_client_error_skips_retry_and_breaker(self):
+        primary = _provider(compare_images=AsyncMock(side_effect=_StatusError(400)))
+        backup = _provider(compare_images=AsyncMock(return_value={"similarity_score": 80}))
+        resilient = ResilientAIProvider([("openai", primary), ("gemini", backup)])
+
+        result = await resilient.compare_images("/uploads/designs/a.png", "/uploads/actuals/b.jpg")
+
+        assert result == {"similarity_score": 80}
+        primary.compare_images.assert_awaited_once()
+        assert resilient._members[0].breaker.failures == 0
+
+    @pytest.mark.asyncio
+    async def test_input_error_raises_without_failover(self):
+        primary = _provider(describe_image=AsyncMock(side_effect=FileNotFoundError("missing.png")))
+        backup = _provider(describe_image=AsyncMock())
+        resilient = ResilientAIProvider([("openai", primary), ("gemini", backup)])
+
+        with pytest.raises(FileNotFoundError):
+            await resilient.describe_image("/uploads/actuals/missing.png")
+        backup.describe_image.assert_not_awaited()
+
+
+class TestCircuitBreaker:
+
+    def test_state_transitions(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, reset_after=10, clock=lambda: now[0])
+
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open" and not breaker.allow()
+
+        now[0] = 10.0
+        assert breaker.allow()          # 半开：放行一次试探
+        assert not breaker.allow()      # 试探期间拒绝其他调用
+        breaker.record_failure()        # 试探失败：重新打开
+        assert breaker.state == "open"
+
+        now[0] = 20.0
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed" and breaker.allow()
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_routes_to_backup(self, monkeypatch):
+        monkeypatch.setattr(settings, "AI_RETRY_ATTEMPTS", "default:0")
+        primary = _provider(estimate_execution=AsyncMock(side_effect=ConnectionError("down")))
+        backup = _provider(estimate_execution=AsyncMock(return_value=ESTIMATION))
+        resilient = ResilientAIProvider([("openai", primary), ("gemini", backup)])
+
+        for _ in range(5):
+            await resilient.estimate_execution("/uploads/designs/a.png")
+
+        # 连续失败 3 次后熔断，之后的请求不再发往 openai
+        assert primary.estimate_execution.await_count == 3
+        assert backup.estimate_execution.await_count == 5
+        assert metrics.get_counter("ai_provider_calls", provider="openai",
+                                   operation="estimate_execution", result="rejected") == 2
+
+        # 冷却结束后放行一次试探，成功则恢复
+        resilient._members[0].breaker.opened_at -= 30
+        primary.estimate_execution.side_effect = None
+        primary.estimate_execution.return_value = ESTIMATION
+        await resilient.estimate_execution("/uploads/designs/a.png")
+        assert primary.estimate_execution.await_count == 4
+        assert resilient._members[0].breaker.state == "closed"
+
+    @pytest.mark.asyncio
+    async def test_all_open_raises_unavailable(self, monkeypatch):
+        monkeypatch.setattr(settings, "AI_CIRCUIT_FAILURE_THRESHOLD", 1)
+        monkeypatch.setattr(settings, "AI_RETRY_ATTEMPTS", "default:0")
+        primary = _provider(estimate_execution=AsyncMock(side_effect=ConnectionError("down")))
+        resilient = ResilientAIProvider([("openai", primary)])
+
+        with pytest.raises(ConnectionError):
+            await resilient.estimate_execution("/uploads/designs/a.png")
+        with pytest.raises(ProviderUnavailableError):
+            await resilient.estimate_execution("/uploads/designs/a.png")
+
+
+class TestHedging:
+
+    @pytest.mark.asyncio
+    async def test_slow_call_hedged_to_backup(self, monkeypatch):
+        monkeypatch.setattr(settings, "AI_HEDGE_OPERATIONS", "estimate_execution")
+        calls = {"n": 0}
+
+        async def primary_estimate(design_image):
+            calls["n"] += 1
+            if calls["n"] > 3:
+                await asyncio.sleep(1)
+            return ESTIMATION
+
+        primary = _provider(estimate_execution=primary_estimate)
+        backup = _provider(estimate_execution=AsyncMock(return_value={"estimated_duration": 45}))
+        resilient = ResilientAIProvider([("openai", primary), ("gemini", backup)])
+
+        # 样本不足时不对冲
+        for _ in range(3):
+            assert await resilient.estimate_execution("/uploads/designs/a.png") == ESTIMATION
+        backup.estimate_execution.assert_not_awaited()
+
+        result = await asyncio.wait_for(resilient.estimate_execution("/uploads/designs/a.png"), timeout=0.5)
+
+        assert result == {"estimated_duration": 45}
+        assert metrics.get_counter("ai_hedge", provider="gemini",
+                                   operation="estimate_execution", result="won") == 1
+
+
+class TestFactory:
+
+    @pytest.fixture(autouse=True)
+    def reset_factory(self, monkeypatch):
+        monkeypatch.setattr(settings, "AI_CACHE_ENABLED", False)
+        AIProviderFactory.reset()
+        yield
+        AIProviderFactory.reset()
+
+    @patch("app.services.ai.factory.GeminiProvider")
+    @patch("app.services.ai.factory.OpenAIProvider")
+    def test_wraps_primary_and_failover(self, mock_openai, mock_gemini, monkeypatch):
+        monkeypatch.setattr(settings, "AI_RESILIENCE_ENABLED", True)
+        monkeypatch.setattr(settings, "AI_FAILOVER_PROVIDERS", "openai, gemini, baidu")
+
+        provider = AIProviderFactory.get_provider("openai")
+
+        assert isinstance(provider, ResilientAIProvider)
+        assert provider.providers == [mock_openai.return_value, mock_gemini.return_value]
+
+    @patch("app.services.ai.factory.OpenAIProvider")
+    def test_disabled_by_default(self, mock_openai):
+        assert AIProviderFactory.get_provider("openai") is mock_openai.return_value